@@ -91,7 +91,9 @@ public class ExternalApiService {
             }
 
             M1Response mapped = new M1Response();
-            mapped.setModelVersion("lightgbm-1");
+            // model_version identifies the model that scored this request (changes when the API hot-reloads)
+            Object modelVersion = raw.get("model_version");
+            mapped.setModelVersion(modelVersion != null ? String.valueOf(modelVersion) : "lightgbm-1");
             mapped.setDecision(decision);
             mapped.setProbabilityApprove(probabilityApprove);
             mapped.setProbabilityReject(probabilityReject);
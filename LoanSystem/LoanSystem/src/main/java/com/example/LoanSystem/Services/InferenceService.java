@@ -72,6 +72,9 @@ public class InferenceService {
             if (m1Resp == null) {
                 throw new RuntimeException("Credit scoring API returned null");
             }
+            if (m1Resp.getModelVersion() != null) {
+                run.setModelVersion(m1Resp.getModelVersion());
+            }
 
             // 2.1) SAVE predictions
             PredictionEntity pred = new PredictionEntity();
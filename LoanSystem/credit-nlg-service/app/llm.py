@@ -1,5 +1,5 @@
 import os
-from typing import Dict, Any, List, Tuple
+from typing import Dict, Any, List, Optional, Tuple
 
 import torch
 from transformers import AutoTokenizer, AutoModelForCausalLM, BitsAndBytesConfig
@@ -63,7 +63,9 @@ def _format_profile(profile: Dict[str, Any]) -> str:
 def _topk_shap(shap: Dict[str, float], k: int) -> List[Tuple[str, float]]:
     return sorted(shap.items(), key=lambda x: abs(x[1]), reverse=True)[:max(1, k)]
 
-def build_prompt_vi(model_output: Dict[str, Any], profile_pretty: str, top_k: int) -> str:
+def build_prompt_vi(
+    model_output: Dict[str, Any], profile_pretty: str, top_k: int, advice: Optional[List[str]] = None
+) -> str:
     score = model_output.get("score")
     thr = model_output.get("threshold")
     approved = bool(model_output.get("approved"))
@@ -77,12 +79,14 @@ def build_prompt_vi(model_output: Dict[str, Any], profile_pretty: str, top_k: in
         name = FEATURE_VI.get(key, key)
         bullets.append(f"{name}: {val:+.4f}")
 
-    # Gợi ý rule-based ngắn để LLM tham chiếu
-    heuristics = []
-    if shap.get("person_income", 0.0) < 0:
-        heuristics.append("Xem xét tăng thu nhập thêm 20–30% so với hiện tại.")
-    if shap.get("loan_amnt", 0.0) < 0:
-        heuristics.append("Xem xét giảm số tiền vay xuống khoảng 70–80% so với hiện tại.")
+    # Gợi ý để LLM tham chiếu: thay đổi chính xác từ /counterfactual (advice_vi) nếu có,
+    # không thì chỉ gợi ý định tính (không đoán con số)
+    # (các thay đổi phải áp dụng cùng lúc)
+    heuristics = [f"{' và '.join(advice)} thì mô hình sẽ chấp thuận."] if advice else []
+    if not advice and shap.get("person_income", 0.0) < 0:
+        heuristics.append("Xem xét cải thiện thu nhập.")
+    if not advice and shap.get("loan_amnt", 0.0) < 0:
+        heuristics.append("Xem xét điều chỉnh số tiền vay.")
     if shap.get("cb_person_cred_hist_length", 0.0) > 0:
         heuristics.append("Lịch sử tín dụng ổn định là lợi thế.")
     if not heuristics:
@@ -120,9 +124,11 @@ Quyết định: …
 Lời khuyên: …
 """
 
-def generate_vi(model_output: Dict[str, Any], profile_raw: Dict[str, Any], top_k: int) -> str:
+def generate_vi(
+    model_output: Dict[str, Any], profile_raw: Dict[str, Any], top_k: int, advice: Optional[List[str]] = None
+) -> str:
     tok, model = load_llm()
-    prompt = build_prompt_vi(model_output, _format_profile(profile_raw), top_k)
+    prompt = build_prompt_vi(model_output, _format_profile(profile_raw), top_k, advice)
     inputs = tok(prompt, return_tensors="pt").to(model.device)
     with torch.no_grad():
         out = model.generate(
@@ -1,5 +1,9 @@
 import os
-from fastapi import FastAPI, HTTPException, Header
+from fastapi import FastAPI, HTTPException, Header, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
+from .codec import decode, encode, negotiate
 from .schemas import NarrativeRequest, NarrativeResponse
 from .llm import generate_vi
 import torch
@@ -18,20 +22,45 @@ def healthz():
     name = torch.cuda.get_device_name(0) if gpu else None
     return {"status": "ok", "gpu": gpu, "gpu_name": name}
 
-@app.post("/nlg", response_model=NarrativeResponse)
-def nlg(req: NarrativeRequest, x_api_key: str = Header(default=None, alias="X-API-KEY")):
+@app.post(
+    "/nlg",
+    response_model=NarrativeResponse,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {"schema": NarrativeRequest.model_json_schema()},
+                "application/x-msgpack": {"schema": {"type": "string", "format": "binary"}},
+            },
+        }
+    },
+)
+async def nlg(request: Request, x_api_key: str = Header(default=None, alias="X-API-KEY")):
     # Bảo vệ đơn giản bằng API key (tuỳ chọn)
     if REQUIRE_API_KEY and x_api_key != REQUIRE_API_KEY:
         raise HTTPException(401, "Unauthorized")
 
+    # Body JSON hoặc MessagePack (Content-Type: application/x-msgpack)
+    try:
+        req = NarrativeRequest.model_validate(decode(await request.body(), request.headers.get("content-type")))
+    except ValueError as e:
+        if isinstance(e, ValidationError):
+            raise RequestValidationError([{**err, "loc": ("body", *err["loc"])} for err in e.errors(include_url=False)])
+        raise HTTPException(422, f"Body không hợp lệ: {e}")
+
     try:
-        text = generate_vi(req.model_output.model_dump(), req.profile_raw, req.top_k)
+        text = await run_in_threadpool(generate_vi, req.model_output.model_dump(), req.profile_raw, req.top_k, req.advice_vi)
         decision_vi = "ĐƯỢC VAY" if req.model_output.approved else "TỪ CHỐI"
-        return NarrativeResponse(
-            decision_vi=decision_vi,
-            score=req.model_output.score,
-            threshold=req.model_output.threshold,
-            narrative_vi=text
-        )
+        result = {
+            "decision_vi": decision_vi,
+            "score": req.model_output.score,
+            "threshold": req.model_output.threshold,
+            "narrative_vi": text,
+        }
+        if req.model_output.model_version is not None:
+            result["model_version"] = req.model_output.model_version
     except Exception as e:
         raise HTTPException(500, f"Lỗi sinh văn bản: {e}")
+    # Response JSON (orjson) hoặc MessagePack theo header Accept
+    media_type = negotiate(request.headers.get("accept"))
+    return Response(encode(result, media_type), media_type=media_type, headers={"Vary": "Accept"})
@@ -1,4 +1,4 @@
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 from pydantic import BaseModel, Field
 
 class ModelOutput(BaseModel):
@@ -6,6 +6,8 @@ class ModelOutput(BaseModel):
     threshold: float
     approved: bool
     shap: Dict[str, float] = Field(..., description="SHAP theo feature từ model chấm điểm")
+    # Phiên bản model chấm điểm (PredictResponse.model_version), trả lại nguyên trong response
+    model_version: Optional[str] = None
 
 class NarrativeRequest(BaseModel):
     # Hồ sơ gốc (thân thiện) để in ra trong prompt
@@ -13,9 +15,12 @@ class NarrativeRequest(BaseModel):
     model_output: ModelOutput
     # Tuỳ chọn: lấy Top-K SHAP lớn nhất theo |giá trị|
     top_k: int = 8
+    # Tuỳ chọn: advice_vi từ POST /counterfactual của credit-scoring-api (thay đổi chính xác để được duyệt)
+    advice_vi: Optional[List[str]] = None
 
 class NarrativeResponse(BaseModel):
     decision_vi: str
     score: float
     threshold: float
     narrative_vi: str
+    model_version: Optional[str] = None
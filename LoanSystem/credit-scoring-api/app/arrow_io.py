@@ -0,0 +1,123 @@
+# app/arrow_io.py
+"""
+Đọc/ghi Arrow IPC stream cho /predict/batch (pyarrow là phụ thuộc tuỳ chọn).
+
+Input: một record batch stream có
+- 8 cột đặt tên theo FEATURE_ORDER: cột số không null được đọc thẳng bộ đệm Arrow
+  (không qua đối tượng Python); cột chuỗi/nhãn hoặc có null đi qua normalize_column;
+- hoặc một cột "features" kiểu fixed_size_list<double>[8]: bộ đệm được dùng trực tiếp
+  làm ma trận (n, 8) không sao chép.
+Output: các cột index, score, approved, decision_en, error, shap_<feature>, shap_bias;
+threshold và model_version nằm trong metadata của schema.
+"""
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .utils import normalize_column
+
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+
+class ArrowUnavailable(RuntimeError):
+    pass
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc  # noqa: F401
+    except ImportError as e:
+        raise ArrowUnavailable(f"Cần cài pyarrow để dùng Arrow IPC ({e})")
+    return pyarrow
+
+def is_available() -> bool:
+    try:
+        _import_pyarrow()
+    except ArrowUnavailable:
+        return False
+    return True
+
+def is_arrow(content_type: Optional[str]) -> bool:
+    return bool(content_type) and content_type.split(";")[0].strip().lower() == ARROW_STREAM
+
+def read_features(body: bytes, feature_order: Sequence[str]) -> Tuple[np.ndarray, np.ndarray, Dict[int, str]]:
+    """
+    Arrow IPC stream -> (ma trận float64 (n, n_features), mask dòng lỗi, thông báo lỗi theo dòng).
+    Cấu trúc sai (thiếu cột, sai kiểu) ném ValueError.
+    """
+    pa = _import_pyarrow()
+    try:
+        table = pa.ipc.open_stream(pa.py_buffer(body)).read_all()
+    except pa.ArrowInvalid as e:
+        raise ValueError(f"Arrow IPC stream không hợp lệ: {e}")
+    n_features = len(feature_order)
+
+    if "features" in table.column_names:
+        col = table.column("features").combine_chunks()
+        if not pa.types.is_fixed_size_list(col.type) or col.type.list_size != n_features:
+            raise ValueError(f"Cột features phải là fixed_size_list<double>[{n_features}], nhận được {col.type}")
+        if col.null_count:
+            raise ValueError("Cột features không được có null")
+        values = col.flatten()
+        if values.type != pa.float64():
+            values = values.cast(pa.float64())
+        x = values.to_numpy(zero_copy_only=values.null_count == 0).reshape(len(col), n_features)
+        return x, np.zeros(len(x), dtype=bool), {}
+
+    missing = [f for f in feature_order if f not in table.column_names]
+    if missing:
+        raise ValueError(f"Thiếu cột: {', '.join(missing)}")
+    x = np.empty((table.num_rows, n_features), dtype=np.float64)
+    bad = np.zeros(table.num_rows, dtype=bool)
+    errors: Dict[int, str] = {}
+    for j, f in enumerate(feature_order):
+        col = table.column(f).combine_chunks()
+        if (pa.types.is_integer(col.type) or pa.types.is_floating(col.type)) and col.null_count == 0:
+            values: Any = col.to_numpy(zero_copy_only=pa.types.is_floating(col.type))
+        else:
+            values = col.to_pylist()
+        normalized = normalize_column(f, values)
+        x[:, j] = normalized.values
+        bad |= normalized.error_mask
+        for i, msg in normalized.errors.items():
+            errors[i] = f"{errors[i]}; {msg}" if i in errors else msg
+    return x, bad, errors
+
+def write_results(
+    scores: np.ndarray,
+    errors: List[Optional[str]],
+    threshold: float,
+    model_version: str,
+    feature_order: Sequence[str],
+    shap_values: Optional[np.ndarray] = None,
+    shap_bias: Optional[float] = None,
+    explain_status: Optional[str] = None,
+) -> bytes:
+    """
+    Kết quả dạng cột -> Arrow IPC stream. scores/shap_values có NaN ở dòng lỗi
+    (ghi ra null); shap_values có thể chứa NaN ở các ô bị bỏ (explain=topk).
+    """
+    pa = _import_pyarrow()
+    ok = np.array([e is None for e in errors], dtype=bool)
+    null = ~ok
+    approved = scores < threshold
+    columns = {
+        "index": pa.array(np.arange(len(scores), dtype=np.int32)),
+        "score": pa.array(scores, mask=null),
+        "approved": pa.array(approved, mask=null),
+        "decision_en": pa.array(np.where(approved, "APPROVED", "REJECTED"), mask=null, type=pa.string()),
+        "error": pa.array(errors, type=pa.string()),
+    }
+    if shap_values is not None:
+        for j, f in enumerate(feature_order):
+            col = shap_values[:, j]
+            columns[f"shap_{f}"] = pa.array(col, mask=null | np.isnan(col))
+        columns["shap_bias"] = pa.array(np.full(len(scores), np.nan if shap_bias is None else shap_bias), mask=null)
+    metadata = {"threshold": repr(float(threshold)), "model_version": model_version}
+    if explain_status is not None:
+        # Cần SHAP nhưng explainer chưa sẵn sàng: không có cột shap_*
+        metadata["explain_status"] = explain_status
+    table = pa.table(columns).replace_schema_metadata(metadata)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
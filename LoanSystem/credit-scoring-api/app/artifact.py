@@ -0,0 +1,156 @@
+# app/artifact.py
+"""
+Artifact nhị phân đã biên dịch từ lightgbm_model.txt để khởi động nhanh.
+
+Chứa các mảng cây đã trải phẳng (TreeEnsemble), bảng TreeSHAP tính sẵn và
+expected_value. Khi khởi động API chỉ cần memory-map file này thay vì parse file
+text và duyệt lại toàn bộ cây.
+
+Định dạng (little-endian):
+    MAGIC (8 byte) | format version (uint32) | độ dài header (uint32) | header JSON
+    | các mảng, mỗi mảng bắt đầu ở offset căn ALIGNMENT byte
+Tên file chứa sha256 của file model nguồn, nên model đổi sẽ tự biên dịch lại.
+
+    python -m app.artifact --model models/lightgbm_model.txt
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple, Union
+
+import numpy as np
+
+from .engine import TreeEnsemble
+from .files import atomic_write, derived_path, file_sha256
+from .treeshap import TreeShapExplainer
+
+MAGIC = b"CSAMODEL"
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+_PREFIX = struct.Struct("<8sII")
+
+@dataclass
+class CompiledModel:
+    engine: TreeEnsemble
+    explainer: TreeShapExplainer
+    source_sha256: str
+    # None khi không ghi được artifact (vd. thư mục chỉ đọc) và model được dựng trong bộ nhớ
+    artifact_path: Optional[str]
+    built: bool
+
+def artifact_path_for(model_path: Union[str, Path], sha256: str, artifact_dir: Optional[Union[str, Path]] = None) -> Path:
+    return derived_path(model_path, sha256, f"v{FORMAT_VERSION}.bin", artifact_dir)
+
+def write_artifact(path: Union[str, Path], engine: TreeEnsemble, explainer: TreeShapExplainer, source_sha256: str) -> None:
+    """Ghi artifact (ghi ra file tạm rồi đổi tên, nên không bao giờ để lại file dở)."""
+    ensemble_meta, ensemble_arrays = engine.state()
+    shap_meta, shap_arrays = explainer.state()
+    arrays = {f"ensemble.{k}": np.ascontiguousarray(v) for k, v in ensemble_arrays.items()}
+    arrays.update({f"shap.{k}": np.ascontiguousarray(v) for k, v in shap_arrays.items()})
+
+    layout: Dict[str, Dict[str, Any]] = {}
+    offset = 0
+    for name, arr in arrays.items():
+        offset = -(-offset // ALIGNMENT) * ALIGNMENT
+        layout[name] = {"dtype": arr.dtype.str, "shape": list(arr.shape), "offset": offset}
+        offset += arr.nbytes
+    header = json.dumps(
+        {
+            "source_sha256": source_sha256,
+            "ensemble": ensemble_meta,
+            "shap": shap_meta,
+            "arrays": layout,
+        },
+        ensure_ascii=False,
+    ).encode("utf-8")
+    data_start = -(-(_PREFIX.size + len(header)) // ALIGNMENT) * ALIGNMENT
+
+    def write(f) -> None:
+        f.write(_PREFIX.pack(MAGIC, FORMAT_VERSION, len(header)))
+        f.write(header)
+        for name, arr in arrays.items():
+            f.seek(data_start + layout[name]["offset"])
+            f.write(arr.tobytes())
+
+    atomic_write(path, write)
+
+def read_artifact(path: Union[str, Path], expected_sha256: Optional[str] = None) -> Tuple[TreeEnsemble, TreeShapExplainer]:
+    """Memory-map artifact; các mảng là view chỉ đọc trên file (dùng chung page cache giữa các process)."""
+    with open(path, "rb") as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, header_len = _PREFIX.unpack_from(buf, 0)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise ValueError(f"Artifact không hợp lệ hoặc khác phiên bản: {path}")
+    header = json.loads(bytes(buf[_PREFIX.size:_PREFIX.size + header_len]).decode("utf-8"))
+    if expected_sha256 is not None and header["source_sha256"] != expected_sha256:
+        raise ValueError(f"Artifact {path} không khớp checksum model")
+    data_start = -(-(_PREFIX.size + header_len) // ALIGNMENT) * ALIGNMENT
+
+    arrays: Dict[str, Dict[str, np.ndarray]] = {"ensemble": {}, "shap": {}}
+    for name, spec in header["arrays"].items():
+        group, key = name.split(".", 1)
+        dtype = np.dtype(spec["dtype"])
+        count = int(np.prod(spec["shape"], dtype=np.int64))
+        arr = np.frombuffer(buf, dtype=dtype, count=count, offset=data_start + spec["offset"])
+        arrays[group][key] = arr.reshape(spec["shape"])
+
+    engine = TreeEnsemble.from_state(header["ensemble"], arrays["ensemble"])
+    explainer = TreeShapExplainer.from_state(engine, header["shap"], arrays["shap"])
+    return engine, explainer
+
+def load_existing(model_path: Union[str, Path], artifact_dir: Optional[Union[str, Path]] = None) -> Optional[CompiledModel]:
+    """Chỉ memory-map artifact đã có cho checksum hiện tại; None nếu chưa có hoặc hỏng."""
+    sha256 = file_sha256(model_path)
+    path = artifact_path_for(model_path, sha256, artifact_dir)
+    if not path.is_file():
+        return None
+    try:
+        engine, explainer = read_artifact(path, sha256)
+    except Exception:
+        return None
+    return CompiledModel(engine, explainer, sha256, str(path), built=False)
+
+def load_compiled(model_path: Union[str, Path], artifact_dir: Optional[Union[str, Path]] = None, force: bool = False) -> CompiledModel:
+    """
+    Nạp model qua artifact ứng với checksum hiện tại của file model; chưa có (hoặc
+    hỏng) thì biên dịch và ghi lại. Không ghi được thì dùng bản dựng trong bộ nhớ.
+    """
+    if not force:
+        compiled = load_existing(model_path, artifact_dir)
+        if compiled is not None:
+            return compiled
+
+    sha256 = file_sha256(model_path)
+    path = artifact_path_for(model_path, sha256, artifact_dir)
+    engine = TreeEnsemble.from_model_file(model_path)
+    explainer = TreeShapExplainer(engine)
+    try:
+        write_artifact(path, engine, explainer, sha256)
+        engine, explainer = read_artifact(path, sha256)
+    except OSError:
+        return CompiledModel(engine, explainer, sha256, None, built=True)
+    return CompiledModel(engine, explainer, sha256, str(path), built=True)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Biên dịch lightgbm_model.txt thành artifact nhị phân")
+    parser.add_argument("--model", default=None, help="Mặc định: như API (MODEL_PATH hoặc models/lightgbm_model.txt)")
+    parser.add_argument("--out-dir", default=None, help="Mặc định: MODEL_ARTIFACT_DIR hoặc thư mục của model")
+    parser.add_argument("--force", action="store_true", help="Biên dịch lại dù artifact đã tồn tại")
+    args = parser.parse_args()
+
+    from .utils import get_artifact_dir, resolve_model_path
+
+    model = args.model or resolve_model_path()
+    compiled = load_compiled(model, args.out_dir or get_artifact_dir(), force=args.force)
+    if compiled.artifact_path is None:
+        raise SystemExit("Không ghi được artifact")
+    size = os.path.getsize(compiled.artifact_path)
+    status = "đã biên dịch" if compiled.built else "đã có sẵn"
+    print(f"{compiled.artifact_path} ({size / 1024:.0f} KB, {status}, sha256={compiled.source_sha256[:16]})")
+
+if __name__ == "__main__":
+    main()
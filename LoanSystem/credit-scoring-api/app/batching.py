@@ -0,0 +1,118 @@
+# app/batching.py
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+# Hệ số làm mượt cho trung bình trượt khoảng cách giữa các request
+_GAP_EWMA_ALPHA = 0.2
+
+class MicroBatcher:
+    """
+    Gom các request /predict đồng thời thành một ma trận để chấm điểm một lần.
+
+    Một đợt được xả khi đủ max_size dòng hoặc hết "cửa sổ" chờ. Cửa sổ thích ứng
+    theo tốc độ request tới (trung bình trượt khoảng cách giữa hai request):
+    - tải thấp (khoảng cách >= max_wait): không chờ, xả ngay ở vòng lặp kế tiếp
+      nên độ trễ gần như không đổi;
+    - tải cao: chờ đủ lâu để gom khoảng max_size dòng, tối đa max_wait.
+
+    run_batch(x, with_shap, context) -> (scores, shap (n, n_features) | None, expected_value | None, extra);
+    context (vd. phiên bản model) do request truyền vào, chỉ các dòng cùng context mới chung một ma trận;
+    extra (vd. thời gian từng bước của đợt) được trả nguyên cho mọi request trong đợt.
+    """
+
+    def __init__(
+        self,
+        run_batch: Callable[[np.ndarray, bool, Any], Awaitable[Tuple[np.ndarray, Optional[np.ndarray], Optional[float], Any]]],
+        max_size: int = 32,
+        max_wait_s: float = 0.002,
+    ):
+        self._run_batch = run_batch
+        self.max_size = max(1, int(max_size))
+        self.max_wait_s = max(0.0, float(max_wait_s))
+        self._pending: List[Tuple[np.ndarray, bool, Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._last_arrival: Optional[float] = None
+        self.arrival_gap_s: Optional[float] = None
+        self.last_window_s = 0.0
+        self.batches = 0
+        self.requests = 0
+        self.max_batch_seen = 0
+
+    def window(self) -> float:
+        """Thời gian chờ gom batch cho đợt kế tiếp (giây)."""
+        gap = self.arrival_gap_s
+        if gap is None or gap >= self.max_wait_s:
+            return 0.0
+        return min(self.max_wait_s, gap * (self.max_size - 1))
+
+    async def submit(
+        self, row: np.ndarray, with_shap: bool, context: Any = None
+    ) -> Tuple[float, Optional[np.ndarray], Optional[float], Any]:
+        """Gửi một dòng (đã theo FEATURE_ORDER); trả về (score, shap_row | None, expected_value | None, extra)."""
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        if self._last_arrival is not None:
+            gap = now - self._last_arrival
+            self.arrival_gap_s = gap if self.arrival_gap_s is None else (
+                _GAP_EWMA_ALPHA * gap + (1 - _GAP_EWMA_ALPHA) * self.arrival_gap_s
+            )
+        self._last_arrival = now
+
+        future = loop.create_future()
+        self._pending.append((row, with_shap, context, future))
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self.last_window_s = self.window()
+            self._timer = loop.call_later(self.last_window_s, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        self.batches += 1
+        self.requests += len(batch)
+        self.max_batch_seen = max(self.max_batch_seen, len(batch))
+        task = asyncio.get_running_loop().create_task(self._score(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _score(self, batch: List[Tuple[np.ndarray, bool, Any, asyncio.Future]]) -> None:
+        # Dòng cần SHAP và dòng chỉ cần quyết định được chấm riêng để không tính SHAP thừa
+        groups: Dict[Tuple[bool, int], Tuple[Any, List[Tuple[np.ndarray, asyncio.Future]]]] = {}
+        for row, with_shap, context, future in batch:
+            groups.setdefault((with_shap, id(context)), (context, []))[1].append((row, future))
+        for (with_shap, _), (context, group) in groups.items():
+            try:
+                scores, shap_values, expected_value, extra = await self._run_batch(
+                    np.vstack([row for row, _ in group]), with_shap, context
+                )
+            except Exception as e:
+                for _, future in group:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for i, (_, future) in enumerate(group):
+                if not future.done():
+                    shap_row = shap_values[i] if shap_values is not None else None
+                    future.set_result((float(scores[i]), shap_row, expected_value, extra))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_size": self.max_size,
+            "max_wait_ms": self.max_wait_s * 1e3,
+            "batches": self.batches,
+            "requests": self.requests,
+            "avg_batch_size": (self.requests / self.batches) if self.batches else 0.0,
+            "max_batch_size": self.max_batch_seen,
+            "pending": len(self._pending),
+            "last_window_ms": self.last_window_s * 1e3,
+            "arrival_gap_ms": None if self.arrival_gap_s is None else self.arrival_gap_s * 1e3,
+        }
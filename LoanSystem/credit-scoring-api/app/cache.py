@@ -0,0 +1,63 @@
+# app/cache.py
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+class LRUCache:
+    """
+    Cache LRU có giới hạn số phần tử, an toàn đa luồng, kèm bộ đếm hit/miss/eviction.
+    maxsize <= 0 nghĩa là tắt cache (get luôn miss, put không lưu).
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = max(0, int(maxsize))
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0
+
+    def get(self, key: Hashable, usable: Optional[Callable[[Any], bool]] = None) -> Optional[Any]:
+        """
+        Giá trị của key hoặc None. usable: phần tử có nhưng usable(value) sai (vd. thiếu SHAP mà request cần)
+        thì trả None và tính là miss, để hit_rate chỉ đếm lần thực sự dùng được cache.
+        """
+        with self._lock:
+            value = self._data.get(key)
+            if value is None or (usable is not None and not usable(value)):
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / total) if total else 0.0,
+            }
@@ -0,0 +1,103 @@
+# app/codec.py
+"""
+Mã hoá request/response nhanh.
+
+- JSON: ghi bằng orjson (phụ thuộc bắt buộc), đọc bằng json chuẩn.
+- MessagePack: khi header Accept / Content-Type yêu cầu (cần thư viện msgpack).
+- Nén gzip hoặc zstd (cần zstandard) theo Accept-Encoding cho response lớn.
+
+credit-nlg-service/app/codec.py là bản sao giống hệt file này (mỗi service build từ Docker
+context riêng nên không import chéo được); tests/test_codec.py kiểm tra hai bản không lệch nhau.
+"""
+import gzip
+import json
+from typing import Any, List, Optional, Tuple
+
+import orjson
+
+JSON = "application/json"
+MSGPACK = "application/x-msgpack"
+_MSGPACK_TYPES = ("application/x-msgpack", "application/msgpack", "application/vnd.msgpack")
+
+def _import_msgpack():
+    try:
+        import msgpack
+    except ImportError:
+        return None
+    return msgpack
+
+def _import_zstd():
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+def dumps_json(obj: Any) -> bytes:
+    return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+
+def loads_json(data: bytes) -> Any:
+    """Dùng json chuẩn để thông báo lỗi (vị trí, nội dung) giữ nguyên như FastAPI."""
+    return json.loads(data)
+
+def _media_types(header: Optional[str]) -> List[Tuple[str, float]]:
+    """'a/b;q=0.5, c/d' -> [('a/b', 0.5), ('c/d', 1.0)]"""
+    out = []
+    for part in (header or "").split(","):
+        media_type, *params = [p.strip() for p in part.split(";")]
+        if not media_type:
+            continue
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        out.append((media_type.lower(), q))
+    return out
+
+def is_msgpack(content_type: Optional[str]) -> bool:
+    return bool(content_type) and content_type.split(";")[0].strip().lower() in _MSGPACK_TYPES
+
+def negotiate(accept: Optional[str]) -> str:
+    """MessagePack nếu Accept ưu tiên nó (q cao hơn JSON) và có thư viện msgpack; còn lại JSON."""
+    best_json = best_msgpack = -1.0
+    for media_type, q in _media_types(accept):
+        if media_type in _MSGPACK_TYPES:
+            best_msgpack = max(best_msgpack, q)
+        elif media_type in (JSON, "application/*", "*/*"):
+            best_json = max(best_json, q)
+    if best_msgpack > 0 and best_msgpack >= best_json and _import_msgpack() is not None:
+        return MSGPACK
+    return JSON
+
+def encode(obj: Any, media_type: str) -> bytes:
+    if media_type == MSGPACK:
+        return _import_msgpack().packb(obj, use_bin_type=True)
+    return dumps_json(obj)
+
+def decode(data: bytes, content_type: Optional[str]) -> Any:
+    """Body MessagePack (theo Content-Type) hoặc JSON; lỗi ném ValueError."""
+    if is_msgpack(content_type):
+        msgpack = _import_msgpack()
+        if msgpack is None:
+            raise ValueError("Cần cài msgpack để nhận body MessagePack")
+        try:
+            return msgpack.unpackb(data, raw=False)
+        except Exception as e:
+            raise ValueError(f"MessagePack không hợp lệ: {e or type(e).__name__}")
+    return loads_json(data)
+
+def compress(body: bytes, accept_encoding: Optional[str], min_bytes: int) -> Tuple[bytes, Optional[str]]:
+    """Nén body theo Accept-Encoding (ưu tiên zstd rồi gzip); body nhỏ hơn min_bytes (hoặc min_bytes=0) giữ nguyên."""
+    if min_bytes <= 0 or len(body) < min_bytes:
+        return body, None
+    accepted = {media_type for media_type, q in _media_types(accept_encoding) if q > 0}
+    if "zstd" in accepted:
+        zstandard = _import_zstd()
+        if zstandard is not None:
+            return zstandard.ZstdCompressor(level=3).compress(body), "zstd"
+    if "gzip" in accepted:
+        return gzip.compress(body, compresslevel=5), "gzip"
+    return body, None
@@ -0,0 +1,163 @@
+# app/codegen.py
+"""
+Sinh module Python "thẳng" (straight-line) từ ensemble cây: mỗi cây là các if/else lồng nhau
+trên biến cục bộ, margin cộng dồn theo thứ tự cây rồi qua sigmoid bằng math.exp, nên kết quả
+trùng từng bit với TreeEnsemble / Booster.predict.
+
+Với một hồ sơ, chi phí dispatch của numpy (vài ufunc cho mỗi tầng) lớn hơn nhiều so với bản
+thân việc duyệt ~100 đường đi trong cây, nên bản sinh sẵn nhanh hơn hẳn cho batch nhỏ.
+File sinh ra được cache cạnh model (hoặc MODEL_ARTIFACT_DIR) theo checksum, Python tự cache
+bytecode (__pycache__) cho các lần khởi động sau.
+
+    python -m app.codegen --model models/lightgbm_model.txt
+"""
+import argparse
+import importlib.util
+import math
+import types
+from pathlib import Path
+from typing import List, Optional, Union
+
+from .engine import K_ZERO_THRESHOLD, TreeEnsemble, _MISSING_NAN, _MISSING_ZERO
+from .files import atomic_write, derived_path, file_sha256
+
+# Tăng khi đổi dạng code sinh ra (file cũ tự bị bỏ qua vì tên file khác)
+CODEGEN_VERSION = 1
+
+def _literal(value: float) -> str:
+    """Hằng số float trong source, repr giữ nguyên từng bit."""
+    value = float(value)
+    if math.isfinite(value):
+        return repr(value)
+    return f'float("{value}")'
+
+class _Writer:
+    def __init__(self):
+        self.lines: List[str] = []
+
+    def emit(self, depth: int, line: str) -> None:
+        self.lines.append("    " * depth + line)
+
+def _condition(engine: TreeEnsemble, node: int) -> str:
+    """Biểu thức rẽ trái của node, giống NumericalDecision của LightGBM (xem TreeEnsemble._go_left)."""
+    f = int(engine.split_feature[node])
+    thr = _literal(engine.threshold[node])
+    if not engine.has_missing_rules:
+        return f"f{f} <= {thr}"
+    missing = int(engine.missing_type[node])
+    default_left = bool(engine.default_left[node])
+    if missing == _MISSING_NAN:
+        return f"(f{f} != f{f} or f{f} <= {thr})" if default_left else f"f{f} <= {thr}"
+    # NaN được coi là 0 (z{f}); missing Zero: |x| <= kZeroThreshold đi theo hướng mặc định
+    if missing == _MISSING_ZERO:
+        k = _literal(K_ZERO_THRESHOLD)
+        if default_left:
+            return f"(-{k} <= z{f} <= {k} or z{f} <= {thr})"
+        return f"(not -{k} <= z{f} <= {k} and z{f} <= {thr})"
+    return f"z{f} <= {thr}"
+
+def _emit_subtree(engine: TreeEnsemble, out: _Writer, child: int, depth: int) -> None:
+    """child theo mã hoá của TreeEnsemble (âm = ~chỉ số lá)."""
+    if child < 0:
+        out.emit(depth, f"m += {_literal(engine.leaf_value[~child])}")
+        return
+    out.emit(depth, f"if {_condition(engine, child)}:")
+    _emit_subtree(engine, out, int(engine.left_child[child]), depth + 1)
+    out.emit(depth, "else:")
+    _emit_subtree(engine, out, int(engine.right_child[child]), depth + 1)
+
+def generate_source(engine: TreeEnsemble, source_sha256: str) -> str:
+    """Source của module scorer: predict_margin(x), predict_proba(x), predict_proba_rows(rows)."""
+    n = engine.num_features
+    names = ", ".join(f"f{j}" for j in range(n))
+    out = _Writer()
+    out.emit(0, "# Sinh tự động bởi app/codegen.py từ lightgbm_model.txt, không sửa tay.")
+    out.emit(0, "import math")
+    out.emit(0, "")
+    out.emit(0, f"SOURCE_SHA256 = {source_sha256!r}")
+    out.emit(0, f"CODEGEN_VERSION = {CODEGEN_VERSION}")
+    out.emit(0, f"FEATURE_NAMES = {tuple(engine.feature_names)!r}")
+    out.emit(0, f"NUM_TREES = {engine.num_trees}")
+    out.emit(0, f"SIGMOID = {_literal(engine.sigmoid)}")
+    out.emit(0, "")
+    out.emit(0, "def predict_margin(x):")
+    out.emit(1, f'"""x: {n} số float theo FEATURE_NAMES (list/tuple). Cộng lá theo thứ tự cây như LightGBM."""')
+    out.emit(1, f"{names}{',' if n == 1 else ''} = x")
+    for j in range(n):
+        if engine.has_missing_rules:
+            out.emit(1, f"z{j} = 0.0 if f{j} != f{j} else f{j}")
+        else:
+            # Không có luật missing: NaN được coi như 0 (giống TreeEnsemble.prepare)
+            out.emit(1, f"if f{j} != f{j}:")
+            out.emit(2, f"f{j} = 0.0")
+    out.emit(1, "m = 0.0")
+    for t, root in enumerate(engine.tree_root.tolist()):
+        out.emit(1, f"# Tree={t}")
+        _emit_subtree(engine, out, int(root), 1)
+    out.emit(1, "return m")
+    out.emit(0, "")
+    out.emit(0, "def predict_proba(x, _exp=math.exp):")
+    out.emit(1, "return 1.0 / (1.0 + _exp(-SIGMOID * predict_margin(x)))")
+    out.emit(0, "")
+    out.emit(0, "def predict_proba_rows(rows):")
+    out.emit(1, "return [predict_proba(row) for row in rows]")
+    return "\n".join(out.lines) + "\n"
+
+def scorer_path_for(model_path: Union[str, Path], sha256: str, artifact_dir: Optional[Union[str, Path]] = None) -> Path:
+    return derived_path(model_path, sha256, f"scorer{CODEGEN_VERSION}.py", artifact_dir)
+
+def _import_file(path: Path, sha256: str) -> types.ModuleType:
+    spec = importlib.util.spec_from_file_location(f"credit_scorer_{sha256[:16]}", str(path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def _from_source(source: str, sha256: str) -> types.ModuleType:
+    module = types.ModuleType(f"credit_scorer_{sha256[:16]}")
+    exec(compile(source, f"<scorer {sha256[:16]}>", "exec"), module.__dict__)
+    return module
+
+def load_scorer(
+    model_path: Union[str, Path],
+    sha256: str,
+    engine: TreeEnsemble,
+    artifact_dir: Optional[Union[str, Path]] = None,
+) -> types.ModuleType:
+    """
+    Import scorer đã sinh cho checksum này; chưa có (hoặc hỏng, khác checksum) thì sinh và ghi lại
+    (file tạm rồi đổi tên). Không ghi được thì biên dịch thẳng trong bộ nhớ.
+    """
+    path = scorer_path_for(model_path, sha256, artifact_dir)
+    if path.is_file():
+        try:
+            module = _import_file(path, sha256)
+            if getattr(module, "SOURCE_SHA256", None) == sha256:
+                return module
+        except Exception:
+            pass
+
+    source = generate_source(engine, sha256)
+    try:
+        atomic_write(path, lambda f: f.write(source), binary=False)
+        return _import_file(path, sha256)
+    except OSError:
+        return _from_source(source, sha256)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Sinh scorer Python thẳng từ lightgbm_model.txt")
+    parser.add_argument("--model", default=None, help="Mặc định: như API (MODEL_PATH hoặc models/lightgbm_model.txt)")
+    parser.add_argument("--out-dir", default=None, help="Mặc định: MODEL_ARTIFACT_DIR hoặc thư mục của model")
+    args = parser.parse_args()
+
+    from .utils import get_artifact_dir, resolve_model_path
+
+    model = args.model or resolve_model_path()
+    sha256 = file_sha256(model)
+    out_dir = args.out_dir or get_artifact_dir()
+    module = load_scorer(model, sha256, TreeEnsemble.from_model_file(model), out_dir)
+    path = scorer_path_for(model, sha256, out_dir)
+    where = str(path) if path.is_file() else "trong bộ nhớ (không ghi được file)"
+    print(f"{where} ({module.NUM_TREES} cây, sha256={sha256[:16]})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+# app/counterfactual.py
+"""
+Tìm thay đổi nhỏ nhất trên các feature có thể hành động (khoản vay, thu nhập, số năm làm việc)
+để hồ sơ bị từ chối được duyệt.
+
+Model chỉ "nhìn" mỗi feature qua các ngưỡng tách: trong một bin giữa hai ngưỡng liên tiếp,
+score không đổi. Vì vậy chỉ cần thử một giá trị mỗi bin, là điểm gần giá trị hiện tại nhất
+(ưu tiên số nguyên), và kết quả là chính xác trên tập đó chứ không phải đoán phần trăm.
+
+Mặc định chỉ đi theo hướng hành động được (MONOTONE_DIRECTIONS): giảm khoản vay, tăng thu nhập,
+tăng số năm làm việc. Không có thay đổi như vậy thì found=False.
+
+Chi phí của một thay đổi = Σ |Δ_f| / max(|x_f|, 1), tức tổng mức thay đổi tương đối.
+
+Lõi `find` chỉ cần numpy và một hàm predict(rows): API dùng TreeEnsemble.rescore (`search`),
+demo Streamlit (app_python/model_loader.py) nạp chính file này và dùng Booster.predict.
+"""
+import itertools
+import math
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+if TYPE_CHECKING:  # pragma: no cover - chỉ cho type hint, để file nạp được độc lập
+    from .engine import TreeEnsemble
+
+ACTIONABLE_FEATURES = ("loan_amnt", "person_income", "person_emp_length")
+# Hướng hành động được: giảm khoản vay, tăng thu nhập, thêm năm làm việc
+MONOTONE_DIRECTIONS = {"loan_amnt": -1, "person_income": 1, "person_emp_length": 1}
+# Số ứng viên chấm mỗi lượt; dừng ở lượt đầu tiên có ứng viên đổi được quyết định
+CANDIDATE_BLOCK = 1024
+
+ADVICE_LABELS_VI = {
+    "loan_amnt": "số tiền vay",
+    "person_income": "thu nhập",
+    "person_emp_length": "số năm làm việc",
+}
+
+def relative_cost(delta: np.ndarray, value: float) -> np.ndarray:
+    return np.abs(delta) / max(abs(value), 1.0)
+
+def candidate_values(thresholds: np.ndarray, value: float, direction: int = 0) -> np.ndarray:
+    """
+    Một giá trị cho mỗi bin ngưỡng khác bin của value, theo hướng cho phép (-1 giảm, 1 tăng, 0 cả hai),
+    là điểm gần value nhất trong bin (số nguyên nếu còn nằm trong bin). Không trả giá trị âm.
+    Bin i là (thresholds[i-1], thresholds[i]], hai đầu mở rộng tới ±inf.
+    """
+    edges = np.concatenate([[-np.inf], thresholds, [np.inf]])
+    current = int(np.searchsorted(thresholds, value, side="left"))
+    out = []
+    if direction <= 0 and current > 0:
+        # Bin thấp hơn: điểm lớn nhất của bin là cận trên thresholds[i]
+        hi, lo = edges[1:current + 1], edges[:current]
+        v = np.floor(hi)
+        out.append(np.where(v > lo, v, hi))
+    if direction >= 0 and current < len(thresholds):
+        # Bin cao hơn: điểm nhỏ nhất lớn hơn cận dưới thresholds[i-1]
+        lo, hi = edges[current + 1:-1], edges[current + 2:]
+        v = np.floor(lo) + 1.0
+        out.append(np.where(v <= hi, v, np.nextafter(lo, np.inf)))
+    values = np.concatenate(out) if out else np.empty(0)
+    return values[values >= 0]
+
+def find(
+    predict: Callable[[np.ndarray], np.ndarray],
+    accept: Callable[[np.ndarray], np.ndarray],
+    x: np.ndarray,
+    feature_names: Sequence[str],
+    feature_thresholds: Sequence[np.ndarray],
+    features: Sequence[str] = ACTIONABLE_FEATURES,
+    max_features: int = 2,
+    monotone: bool = True,
+    max_candidates: int = 50000,
+) -> Dict[str, Any]:
+    """
+    predict(rows) -> điểm của từng dòng (n, n_features); accept(điểm) -> mask dòng được duyệt.
+    feature_thresholds[j]: các ngưỡng tách đã sắp xếp của feature thứ j.
+
+    Chấm mọi thay đổi một feature trong một lô, rồi các tổ hợp tới max_features feature rẻ hơn nghiệm
+    một feature tốt nhất, theo thứ tự chi phí, từng khối CANDIDATE_BLOCK. Trả về dict gồm found,
+    changes (feature -> giá trị mới), cost, score, single_feature (nghiệm tốt nhất của từng feature,
+    None nếu không có), candidates_evaluated và exhaustive (False khi phải cắt bớt vì max_candidates).
+    """
+    x = np.asarray(x, dtype=np.float64).reshape(-1)
+    index = {name: j for j, name in enumerate(feature_names)}
+    cols = [index[f] for f in features]
+    values: List[np.ndarray] = []
+    costs: List[np.ndarray] = []
+    for f, j in zip(features, cols):
+        v = candidate_values(feature_thresholds[j], x[j], MONOTONE_DIRECTIONS.get(f, 0) if monotone else 0)
+        c = relative_cost(v - x[j], x[j])
+        order = np.argsort(c, kind="stable")
+        values.append(v[order])
+        costs.append(c[order])
+
+    # 1) Từng feature riêng: mọi bin trong một lô
+    sizes = [len(v) for v in values]
+    owner = np.repeat(np.arange(len(cols)), sizes)
+    X = np.repeat(x[None, :], len(owner), axis=0)
+    for k, j in enumerate(cols):
+        X[owner == k, j] = values[k]
+    scores = predict(X) if len(X) else np.empty(0)
+    accepted = np.asarray(accept(scores), dtype=bool) if len(X) else np.zeros(0, dtype=bool)
+    evaluated = len(X)
+    single: Dict[str, Optional[Dict[str, float]]] = {}
+    best: Optional[Dict[str, Any]] = None
+    offset = 0
+    for k, f in enumerate(features):
+        hit = np.flatnonzero(accepted[offset:offset + sizes[k]])
+        single[f] = None
+        if len(hit):
+            i = int(hit[0])
+            score = float(scores[offset + i])
+            single[f] = {"value": float(values[k][i]), "cost": float(costs[k][i]), "score": score}
+            if best is None or costs[k][i] < best["cost"]:
+                best = {"changes": {f: float(values[k][i])}, "cost": float(costs[k][i]), "score": score}
+        offset += sizes[k]
+
+    # 2) Tổ hợp nhiều feature: chỉ những lựa chọn rẻ hơn nghiệm tốt nhất hiện có
+    bound = best["cost"] if best is not None else math.inf
+    combos = []
+    for size in range(2, min(max_features, len(features)) + 1):
+        for subset in itertools.combinations(range(len(features)), size):
+            parts = [(values[k][costs[k] < bound], costs[k][costs[k] < bound]) for k in subset]
+            if any(not len(v) for v, _ in parts):
+                continue
+            grid = np.stack(np.meshgrid(*[v for v, _ in parts], indexing="ij"), axis=-1).reshape(-1, size)
+            total = np.sum(np.meshgrid(*[c for _, c in parts], indexing="ij"), axis=0).ravel()
+            keep = total < bound
+            combos.append((subset, grid[keep], total[keep]))
+    n_combos = sum(len(t) for _, _, t in combos)
+    exhaustive = n_combos <= max_candidates
+    if n_combos:
+        # Xếp mọi tổ hợp theo chi phí; chấm từng khối, khối đầu có nghiệm chứa nghiệm rẻ nhất
+        subset_id = np.concatenate([np.full(len(t), s) for s, (_, _, t) in enumerate(combos)])
+        row = np.concatenate([np.arange(len(t)) for _, _, t in combos])
+        total = np.concatenate([t for _, _, t in combos])
+        order = np.argsort(total, kind="stable")[:max_candidates]
+        for start in range(0, len(order), CANDIDATE_BLOCK):
+            block = order[start:start + CANDIDATE_BLOCK]
+            X = np.repeat(x[None, :], len(block), axis=0)
+            for s, (subset, grid, _) in enumerate(combos):
+                mine = subset_id[block] == s
+                if mine.any():
+                    X[np.ix_(np.flatnonzero(mine), [cols[k] for k in subset])] = grid[row[block[mine]]]
+            scores = predict(X)
+            evaluated += len(block)
+            hit = np.flatnonzero(accept(scores))
+            if len(hit):
+                i = int(hit[0])
+                subset, grid, _ = combos[subset_id[block[i]]]
+                new = grid[row[block[i]]]
+                best = {
+                    "changes": {features[k]: float(v) for k, v in zip(subset, new)},
+                    "cost": float(total[block[i]]),
+                    "score": float(scores[i]),
+                }
+                break
+
+    return {
+        "found": best is not None,
+        **(best or {"changes": {}, "cost": None, "score": None}),
+        "single_feature": single,
+        "candidates_evaluated": evaluated,
+        "exhaustive": exhaustive,
+    }
+
+def search(
+    engine: "TreeEnsemble",
+    x: np.ndarray,
+    base_leaves: np.ndarray,
+    threshold: float,
+    **options: Any,
+) -> Dict[str, Any]:
+    """
+    `find` trên engine numpy: x là hồ sơ (n_features,), base_leaves = engine.predict_leaves của nó;
+    ứng viên được chấm bằng TreeEnsemble.rescore (chỉ duyệt lại các cây bị ảnh hưởng), duyệt khi score < threshold.
+    """
+    x = engine.prepare(np.reshape(x, (1, -1)))[0]
+    return find(
+        lambda rows: engine.rescore(rows, x, base_leaves)[0],
+        lambda scores: scores < threshold,
+        x,
+        engine.feature_names,
+        engine.feature_thresholds,
+        **options,
+    )
+
+def change_record(feature: str, current: float, proposed: float) -> Dict[str, Any]:
+    """Một thay đổi dạng CounterfactualChange."""
+    change = proposed - current
+    return {
+        "feature": feature,
+        "current": current,
+        "proposed": proposed,
+        "change": change,
+        "change_pct": 100.0 * change / abs(current) if current else None,
+    }
+
+def advice_vi(changes: Sequence[Dict[str, Any]]) -> List[str]:
+    """Ví dụ: 'Giảm số tiền vay từ 12,000 xuống 9,812 (-18.2%)'."""
+    lines = []
+    for c in changes:
+        label = ADVICE_LABELS_VI.get(c["feature"], c["feature"])
+        verb, word = ("Tăng", "lên") if c["change"] > 0 else ("Giảm", "xuống")
+        pct = f" ({c['change_pct']:+.1f}%)" if c["change_pct"] is not None else ""
+        lines.append(f"{verb} {label} từ {c['current']:,.0f} {word} {c['proposed']:,.0f}{pct}")
+    return lines
@@ -0,0 +1,685 @@
+# app/engine.py
+"""
+Bộ chấm điểm dạng vector cho ensemble cây của LightGBM.
+
+Đọc trực tiếp lightgbm_model.txt, trải toàn bộ cây thành các mảng phẳng liên tục
+(split_feature, threshold, left/right_child, leaf_value) rồi duyệt cả batch theo
+từng tầng bằng numpy. Kết quả trùng khớp từng bit với Booster.predict.
+"""
+import itertools
+import math
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+# Ngưỡng coi là 0 của LightGBM (kZeroThreshold)
+K_ZERO_THRESHOLD = 1e-35
+
+# Số dòng xử lý mỗi lượt (giữ các mảng trung gian nằm gọn trong cache)
+PREDICT_CHUNK_ROWS = 256
+
+# Chế độ chỉ-quyết-định: số cây duyệt mỗi lượt trước khi kiểm tra điều kiện dừng sớm
+DECISION_BLOCK_TREES = 32
+# SpecializedEnsemble: batch nhỏ hơn ngưỡng này được định tuyến bằng tra dict (rẻ hơn vài lượt numpy)
+ROUTE_LOOKUP_ROWS = 16
+# Biên an toàn (logit) khi so cận với ngưỡng, bù sai số làm tròn do thứ tự cộng khác nhau
+DECISION_MARGIN_EPS = 1e-9
+
+# Các bit của decision_type (xem LightGBM tree.h)
+_CATEGORICAL_MASK = 1
+_DEFAULT_LEFT_MASK = 2
+_MISSING_NONE, _MISSING_ZERO, _MISSING_NAN = 0, 1, 2
+
+# Các mảng gốc của ensemble (đủ để dựng lại TreeEnsemble, dùng cho artifact nhị phân)
+ENSEMBLE_ARRAYS = (
+    "split_feature",
+    "threshold",
+    "decision_type",
+    "left_child",
+    "right_child",
+    "leaf_value",
+    "tree_root",
+    "tree_leaf_start",
+    "leaf_count",
+    "internal_count",
+)
+
+
+def _parse_blocks(text: str) -> Tuple[Dict[str, str], List[Dict[str, str]]]:
+    """Tách phần header và từng khối Tree=... thành dict key -> value (chuỗi)."""
+    header: Dict[str, str] = {}
+    trees: List[Dict[str, str]] = []
+    current = header
+    for raw in text.splitlines():
+        line = raw.strip()
+        if not line:
+            continue
+        if line == "end of trees":
+            break
+        if line.startswith("Tree="):
+            current = {"Tree": line[5:]}
+            trees.append(current)
+            continue
+        if "=" in line:
+            key, value = line.split("=", 1)
+            current[key] = value
+    return header, trees
+
+
+def _check_tree_sizes(text: str, header: Dict[str, str]) -> None:
+    """
+    tree_sizes trong header là số byte của từng khối Tree=...; LightGBM dựa vào nó để
+    parse song song và có thể abort cả process khi không khớp, nên kiểm tra trước.
+    """
+    if "tree_sizes" not in header:
+        return
+    data = text.encode("utf-8")
+    starts = [m.start() for m in re.finditer(rb"^Tree=", data, re.M)]
+    end = data.find(b"end of trees")
+    sizes = [int(v) for v in header["tree_sizes"].split()]
+    actual = [b - a for a, b in zip(starts, starts[1:] + [end])]
+    if end < 0 or sizes != actual:
+        raise ValueError("tree_sizes trong header không khớp với các khối cây (file model hỏng hoặc bị sửa tay)")
+
+
+def _floats(s: str) -> np.ndarray:
+    return np.array(s.split(), dtype=np.float64) if s else np.empty(0, dtype=np.float64)
+
+
+def _ints(s: str) -> np.ndarray:
+    return np.array(s.split(), dtype=np.int64) if s else np.empty(0, dtype=np.int64)
+
+
+class TreeEnsemble:
+    """
+    Ensemble cây đã trải phẳng.
+
+    Node trong được đánh số toàn cục (nối tiếp qua các cây); con có giá trị âm
+    là lá, mã hoá ~leaf_index (leaf_index cũng toàn cục).
+    """
+
+    def __init__(
+        self,
+        feature_names: List[str],
+        feature_infos: List[str],
+        split_feature: np.ndarray,
+        threshold: np.ndarray,
+        decision_type: np.ndarray,
+        left_child: np.ndarray,
+        right_child: np.ndarray,
+        leaf_value: np.ndarray,
+        tree_root: np.ndarray,
+        tree_leaf_start: np.ndarray,
+        max_depth: int,
+        sigmoid: float = 1.0,
+        leaf_count: Optional[np.ndarray] = None,
+        internal_count: Optional[np.ndarray] = None,
+    ):
+        self.feature_names = list(feature_names)
+        self.feature_infos = list(feature_infos)
+        self.split_feature = np.ascontiguousarray(split_feature, dtype=np.int64)
+        self.threshold = np.ascontiguousarray(threshold, dtype=np.float64)
+        self.decision_type = np.ascontiguousarray(decision_type, dtype=np.int64)
+        self.left_child = np.ascontiguousarray(left_child, dtype=np.int64)
+        self.right_child = np.ascontiguousarray(right_child, dtype=np.int64)
+        self.leaf_value = np.ascontiguousarray(leaf_value, dtype=np.float64)
+        self.tree_root = np.ascontiguousarray(tree_root, dtype=np.int64)
+        self.tree_leaf_start = np.ascontiguousarray(tree_leaf_start, dtype=np.int64)
+        self.max_depth = int(max_depth)
+        self.sigmoid = float(sigmoid)
+        # Số mẫu train đi qua mỗi lá / node trong (cover dùng cho TreeSHAP)
+        self.leaf_count = np.ascontiguousarray(
+            np.ones(len(self.leaf_value)) if leaf_count is None else leaf_count, dtype=np.float64
+        )
+        self.internal_count = np.ascontiguousarray(
+            np.ones(len(self.split_feature)) if internal_count is None else internal_count, dtype=np.float64
+        )
+
+        self.default_left = (self.decision_type & _DEFAULT_LEFT_MASK) != 0
+        self.missing_type = (self.decision_type >> 2) & 3
+        self.has_missing_rules = bool(np.any(self.missing_type != _MISSING_NONE))
+
+        # Chỉ số hợp nhất dùng khi duyệt: node trong [0, N), lá [N, N + L).
+        # _children_u[2*i] là con phải, _children_u[2*i + 1] là con trái (chỉ số = go_left);
+        # lá trỏ về chính nó để vòng duyệt theo tầng không cần mặt nạ.
+        n_nodes, n_leaves = len(self.split_feature), len(self.leaf_value)
+        leaves_u = np.arange(n_nodes, n_nodes + n_leaves, dtype=np.int64)
+        left_u = np.where(self.left_child >= 0, self.left_child, n_nodes + ~self.left_child)
+        right_u = np.where(self.right_child >= 0, self.right_child, n_nodes + ~self.right_child)
+        self._children_u = np.stack([np.concatenate([right_u, leaves_u]), np.concatenate([left_u, leaves_u])], axis=1).ravel()
+        self._root_u = np.where(self.tree_root >= 0, self.tree_root, n_nodes + ~self.tree_root)
+        self._feature_u = np.concatenate([self.split_feature, np.zeros(n_leaves, dtype=np.int64)])
+        self._threshold_u = np.concatenate([self.threshold, np.full(n_leaves, np.inf)])
+        self._missing_u = np.concatenate([self.missing_type, np.zeros(n_leaves, dtype=np.int64)])
+        self._default_left_u = np.concatenate([self.default_left, np.zeros(n_leaves, dtype=bool)])
+
+        # Duyệt theo tầng từ gốc: độ sâu từng cây (duyệt một nhóm cây chỉ cần số tầng bằng cây sâu nhất
+        # trong nhóm), cây chứa mỗi node, và "hộp" của mỗi lá: dòng tới lá khi và chỉ khi
+        # _leaf_lo[leaf, f] < x[f] <= _leaf_hi[leaf, f] với mọi f (khi không có luật missing)
+        n_features = len(self.feature_names)
+        self._tree_depth = np.zeros(len(self._root_u), dtype=np.int64)
+        node_tree = np.zeros(n_nodes, dtype=np.int64)
+        self._leaf_lo = np.full((n_leaves, n_features), -np.inf)
+        self._leaf_hi = np.full((n_leaves, n_features), np.inf)
+        frontier, owner, level = self._root_u, np.arange(len(self._root_u)), 0
+        lo, hi = np.full((len(frontier), n_features), -np.inf), np.full((len(frontier), n_features), np.inf)
+        while True:
+            internal = frontier < n_nodes
+            self._leaf_lo[frontier[~internal] - n_nodes] = lo[~internal]
+            self._leaf_hi[frontier[~internal] - n_nodes] = hi[~internal]
+            frontier, owner, lo, hi = frontier[internal], owner[internal], lo[internal], hi[internal]
+            if not len(frontier):
+                break
+            level += 1
+            self._tree_depth[owner] = level
+            node_tree[frontier] = owner
+            rows, f, thr = np.arange(len(frontier)), self.split_feature[frontier], self.threshold[frontier]
+            # Con trái: x <= thr (thu hẹp cận trên); con phải: x > thr (thu hẹp cận dưới)
+            hi_left, lo_right = hi.copy(), lo.copy()
+            hi_left[rows, f] = np.minimum(hi[rows, f], thr)
+            lo_right[rows, f] = np.maximum(lo[rows, f], thr)
+            frontier = np.concatenate([self._children_u[frontier * 2 + 1], self._children_u[frontier * 2]])
+            owner = np.concatenate([owner, owner])
+            lo, hi = np.concatenate([lo, lo_right]), np.concatenate([hi_left, hi])
+        # Chỉ mục ngược feature -> các cây (đã sắp xếp) có node tách theo feature đó
+        self.feature_trees = [np.unique(node_tree[self.split_feature == f]) for f in range(n_features)]
+
+        # Cận của phần margin mà các cây còn lại có thể cộng thêm: _remaining_min[t] / _remaining_max[t]
+        # là tổng lá nhỏ nhất / lớn nhất của các cây t..T-1 (phần tử cuối = 0)
+        if len(self.tree_root):
+            tree_min = np.minimum.reduceat(self.leaf_value, self.tree_leaf_start)
+            tree_max = np.maximum.reduceat(self.leaf_value, self.tree_leaf_start)
+        else:
+            tree_min = tree_max = np.empty(0)
+        self._remaining_min = np.concatenate([np.cumsum(tree_min[::-1])[::-1], [0.0]])
+        self._remaining_max = np.concatenate([np.cumsum(tree_max[::-1])[::-1], [0.0]])
+        # Margin nhỏ nhất / lớn nhất có thể sau t cây đầu (dùng tìm điểm sớm nhất có thể dừng)
+        self._prefix_min = np.concatenate([[0.0], np.cumsum(tree_min)])
+        self._prefix_max = np.concatenate([[0.0], np.cumsum(tree_max)])
+
+        # Ngưỡng phân biệt (đã sắp xếp) của từng feature: model chỉ "nhìn" feature qua các ngưỡng này
+        self.feature_thresholds = [
+            np.unique(self.threshold[self.split_feature == f]) for f in range(len(self.feature_names))
+        ]
+
+    @property
+    def num_trees(self) -> int:
+        return len(self.tree_root)
+
+    @property
+    def num_features(self) -> int:
+        return len(self.feature_names)
+
+    @classmethod
+    def from_model_file(cls, path: Union[str, Path]) -> "TreeEnsemble":
+        return cls.from_model_string(Path(path).read_text(encoding="utf-8"))
+
+    @classmethod
+    def from_model_string(cls, text: str) -> "TreeEnsemble":
+        header, trees = _parse_blocks(text)
+        _check_tree_sizes(text, header)
+        if int(header.get("num_class", "1")) != 1 or int(header.get("num_tree_per_iteration", "1")) != 1:
+            raise ValueError("Chỉ hỗ trợ model một đầu ra (binary/regression)")
+
+        sigmoid = 1.0
+        objective = header.get("objective", "").split()
+        if not objective or objective[0] != "binary":
+            raise ValueError(f"Chỉ hỗ trợ objective binary, nhận được: {header.get('objective')}")
+        for token in objective[1:]:
+            if token.startswith("sigmoid:"):
+                sigmoid = float(token.split(":", 1)[1])
+
+        feature_names = header.get("feature_names", "").split()
+        feature_infos = header.get("feature_infos", "").split()
+
+        split_feature, threshold, decision_type = [], [], []
+        left_child, right_child, leaf_value = [], [], []
+        leaf_count, internal_count = [], []
+        tree_root, tree_leaf_start = [], []
+        node_offset = leaf_offset = 0
+        max_depth = 0
+
+        for t in trees:
+            num_leaves = int(t["num_leaves"])
+            if int(t.get("num_cat", "0")) > 0:
+                raise ValueError(f"Tree={t['Tree']}: chưa hỗ trợ split categorical")
+            if t.get("is_linear", "0") not in ("0", ""):
+                raise ValueError(f"Tree={t['Tree']}: chưa hỗ trợ linear tree")
+            # shrinkage đã được nhân sẵn vào leaf_value khi LightGBM lưu model
+            leaves = _floats(t["leaf_value"])
+            tree_leaf_start.append(leaf_offset)
+            leaf_value.append(leaves)
+            leaf_count.append(_floats(t["leaf_count"]) if "leaf_count" in t else np.ones(len(leaves)))
+
+            if num_leaves <= 1:
+                # Cây chỉ có một lá: gốc chính là lá
+                tree_root.append(~leaf_offset)
+                leaf_offset += len(leaves)
+                continue
+
+            sf = _ints(t["split_feature"])
+            dt = _ints(t["decision_type"])
+            if np.any(dt & _CATEGORICAL_MASK):
+                raise ValueError(f"Tree={t['Tree']}: chưa hỗ trợ split categorical")
+            lc = _ints(t["left_child"])
+            rc = _ints(t["right_child"])
+            max_depth = max(max_depth, _tree_depth(lc, rc))
+            # Đổi chỉ số cục bộ sang chỉ số toàn cục (giữ nguyên mã hoá ~leaf cho lá)
+            lc = np.where(lc >= 0, lc + node_offset, ~(~lc + leaf_offset))
+            rc = np.where(rc >= 0, rc + node_offset, ~(~rc + leaf_offset))
+
+            split_feature.append(sf)
+            threshold.append(_floats(t["threshold"]))
+            decision_type.append(dt)
+            internal_count.append(_floats(t["internal_count"]) if "internal_count" in t else np.ones(len(sf)))
+            left_child.append(lc)
+            right_child.append(rc)
+            tree_root.append(node_offset)
+
+            node_offset += len(sf)
+            leaf_offset += len(leaves)
+
+        def cat(parts, dtype):
+            return np.concatenate(parts).astype(dtype) if parts else np.empty(0, dtype=dtype)
+
+        return cls(
+            feature_names=feature_names,
+            feature_infos=feature_infos,
+            split_feature=cat(split_feature, np.int64),
+            threshold=cat(threshold, np.float64),
+            decision_type=cat(decision_type, np.int64),
+            left_child=cat(left_child, np.int64),
+            right_child=cat(right_child, np.int64),
+            leaf_value=cat(leaf_value, np.float64),
+            tree_root=np.array(tree_root, dtype=np.int64),
+            tree_leaf_start=np.array(tree_leaf_start, dtype=np.int64),
+            max_depth=max_depth,
+            sigmoid=sigmoid,
+            leaf_count=cat(leaf_count, np.float64),
+            internal_count=cat(internal_count, np.float64),
+        )
+
+    def state(self) -> Tuple[Dict[str, Any], Dict[str, np.ndarray]]:
+        """(metadata JSON được, các mảng gốc) — from_state(*state()) dựng lại ensemble."""
+        meta = {
+            "feature_names": self.feature_names,
+            "feature_infos": self.feature_infos,
+            "max_depth": self.max_depth,
+            "sigmoid": self.sigmoid,
+        }
+        return meta, {name: getattr(self, name) for name in ENSEMBLE_ARRAYS}
+
+    @classmethod
+    def from_state(cls, meta: Dict[str, Any], arrays: Dict[str, np.ndarray]) -> "TreeEnsemble":
+        # Mảng đúng dtype và liên tục (vd. memmap) được dùng trực tiếp, không copy
+        return cls(**meta, **{name: arrays[name] for name in ENSEMBLE_ARRAYS})
+
+    def specialize(self, fixed: Dict[int, float]) -> "TreeEnsemble":
+        """
+        Ensemble đã cắt tỉa khi biết trước giá trị một số feature (chỉ số -> giá trị): mọi split trên
+        chúng được quyết định sẵn, nhánh không bao giờ tới bị bỏ. Giữ nguyên thứ tự cây và giá trị lá
+        (cây có thể chỉ còn một lá) nên với dòng có đúng các giá trị đó, score trùng từng bit.
+        """
+        go_left: Dict[int, bool] = {}
+        for f, value in fixed.items():
+            nodes = np.flatnonzero(self.split_feature == f)
+            fval = np.full(len(nodes), float(value))
+            if not self.has_missing_rules and np.isnan(value):
+                fval[:] = 0.0
+            go_left.update(zip(nodes.tolist(), self._go_left(nodes, fval).tolist()))
+
+        src_lc, src_rc = self.left_child.tolist(), self.right_child.tolist()
+        nodes: List[int] = []
+        left_child: List[int] = []
+        right_child: List[int] = []
+        leaves: List[int] = []
+
+        def emit(child: int) -> Tuple[int, int]:
+            """Chép cây con (mã hoá gốc) sang mảng mới, đi thẳng qua node đã biết hướng; trả (mã hoá mới, độ sâu)."""
+            while child >= 0 and child in go_left:
+                child = src_lc[child] if go_left[child] else src_rc[child]
+            if child < 0:
+                leaves.append(~child)
+                return ~(len(leaves) - 1), 0
+            i = len(nodes)
+            nodes.append(child)
+            left_child.append(0)
+            right_child.append(0)
+            left_child[i], left_depth = emit(src_lc[child])
+            right_child[i], right_depth = emit(src_rc[child])
+            return i, 1 + max(left_depth, right_depth)
+
+        tree_root, tree_leaf_start, max_depth = [], [], 0
+        for root in self.tree_root.tolist():
+            tree_leaf_start.append(len(leaves))
+            new_root, depth = emit(root)
+            tree_root.append(new_root)
+            max_depth = max(max_depth, depth)
+
+        nodes_a = np.array(nodes, dtype=np.int64)
+        leaves_a = np.array(leaves, dtype=np.int64)
+        return TreeEnsemble(
+            feature_names=self.feature_names,
+            feature_infos=self.feature_infos,
+            split_feature=self.split_feature[nodes_a],
+            threshold=self.threshold[nodes_a],
+            decision_type=self.decision_type[nodes_a],
+            left_child=np.array(left_child, dtype=np.int64),
+            right_child=np.array(right_child, dtype=np.int64),
+            leaf_value=self.leaf_value[leaves_a],
+            tree_root=np.array(tree_root, dtype=np.int64),
+            tree_leaf_start=np.array(tree_leaf_start, dtype=np.int64),
+            max_depth=max_depth,
+            sigmoid=self.sigmoid,
+            leaf_count=self.leaf_count[leaves_a],
+            internal_count=self.internal_count[nodes_a],
+        )
+
+    def prepare(self, X: np.ndarray) -> np.ndarray:
+        """Kiểm tra shape, ép float64; với model không có luật missing thì đổi NaN -> 0."""
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim != 2 or X.shape[1] != self.num_features:
+            raise ValueError(f"Cần ma trận (n, {self.num_features}), nhận được {X.shape}")
+        if not self.has_missing_rules:
+            # missing_type = None ở mọi node: NaN được coi như 0 rồi so sánh bình thường
+            X = np.where(np.isnan(X), 0.0, X)
+        return np.ascontiguousarray(X)
+
+    def _go_left(self, nodes: np.ndarray, fval: np.ndarray) -> np.ndarray:
+        """Quyết định rẽ trái giống NumericalDecision của LightGBM."""
+        thr = self._threshold_u[nodes]
+        if not self.has_missing_rules:
+            return fval <= thr
+        missing = self._missing_u[nodes]
+        nan = np.isnan(fval)
+        fval = np.where(nan & (missing != _MISSING_NAN), 0.0, fval)
+        use_default = ((missing == _MISSING_ZERO) & (np.abs(fval) <= K_ZERO_THRESHOLD)) | (
+            (missing == _MISSING_NAN) & nan
+        )
+        return np.where(use_default, self._default_left_u[nodes], fval <= thr)
+
+    def node_decisions(self, X: np.ndarray) -> np.ndarray:
+        """Hướng rẽ (True = trái) của mọi node trong cho từng dòng, shape (n_rows, num_nodes)."""
+        X = self.prepare(X)
+        nodes = np.arange(len(self.split_feature), dtype=np.int64)
+        return self._go_left(nodes, X[:, self.split_feature])
+
+    def bin_keys(self, X: np.ndarray) -> np.ndarray:
+        """
+        Chỉ số bin theo ngưỡng của từng feature, shape (n_rows, num_features).
+        Hai dòng có cùng bin ở mọi feature đi vào cùng lá ở mọi cây, nên có cùng
+        score và cùng SHAP (x <= ngưỡng thứ i  <=>  bin <= i).
+        """
+        X = self.prepare(X)
+        keys = np.empty(X.shape, dtype=np.int32)
+        for f, thresholds in enumerate(self.feature_thresholds):
+            keys[:, f] = np.searchsorted(thresholds, X[:, f], side="left")
+        if self.has_missing_rules:
+            # NaN và 0 có thể đi theo hướng mặc định -> tách thành bin riêng
+            keys[np.isnan(X)] = -1
+            keys[np.abs(X) <= K_ZERO_THRESHOLD] = -2
+        return keys
+
+    def predict_leaves(self, X: np.ndarray) -> np.ndarray:
+        """Trả về chỉ số lá toàn cục, shape (n_rows, num_trees)."""
+        X = self.prepare(X)
+        out = np.empty((X.shape[0], self.num_trees), dtype=np.int64)
+        for start in range(0, X.shape[0], PREDICT_CHUNK_ROWS):
+            stop = start + PREDICT_CHUNK_ROWS
+            out[start:stop] = self._predict_leaves_chunk(X[start:stop])
+        return out
+
+    def _predict_leaves_chunk(self, X: np.ndarray, trees: slice = slice(None)) -> np.ndarray:
+        n, m = X.shape
+        flat = X.ravel()
+        row_base = (np.arange(n, dtype=np.int64) * m)[:, None]
+        roots = self._root_u[trees]
+        node = np.broadcast_to(roots, (n, len(roots)))
+        # Duyệt theo tầng cho mọi (dòng, cây) cùng lúc; lá trỏ về chính nó nên đứng yên
+        depth = self.max_depth if trees == slice(None) else int(self._tree_depth[trees].max(initial=0))
+        n_nodes = len(self.split_feature)
+        for level in range(depth):
+            go_left = self._go_left(node, flat[self._feature_u[node] + row_base])
+            node = self._children_u[node * 2 + go_left]
+            # Mọi đường đi đều đã tới lá (đường thực tế thường ngắn hơn cây sâu nhất): dừng
+            if level >= 3 and node.min() >= n_nodes:
+                break
+        return node - n_nodes
+
+    def predict_margin(self, X: np.ndarray) -> np.ndarray:
+        """Raw score (logit). Cộng dồn lần lượt theo thứ tự cây như LightGBM."""
+        leaf_out = self.leaf_value[self.predict_leaves(X)]
+        # cumsum cộng tuần tự (không dùng pairwise như np.sum) -> trùng từng bit
+        return np.cumsum(leaf_out, axis=1)[:, -1] if leaf_out.shape[1] else np.zeros(len(leaf_out))
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        return sigmoid(self.predict_margin(X), self.sigmoid)
+
+    def _earliest_decision(self, target: float) -> int:
+        """Số cây tối thiểu phải duyệt trước khi cận còn lại có thể loại trừ một phía của target."""
+        t = np.arange(1, self.num_trees + 1)
+        possible = (self._prefix_min[t] + self._remaining_max[t] < target - DECISION_MARGIN_EPS) | (
+            self._prefix_max[t] + self._remaining_min[t] > target + DECISION_MARGIN_EPS
+        )
+        return int(np.argmax(possible)) + 1 if possible.any() else self.num_trees
+
+    def predict_decision(
+        self, X: np.ndarray, threshold: float, block: int = DECISION_BLOCK_TREES
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Chỉ quyết định approved = proba < threshold, duyệt cây theo thứ tự và dừng sớm
+        khi margin hiện tại cộng cận (min/max lá) của các cây còn lại không thể vượt
+        qua logit(threshold) nữa.
+
+        Trả về (approved, trees_evaluated, proba): trees_evaluated là số cây cần duyệt
+        tới khi chắc chắn (máy tính theo khối `block` cây); proba là NaN với dòng dừng
+        sớm, còn lại trùng từng bit với predict_proba (và approved cũng vậy).
+        """
+        X = self.prepare(X)
+        n, num_trees = X.shape[0], self.num_trees
+        approved = np.zeros(n, dtype=bool)
+        evaluated = np.full(n, num_trees, dtype=np.int64)
+        proba = np.full(n, np.nan)
+        margin = np.zeros(n)
+        active = np.arange(n)
+        early_exit = 0.0 < threshold < 1.0
+        target = math.log(threshold / (1.0 - threshold)) / self.sigmoid if early_exit else 0.0
+        block = max(1, int(block))
+        # Lượt đầu duyệt liền tới cây sớm nhất mà (với bất kỳ hồ sơ nào) việc dừng là khả dĩ
+        first_stop = self._earliest_decision(target) if early_exit else num_trees
+        stops = list(range(first_stop, num_trees, block)) + [num_trees]
+
+        start = 0
+        for stop in stops:
+            if not len(active):
+                break
+            xa = X[active]
+            leaves = np.empty((len(active), stop - start), dtype=np.int64)
+            for r in range(0, len(active), PREDICT_CHUNK_ROWS):
+                leaves[r:r + PREDICT_CHUNK_ROWS] = self._predict_leaves_chunk(
+                    xa[r:r + PREDICT_CHUNK_ROWS], slice(start, stop)
+                )
+            # cumsum nối tiếp margin trước đó -> cùng thứ tự cộng với predict_margin (trùng từng bit)
+            partial = np.cumsum(np.column_stack([margin[active], self.leaf_value[leaves]]), axis=1)[:, 1:]
+            margin[active] = partial[:, -1]
+            if not early_exit:
+                continue
+            sure_yes = partial + self._remaining_max[start + 1:stop + 1] < target - DECISION_MARGIN_EPS
+            sure_no = partial + self._remaining_min[start + 1:stop + 1] > target + DECISION_MARGIN_EPS
+            done = sure_yes | sure_no
+            finished = done.any(axis=1)
+            if finished.any():
+                first = np.argmax(done[finished], axis=1)
+                rows = active[finished]
+                evaluated[rows] = start + first + 1
+                approved[rows] = sure_yes[finished][np.arange(len(rows)), first]
+                active = active[~finished]
+            start = stop
+
+        # Dòng phải duyệt hết cây: score đầy đủ, quyết định như đường chấm điểm thường
+        if len(active):
+            proba[active] = sigmoid(margin[active], self.sigmoid)
+            approved[active] = proba[active] < threshold
+        # Dòng chắc chắn đúng ở cây cuối cũng đã có margin đầy đủ
+        last = np.flatnonzero((evaluated == num_trees) & np.isnan(proba))
+        if len(last):
+            proba[last] = sigmoid(margin[last], self.sigmoid)
+        return approved, evaluated, proba
+
+    def _predict_leaf_pairs(self, X: np.ndarray, rows: np.ndarray, trees: np.ndarray) -> np.ndarray:
+        """Lá toàn cục của từng cặp (rows[k], trees[k]); X đã qua prepare."""
+        flat = X.ravel()
+        n_nodes = len(self.split_feature)
+        out = np.empty(len(rows), dtype=np.int64)
+        step = PREDICT_CHUNK_ROWS * max(1, self.num_trees)
+        for start in range(0, len(rows), step):
+            r, t = rows[start:start + step], trees[start:start + step]
+            node, base = self._root_u[t], r * X.shape[1]
+            for level in range(int(self._tree_depth[t].max(initial=0))):
+                go_left = self._go_left(node, flat[self._feature_u[node] + base])
+                node = self._children_u[node * 2 + go_left]
+                if level >= 3 and node.min() >= n_nodes:
+                    break
+            out[start:start + step] = node - n_nodes
+        return out
+
+    def rescore(
+        self, X: np.ndarray, base_x: np.ndarray, base_leaves: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Chấm các biến thể X của một hồ sơ đã chấm (base_x, base_leaves = predict_leaves của nó),
+        chỉ duyệt lại những cây mà thay đổi có thể đổi lá: cây có tách theo feature đã đổi
+        (feature_trees) và giá trị mới nằm ngoài hộp của lá cũ. Margin cộng lại theo thứ tự
+        cây nên proba trùng từng bit với predict_proba(X).
+
+        Trả về (proba, leaves, trees_evaluated) với trees_evaluated là số cây đã duyệt lại mỗi dòng.
+        """
+        X = self.prepare(X)
+        base_x = self.prepare(np.reshape(base_x, (1, -1)))[0]
+        base_leaves = np.asarray(base_leaves, dtype=np.int64)
+        n = X.shape[0]
+        changed = X != base_x
+        stale = np.zeros((n, self.num_trees), dtype=bool)
+        for f in np.flatnonzero(changed.any(axis=0)):
+            rows, trees = np.flatnonzero(changed[:, f]), self.feature_trees[f]
+            if self.has_missing_rules:
+                # NaN / 0 có thể đi theo hướng mặc định, hộp không còn đúng: duyệt lại mọi cây dùng feature
+                stale[np.ix_(rows, trees)] = True
+                continue
+            leaf = base_leaves[trees]
+            v = X[rows, f][:, None]
+            stale[np.ix_(rows, trees)] |= (v <= self._leaf_lo[leaf, f]) | (v > self._leaf_hi[leaf, f])
+        leaves = np.repeat(base_leaves[None, :], n, axis=0)
+        rows, trees = np.nonzero(stale)
+        if len(rows):
+            leaves[rows, trees] = self._predict_leaf_pairs(X, rows, trees)
+        leaf_out = self.leaf_value[leaves]
+        margin = np.cumsum(leaf_out, axis=1)[:, -1] if leaf_out.shape[1] else np.zeros(n)
+        return sigmoid(margin, self.sigmoid), leaves, stale.sum(axis=1)
+
+
+class SpecializedEnsemble:
+    """
+    Một ensemble cắt tỉa sẵn (TreeEnsemble.specialize) cho mỗi tổ hợp giá trị của các feature phân loại
+    (vd. 3 x 6 x 2 = 36 tổ hợp), dựng một lần khi nạp model. Mỗi dòng được chấm bằng ensemble của tổ hợp
+    của nó; dòng có giá trị ngoài miền (ma trận/Arrow gửi thẳng) dùng ensemble gốc. Trùng từng bit với gốc.
+    """
+
+    def __init__(self, base: TreeEnsemble, domains: Dict[int, Sequence[float]]):
+        self.base = base
+        self.features = sorted(domains)
+        self.domains = [np.unique(np.asarray(domains[f], dtype=np.float64)) for f in self.features]
+        # Thứ tự tổ hợp khớp với mã trong route(): feature cuối thay đổi nhanh nhất
+        combos = list(itertools.product(*(d.tolist() for d in self.domains)))
+        self.ensembles = [base.specialize(dict(zip(self.features, combo))) for combo in combos]
+        self._lookup = {combo: code for code, combo in enumerate(combos)}
+
+    @classmethod
+    def from_feature_values(cls, base: TreeEnsemble, values: Dict[str, Sequence[float]]) -> "SpecializedEnsemble":
+        """values: tên feature -> các giá trị (mã) hợp lệ; feature không có trong model bị bỏ qua."""
+        index = {name: i for i, name in enumerate(base.feature_names)}
+        return cls(base, {index[name]: v for name, v in values.items() if name in index})
+
+    def route(self, X: np.ndarray) -> np.ndarray:
+        """Chỉ số tổ hợp của từng dòng (X đã prepare), -1 nếu có feature phân loại ngoài miền."""
+        if len(X) <= ROUTE_LOOKUP_ROWS:
+            rows = X[:, self.features].tolist()
+            return np.array([self._lookup.get(tuple(row), -1) for row in rows], dtype=np.int64)
+        code = np.zeros(len(X), dtype=np.int64)
+        valid = np.ones(len(X), dtype=bool)
+        for f, values in zip(self.features, self.domains):
+            col = X[:, f]
+            pos = np.minimum(np.searchsorted(values, col), len(values) - 1)
+            valid &= values[pos] == col
+            code = code * len(values) + pos
+        return np.where(valid, code, -1)
+
+    def _groups(self, X: np.ndarray):
+        """(ensemble, chỉ số dòng) cho từng tổ hợp có mặt trong X."""
+        codes = self.route(X)
+        if codes.min() == codes.max():
+            # Cả batch cùng một tổ hợp (luôn đúng với một hồ sơ): không cần tách dòng
+            yield (self.base if codes[0] < 0 else self.ensembles[codes[0]]), slice(None)
+            return
+        for code in np.unique(codes):
+            yield (self.base if code < 0 else self.ensembles[code]), np.flatnonzero(codes == code)
+
+    @property
+    def num_trees(self) -> int:
+        return self.base.num_trees
+
+    def predict_margin(self, X: np.ndarray) -> np.ndarray:
+        X = self.base.prepare(X)
+        out = np.empty(len(X), dtype=np.float64)
+        for ensemble, rows in self._groups(X):
+            out[rows] = ensemble.predict_margin(X[rows])
+        return out
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        return sigmoid(self.predict_margin(X), self.base.sigmoid)
+
+    def predict_decision(self, X: np.ndarray, threshold: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Như TreeEnsemble.predict_decision; cận của các cây còn lại lấy trên cây đã cắt tỉa nên chặt hơn."""
+        X = self.base.prepare(X)
+        approved = np.zeros(len(X), dtype=bool)
+        evaluated = np.zeros(len(X), dtype=np.int64)
+        proba = np.empty(len(X), dtype=np.float64)
+        for ensemble, rows in self._groups(X):
+            approved[rows], evaluated[rows], proba[rows] = ensemble.predict_decision(X[rows], threshold)
+        return approved, evaluated, proba
+
+    def stats(self) -> Dict[str, Any]:
+        node_counts = np.array([len(e.split_feature) for e in self.ensembles])
+        return {
+            "enabled": True,
+            "features": [self.base.feature_names[f] for f in self.features],
+            "combinations": len(self.ensembles),
+            "base_nodes": len(self.base.split_feature),
+            "nodes_mean": float(node_counts.mean()) if len(node_counts) else 0.0,
+            "base_max_depth": self.base.max_depth,
+            "max_depth_mean": float(np.mean([e.max_depth for e in self.ensembles])) if self.ensembles else 0.0,
+        }
+
+
+def sigmoid(margin: np.ndarray, scale: float = 1.0) -> np.ndarray:
+    """
+    Hàm sigmoid của objective binary.
+    Dùng math.exp (libm, giống std::exp của LightGBM) thay vì np.exp để khớp từng bit.
+    """
+    neg = (-scale * np.asarray(margin, dtype=np.float64)).tolist()
+    return 1.0 / (1.0 + np.fromiter(map(math.exp, neg), dtype=np.float64, count=len(neg)))
+
+
+def _tree_depth(lc: np.ndarray, rc: np.ndarray) -> int:
+    """Độ sâu (số node trong trên đường dài nhất) của một cây, chỉ số cục bộ."""
+    depth = 0
+    stack = [(0, 1)]
+    while stack:
+        node, d = stack.pop()
+        depth = max(depth, d)
+        for child in (lc[node], rc[node]):
+            if child >= 0:
+                stack.append((child, d + 1))
+    return depth
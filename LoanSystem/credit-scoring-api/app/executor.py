@@ -0,0 +1,83 @@
+# app/executor.py
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Tuple
+
+def _timed_call(fn: Callable, args: Tuple[Any, ...]) -> Tuple[float, Any]:
+    """Chạy trong worker: ghi lại thời điểm bắt đầu (monotonic dùng chung giữa các process)."""
+    started = time.monotonic()
+    return started, fn(*args)
+
+class ScoringExecutor:
+    """
+    Executor riêng cho phần tính toán nặng (predict/SHAP), kích thước cố định.
+    Handler async chỉ parse request trên event loop rồi đẩy việc tính sang đây,
+    nên độ trễ nhận/parse không bị ảnh hưởng khi CPU đã bão hoà.
+
+    kind = "thread" (mặc định) hoặc "process" (mỗi worker có bản model riêng,
+    hàm và tham số phải pickle được).
+    """
+
+    def __init__(self, kind: str = "thread", workers: int = 1):
+        self.kind = kind
+        self.workers = max(1, int(workers))
+        self._pool: Executor = (
+            ProcessPoolExecutor(max_workers=self.workers)
+            if kind == "process"
+            else ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="scoring")
+        )
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.wait_last = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        """Số việc đã gửi nhưng còn chờ worker rảnh."""
+        return max(0, self.in_flight - self.workers)
+
+    async def run(self, fn: Callable, *args: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        submitted = time.monotonic()
+        with self._lock:
+            self.in_flight += 1
+        try:
+            if self.kind == "process":
+                started, result = await loop.run_in_executor(self._pool, _timed_call, fn, args)
+            else:
+                # Mang contextvars (vd. RequestTiming của request) sang thread worker
+                ctx = contextvars.copy_context()
+                started, result = await loop.run_in_executor(self._pool, ctx.run, _timed_call, fn, args)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+        wait = max(0.0, started - submitted)
+        with self._lock:
+            self.completed += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            self.wait_last = wait
+        return result
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "kind": self.kind,
+                "workers": self.workers,
+                "in_flight": self.in_flight,
+                "queue_depth": self.queue_depth,
+                "completed": self.completed,
+                "wait_ms": {
+                    "last": self.wait_last * 1e3,
+                    "avg": (self.wait_total / self.completed * 1e3) if self.completed else 0.0,
+                    "max": self.wait_max * 1e3,
+                },
+            }
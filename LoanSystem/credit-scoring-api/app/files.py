@@ -0,0 +1,42 @@
+# app/files.py
+"""
+File dẫn xuất từ model (artifact nhị phân, scorer sinh sẵn): checksum, tên file theo checksum
+và ghi nguyên tử. Dùng chung cho app/artifact.py và app/codegen.py.
+"""
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from typing import IO, Any, Callable, Optional, Union
+
+def file_sha256(path: Union[str, Path]) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def derived_path(
+    model_path: Union[str, Path], sha256: str, suffix: str, artifact_dir: Optional[Union[str, Path]] = None
+) -> Path:
+    """<artifact_dir hoặc thư mục của model>/<tên model>.<sha256[:16]>.<suffix>: model đổi thì tên file đổi theo."""
+    model_path = Path(model_path)
+    folder = Path(artifact_dir) if artifact_dir else model_path.parent
+    return folder / f"{model_path.stem}.{sha256[:16]}.{suffix}"
+
+def atomic_write(path: Union[str, Path], write: Callable[[IO[Any]], None], binary: bool = True) -> None:
+    """
+    Gọi write(f) trên file tạm cùng thư mục rồi đổi tên thành path, nên process khác không bao giờ
+    đọc phải file dở; lỗi giữa chừng thì xoá file tạm và ném lại lỗi.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=str(path.parent), prefix=path.name, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb" if binary else "w", **({} if binary else {"encoding": "utf-8"})) as f:
+            write(f)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
@@ -1,29 +1,75 @@
 # app/main.py
 import os
+import secrets
+import time
+from contextlib import asynccontextmanager
 from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional
 import numpy as np
-from fastapi import FastAPI, HTTPException
-from lightgbm import Booster
-import shap
-
-from .schemas import CreditApplication, PredictResponse
-from .utils import get_threshold
-
-def resolve_model_path() -> str:
-    env_path = os.getenv("MODEL_PATH", "").strip()
-    candidates = []
-    if env_path:
-        candidates.append(Path(env_path))
-    candidates.append(Path(__file__).resolve().parent.parent / "models" / "lightgbm_model.txt")
-    candidates.append(Path.cwd() / "models" / "lightgbm_model.txt")
-    for p in candidates:
-        if p.is_file():
-            return str(p)
-    raise FileNotFoundError("Không tìm thấy lightgbm_model.txt. Hãy đặt vào models/ hoặc set MODEL_PATH.")
+from fastapi import FastAPI, Header, HTTPException, Query, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import ValidationError
+
+from .batching import MicroBatcher
+from . import arrow_io, codec, counterfactual
+from .executor import ScoringExecutor
+from . import metrics
+from .metrics import BATCH_SIZE, ERRORS, REQUEST_SECONDS, STAGE_SECONDS, TREES_EVALUATED
+from .registry import LoadedModel, ModelRegistry
+from .shadow import ShadowScorer
+from .slowlog import SlowRequestLog
+from .schemas import (
+    BatchPredictRequest,
+    BatchPredictResponse,
+    ColumnarBatchRequest,
+    CounterfactualRequest,
+    CounterfactualResponse,
+    CreditApplication,
+    DecisionResponse,
+    ExplainLevel,
+    MatrixBatchRequest,
+    PredictResponse,
+    ReloadResponse,
+    WhatIfRequest,
+    WhatIfResponse,
+)
+from .utils import (
+    get_admin_token,
+    get_batch_max_size,
+    get_compression_min_bytes,
+    get_executor_config,
+    get_explainer_wait,
+    get_microbatch_config,
+    get_model_watch_interval,
+    get_shadow_config,
+    get_slow_request_config,
+    get_scoring_engine,
+    get_shap_engine,
+    get_stream_chunk_size,
+    get_threshold,
+    is_server_timing_enabled,
+    normalize_column,
+    is_model_shared,
+    resolve_model_path,
+)
 
 MODEL_PATH = resolve_model_path()
 
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    registry.current.explainer_loader.start()
+    registry.start_watching(get_model_watch_interval())
+    if shadow is not None:
+        shadow.start()
+    yield
+    registry.stop_watching()
+    if shadow is not None:
+        shadow.stop()
+    scoring_executor.shutdown()
+
 app = FastAPI(
+    lifespan=lifespan,
     title="Credit Scoring API / API Chấm điểm Tín dụng",
     version="1.2.0",
     description=(
@@ -32,12 +78,42 @@ app = FastAPI(
     ),
 )
 
-try:
-    booster = Booster(model_file=MODEL_PATH)
-    # Initialize SHAP TreeExplainer
-    explainer = shap.TreeExplainer(booster)
-except Exception as e:
-    raise RuntimeError(f"Không thể nạp model từ {MODEL_PATH}: {e}")
+# Registry giữ phiên bản model hiện tại; file model đổi (hoặc gọi /admin/reload) thì nạp
+# bản mới ngoài luồng request và hoán đổi nguyên tử. Mỗi request dùng registry.current
+# lấy một lần lúc bắt đầu, nên request đang chạy hoàn tất trên phiên bản cũ.
+registry = ModelRegistry(MODEL_PATH)
+
+# Executor riêng cho predict/SHAP; handler async chỉ parse request trên event loop
+scoring_executor = ScoringExecutor(*get_executor_config())
+
+# Model challenger (CHALLENGER_MODEL_PATH) chấm lại cùng ma trận feature trên thread nền;
+# kết quả chỉ ghi ra kênh phụ, bị bỏ khi hàng đợi đầy hoặc executor đang có việc chờ
+_challenger_path, _shadow_queue_size, _shadow_log_path = get_shadow_config()
+shadow = (
+    ShadowScorer(
+        LoadedModel.load(_challenger_path),
+        _shadow_queue_size,
+        _shadow_log_path,
+        overloaded=lambda: scoring_executor.queue_depth > 0,
+        threshold=get_threshold,
+    )
+    if _challenger_path
+    else None
+)
+
+async def _score_micro_batch(x: np.ndarray, with_shap: bool, model: LoadedModel):
+    BATCH_SIZE.observe(len(x), "microbatch")
+    # Thời gian predict/shap của cả đợt được trả về cho từng request trong đợt (Server-Timing)
+    timing = metrics.start_request_timing()
+    scores, shap_values, expected_value = await scoring_executor.run(score_matrix, model, x, with_shap)
+    return scores, shap_values, expected_value, timing.stages
+
+# Gom các /predict đồng thời thành batch (MICROBATCH_ENABLED=0 để tắt)
+_mb_enabled, _mb_max_size, _mb_max_wait_ms = get_microbatch_config()
+micro_batcher = MicroBatcher(_score_micro_batch, _mb_max_size, _mb_max_wait_ms / 1e3) if _mb_enabled else None
+
+# Request chậm hơn SLOW_REQUEST_MS được giữ lại để xem ở /debug/slow-requests (input chỉ khi SLOW_REQUEST_CAPTURE_INPUTS=1)
+slow_requests = SlowRequestLog(*get_slow_request_config())
 
 FEATURE_ORDER = [
     "person_age",
@@ -53,43 +129,922 @@ FEATURE_ORDER = [
 @app.get("/healthz")
 def healthz():
     p = Path(MODEL_PATH)
-    return {"status": "ok", "model_path": MODEL_PATH, "exists": p.is_file(), "cwd": str(Path.cwd())}
+    model = registry.current
+    return {
+        "status": "ok",
+        "pid": os.getpid(),
+        "model_shared": is_model_shared(),
+        **model.info(),
+        "exists": p.is_file(),
+        "cwd": str(Path.cwd()),
+        "scoring_engine": get_scoring_engine(),
+        "shap_engine": get_shap_engine(),
+        "specialized": model.specialized.stats() if model.specialized is not None else {"enabled": False},
+        "codegen": model.scorer_stats(),
+        "explainer": model.explainer_loader.stats(),
+        "registry": registry.stats(),
+        "cache": model.cache.stats(),
+        "whatif_cache": model.leaf_cache.stats(),
+        "executor": scoring_executor.stats(),
+        "micro_batching": micro_batcher.stats() if micro_batcher is not None else {"enabled": False},
+        "shadow": shadow.stats() if shadow is not None else {"enabled": False},
+        "slow_requests": slow_requests.stats(),
+    }
+
+@app.get("/readyz")
+def readyz():
+    """
+    Readiness: 200 khi mọi thành phần (kể cả explainer SHAP) đã sẵn sàng, 503 khi còn đang warm-up.
+    Liveness vẫn là /healthz; request explain=none được phục vụ cả khi chưa ready.
+    """
+    model = registry.current
+    loader = model.explainer_loader
+    body = {"ready": loader.ready, "scoring": True, "model_version": model.version, "explainer": loader.stats()}
+    return JSONResponse(body, status_code=200 if loader.ready else 503)
+
+def _collect_state_metrics() -> List[str]:
+    """Counter/gauge đọc từ trạng thái sẵn có: cache, executor, micro-batching, shadow."""
+    model = registry.current
+    cache = model.cache.stats()
+    version = {"model_version": model.version}
+    executor = scoring_executor.stats()
+    lines = []
+    lines += metrics.sample_lines("credit_scoring_cache_hits_total", "counter", "Số lần trúng cache theo bin ngưỡng", [(version, cache["hits"])])
+    lines += metrics.sample_lines("credit_scoring_cache_misses_total", "counter", "Số lần trượt cache", [(version, cache["misses"])])
+    lines += metrics.sample_lines("credit_scoring_cache_evictions_total", "counter", "Số phần tử bị đẩy khỏi cache", [(version, cache["evictions"])])
+    lines += metrics.sample_lines("credit_scoring_cache_entries", "gauge", "Số phần tử đang có trong cache", [(version, cache["size"])])
+    lines += metrics.sample_lines("credit_scoring_executor_in_flight", "gauge", "Số việc đang chạy hoặc chờ trong executor", [({}, executor["in_flight"])])
+    lines += metrics.sample_lines("credit_scoring_executor_queue_depth", "gauge", "Số việc đang chờ worker rảnh", [({}, executor["queue_depth"])])
+    lines += metrics.sample_lines("credit_scoring_reloads_total", "counter", "Số lần hoán đổi model", [({}, registry.reloads)])
+    if micro_batcher is not None:
+        mb = micro_batcher.stats()
+        lines += metrics.sample_lines("credit_scoring_microbatch_batches_total", "counter", "Số đợt micro-batch đã xả", [({}, mb["batches"])])
+    if shadow is not None:
+        sh = shadow.stats()
+        lines += metrics.sample_lines("credit_scoring_shadow_dropped_total", "counter", "Số lượt shadow bị bỏ (quá tải)", [({}, sh["dropped"])])
+        lines += metrics.sample_lines("credit_scoring_shadow_processed_total", "counter", "Số lượt shadow đã chấm", [({}, sh["processed"])])
+    return lines
+
+metrics.register_collector(_collect_state_metrics)
+
+@app.get("/metrics")
+def metrics_endpoint():
+    """Metrics dạng Prometheus text: thời gian từng bước, lỗi, cache, kích thước batch."""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+def _check_admin_token(x_admin_token: Optional[str]) -> None:
+    """Endpoint quản trị chỉ mở khi có ADMIN_TOKEN (không đặt thì 404) và header X-Admin-Token trùng khớp."""
+    token = get_admin_token()
+    if not token:
+        raise HTTPException(status_code=404, detail="Endpoint quản trị bị tắt (chưa đặt ADMIN_TOKEN)")
+    if not secrets.compare_digest(x_admin_token or "", token):
+        raise HTTPException(status_code=403, detail="Sai hoặc thiếu X-Admin-Token")
+
+@app.get("/debug/slow-requests")
+def debug_slow_requests(
+    limit: Optional[int] = Query(None, ge=1),
+    clear: bool = False,
+    x_admin_token: Optional[str] = Header(None),
+):
+    """
+    Các request chậm hơn SLOW_REQUEST_MS (mới nhất trước) kèm thời gian từng bước (input gốc chỉ khi
+    SLOW_REQUEST_CAPTURE_INPUTS=1), theo process hiện tại. clear=true để xoá sau khi đọc.
+    Cần ADMIN_TOKEN và header X-Admin-Token; không đặt ADMIN_TOKEN thì trả 404.
+    """
+    _check_admin_token(x_admin_token)
+    entries = slow_requests.entries(limit)
+    if clear:
+        slow_requests.clear()
+    return {**slow_requests.stats(), "entries": entries}
+
+@app.post("/admin/reload", response_model=ReloadResponse)
+def admin_reload(force: bool = False, x_admin_token: Optional[str] = Header(None)):
+    """
+    Nạp lại file model (MODEL_PATH) nếu checksum đổi (hoặc force=true). Model mới được
+    warm-up xong mới hoán đổi; lỗi thì giữ phiên bản cũ. Cần ADMIN_TOKEN và header X-Admin-Token;
+    không đặt ADMIN_TOKEN thì endpoint bị tắt (404), chỉ còn theo dõi file (MODEL_WATCH_INTERVAL_S).
+    """
+    _check_admin_token(x_admin_token)
+    previous = registry.current.version
+    try:
+        reloaded, model = registry.reload(force=force)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Không thể nạp model mới (giữ {previous}): {e}")
+    return ReloadResponse(reloaded=reloaded, model_version=model.version, previous_version=previous)
+
+# Ghi chú quy tắc quyết định (giống giá trị mặc định của PredictResponse.note_vi)
+NOTE_VI = PredictResponse.model_fields["note_vi"].default
+
+# Số feature mặc định khi explain=topk
+DEFAULT_TOP_K = 3
+EXPLAIN_DESCRIPTION = "none: chỉ trả quyết định (bỏ qua SHAP) | topk: chỉ top_k đóng góp lớn nhất | full: toàn bộ SHAP"
+
+# Độ dài tối đa của một dòng NDJSON trong /predict/stream
+STREAM_MAX_LINE_BYTES = 1 << 20
+
+def _json_body_schema(*models: type, binary_types: tuple = ()) -> dict:
+    """openapi_extra cho endpoint tự đọc body (để vẫn hiện schema request trong /docs)."""
+    schemas = [m.model_json_schema() for m in models]
+    schema = schemas[0] if len(schemas) == 1 else {"anyOf": schemas}
+    content = {"application/json": {"schema": schema}}
+    for media_type in binary_types:
+        content[media_type] = {"schema": {"type": "string", "format": "binary"}}
+    return {"requestBody": {"required": True, "content": content}}
+
+async def read_body(request: Request, endpoint: str) -> Any:
+    """Đọc + parse body JSON (hoặc MessagePack theo Content-Type), đo riêng bước parse; lỗi trả 422 giống FastAPI."""
+    body = await request.body()
+    if not body:
+        ERRORS.inc(endpoint, "parse")
+        raise RequestValidationError([{"type": "missing", "loc": ("body",), "msg": "Field required", "input": None}])
+    with STAGE_SECONDS.time("parse"):
+        try:
+            return codec.decode(body, request.headers.get("content-type"))
+        except ValueError as e:
+            ERRORS.inc(endpoint, "parse")
+            raise RequestValidationError(
+                [{"type": "json_invalid", "loc": ("body", getattr(e, "pos", 0)), "msg": "JSON decode error", "input": {}, "ctx": {"error": getattr(e, "msg", str(e))}}]
+            )
+
+async def read_arrow_body(request: Request, endpoint: str):
+    """Arrow IPC body -> (ma trận, mask dòng lỗi, thông báo lỗi); thiếu pyarrow trả 415, sai cấu trúc trả 422."""
+    body = await request.body()
+    with STAGE_SECONDS.time("parse"):
+        try:
+            return arrow_io.read_features(body, FEATURE_ORDER)
+        except arrow_io.ArrowUnavailable as e:
+            ERRORS.inc(endpoint, "parse")
+            raise HTTPException(status_code=415, detail=str(e))
+        except ValueError as e:
+            ERRORS.inc(endpoint, "parse")
+            raise RequestValidationError(
+                [{"type": "value_error", "loc": ("body",), "msg": f"Value error, {e}", "input": None, "ctx": {"error": {}}}]
+            )
+
+def validate_body(model: type, data: Any, endpoint: str):
+    """Chạy validator pydantic (đo riêng bước validate); lỗi trả 422 giống FastAPI."""
+    with STAGE_SECONDS.time("validate"):
+        try:
+            return model.model_validate(data)
+        except ValidationError as e:
+            ERRORS.inc(endpoint, "validation")
+            raise RequestValidationError([{**err, "loc": ("body", *err["loc"])} for err in e.errors(include_url=False)])
+
+def encoded_response(
+    request: Request,
+    content: Any,
+    timing: Optional[metrics.RequestTiming] = None,
+    compress: bool = False,
+) -> Response:
+    """
+    Serialize dict kết quả (orjson, hoặc MessagePack theo Accept), không qua validate pydantic;
+    nén gzip/zstd khi compress và Accept-Encoding cho phép. Đo riêng bước serialize; kèm Server-Timing khi bật.
+    """
+    media_type = codec.negotiate(request.headers.get("accept"))
+    headers = {"Vary": "Accept, Accept-Encoding" if compress else "Accept"}
+    with STAGE_SECONDS.time("serialize"):
+        body = codec.encode(content, media_type)
+        if compress:
+            body, encoding = codec.compress(body, request.headers.get("accept-encoding"), get_compression_min_bytes())
+            if encoding is not None:
+                headers["Content-Encoding"] = encoding
+    if timing is not None and is_server_timing_enabled():
+        headers["Server-Timing"] = timing.server_timing()
+    return Response(body, media_type=media_type, headers=headers)
+
+class ExplainerUnavailable(RuntimeError):
+    """Explainer chưa warm-up xong (hoặc lỗi): trả quyết định không kèm SHAP."""
+
+def shap_matrix(model: LoadedModel, x: np.ndarray):
+    """
+    SHAP (log-odds) cho cả ma trận x trong một lần gọi explainer.
+    Trả về (ma trận (n, n_features), expected_value) của lớp dương (vỡ nợ).
+    """
+    explainer = model.explainer_loader.get(get_explainer_wait())
+    if explainer is None:
+        raise ExplainerUnavailable(model.explainer_loader.status)
+    with STAGE_SECONDS.time("shap"):
+        values = explainer.shap_values(x)
+    expected = explainer.expected_value
+    # shap >= 0.44 trả về list [lớp 0, lớp 1] với LightGBM binary -> lấy lớp 1
+    if isinstance(values, list):
+        values = values[-1]
+    expected = np.ravel(expected)[-1]
+    return np.asarray(values, dtype=float), float(expected)
+
+def score_matrix(model: LoadedModel, x: np.ndarray, with_shap: bool = True):
+    """
+    Score (+ SHAP nếu with_shap) cho ma trận x, qua cache theo bin ngưỡng (xem TreeEnsemble.bin_keys).
+    Chỉ các dòng miss mới đi qua predict/SHAP. Trả về (scores, shap (n, n_features) | None, expected_value | None).
+    Khi có challenger, cùng ma trận x được gửi sang shadow (không chờ kết quả).
+    """
+    result = _score_matrix(model, x, with_shap)
+    if shadow is not None:
+        shadow.submit(model, x, result[0], with_shap)
+    return result
+
+def _score_matrix(model: LoadedModel, x: np.ndarray, with_shap: bool):
+    response_cache = model.cache
+    if not response_cache.enabled:
+        with STAGE_SECONDS.time("predict"):
+            scores = model.predict_proba(x)
+        if not with_shap:
+            return scores, None, None
+        try:
+            shap_values, expected_value = shap_matrix(model, x)
+        except ExplainerUnavailable:
+            return scores, None, None
+        return scores, shap_values, expected_value
+
+    keys = [row.tobytes() for row in model.engine.bin_keys(x)]
+    scores = np.empty(len(x), dtype=float)
+    shap_values = np.empty((len(x), len(FEATURE_ORDER)), dtype=float) if with_shap else None
+    expected_value = None
+    miss: List[int] = []
+    # Kết quả cache từ request explain=none không có SHAP -> là miss (cả trong bộ đếm) nếu cần SHAP
+    usable = (lambda cached: cached[1] is not None) if with_shap else None
+    for i, key in enumerate(keys):
+        hit = response_cache.get(key, usable)
+        if hit is None:
+            miss.append(i)
+            continue
+        scores[i] = hit[0]
+        if with_shap:
+            shap_values[i], expected_value = hit[1], hit[2]
+    if miss:
+        x_miss = x[miss]
+        with STAGE_SECONDS.time("predict"):
+            miss_scores = model.predict_proba(x_miss)
+        miss_shap = None
+        if with_shap:
+            try:
+                miss_shap, expected_value = shap_matrix(model, x_miss)
+            except ExplainerUnavailable:
+                # Chưa có SHAP: vẫn trả score cho cả batch, bỏ phần giải thích
+                with_shap, shap_values, expected_value = False, None, None
+        for j, i in enumerate(miss):
+            scores[i] = miss_scores[j]
+            if with_shap:
+                shap_values[i] = miss_shap[j]
+            response_cache.put(
+                keys[i], (float(miss_scores[j]), None if miss_shap is None else miss_shap[j], expected_value)
+            )
+    return scores, shap_values, expected_value
+
+def build_response(
+    model: LoadedModel,
+    score: float,
+    shap_row: Optional[np.ndarray],
+    expected_value: Optional[float],
+    thr: float,
+    explain: ExplainLevel = ExplainLevel.full,
+    top_k: int = DEFAULT_TOP_K,
+) -> Dict[str, Any]:
+    """
+    Ghép kết quả một hồ sơ: quyết định (EN/VI) + SHAP theo mức explain. Trả dict đúng dạng
+    PredictResponse (bỏ trường None) để serialize thẳng, không dựng lại model pydantic.
+    """
+    # FIXED: Model predicts default probability, so low score = low risk = approve
+    approved = score < thr   # score thấp = rủi ro thấp -> duyệt
+    response: Dict[str, Any] = {
+        "score": score,
+        "approved": approved,
+        "decision_en": "APPROVED" if approved else "REJECTED",
+        "decision_vi": "ĐƯỢC VAY" if approved else "KHÔNG ĐƯỢC VAY",
+        "threshold": thr,
+        "model_version": model.version,
+        "note_vi": NOTE_VI,
+    }
+    if explain == ExplainLevel.none:
+        return response
+    if shap_row is None:
+        # Explainer chưa sẵn sàng: vẫn trả quyết định, báo trạng thái thay cho SHAP
+        response["explain_status"] = model.explainer_loader.status
+        return response
+    order = range(len(FEATURE_ORDER))
+    if explain == ExplainLevel.topk:
+        # Giữ top_k feature có |SHAP| lớn nhất, theo thứ tự giảm dần
+        order = np.argsort(-np.abs(shap_row), kind="stable")[:top_k]
+    response["shap"] = {FEATURE_ORDER[i]: float(shap_row[i]) for i in order}
+    response["shap_bias"] = expected_value
+    response["shap_sum_check"] = float(np.sum(shap_row) + expected_value)
+    return response
+
+def to_matrix(apps: List[CreditApplication]) -> np.ndarray:
+    """Ghép các hồ sơ đã chuẩn hoá thành ma trận theo đúng thứ tự cột của model."""
+    return np.array([[getattr(a, f) for f in FEATURE_ORDER] for a in apps], dtype=float)
+
+def predict_one(model: LoadedModel, payload: CreditApplication, explain: ExplainLevel, top_k: int) -> Dict[str, Any]:
+    """Phần tính toán của /predict (chạy trong scoring_executor)."""
+    # 1) Chuẩn hoá input theo đúng thứ tự cột của model
+    x = to_matrix([payload])
+
+    # 2) Dự đoán xác suất + 3) Tính SHAP (TreeSHAP, giống như shap.TreeExplainer; bỏ qua khi explain=none)
+    with_shap = explain != ExplainLevel.none
+    scores, shap_values, expected_value = score_matrix(model, x, with_shap=with_shap)
+
+    # 4) Quyết định + 5) Trả kết quả (kèm SHAP)
+    shap_row = shap_values[0] if shap_values is not None else None
+    return build_response(model, float(scores[0]), shap_row, expected_value, get_threshold(), explain, top_k)
+
+@app.post(
+    "/predict",
+    response_model=PredictResponse,
+    response_model_exclude_none=True,
+    openapi_extra=_json_body_schema(CreditApplication),
+)
+async def predict(
+    request: Request,
+    explain: ExplainLevel = Query(ExplainLevel.full, description=EXPLAIN_DESCRIPTION),
+    top_k: int = Query(DEFAULT_TOP_K, ge=1, le=len(FEATURE_ORDER)),
+):
+    # Body CreditApplication được đọc tay để đo riêng parse / validate / serialize
+    timing = metrics.start_request_timing()
+    raw = await read_body(request, "/predict")
+    payload = validate_body(CreditApplication, raw, "/predict")
+    model = registry.current
+    try:
+        if micro_batcher is None:
+            BATCH_SIZE.observe(1, "predict")
+            result = await scoring_executor.run(predict_one, model, payload, explain, top_k)
+        else:
+            # Gom với các request đồng thời khác (cùng phiên bản model) thành một ma trận
+            with_shap = explain != ExplainLevel.none
+            score, shap_row, expected_value, batch_stages = await micro_batcher.submit(
+                to_matrix([payload])[0], with_shap, model
+            )
+            timing.merge(batch_stages)
+            result = build_response(model, score, shap_row, expected_value, get_threshold(), explain, top_k)
+    except Exception as e:
+        ERRORS.inc("/predict", "inference")
+        raise HTTPException(status_code=400, detail=f"Lỗi suy luận: {e}")
+    response = encoded_response(request, result, timing)
+    REQUEST_SECONDS.observe(timing.elapsed(), "/predict")
+    slow_requests.maybe_record(
+        "/predict", timing, raw, {"explain": explain.value, "top_k": top_k}, model.version
+    )
+    return response
+
+def decide_one(model: LoadedModel, payload: CreditApplication) -> Dict[str, Any]:
+    """Phần tính toán của /predict/decision: chỉ quyết định, dừng sớm khi các cây còn lại không đổi được kết quả."""
+    thr = get_threshold()
+    with STAGE_SECONDS.time("predict"):
+        approved, evaluated, scores = model.predict_decision(to_matrix([payload]), thr)
+    ok = bool(approved[0])
+    result: Dict[str, Any] = {
+        "approved": ok,
+        "decision_en": "APPROVED" if ok else "REJECTED",
+        "decision_vi": "ĐƯỢC VAY" if ok else "KHÔNG ĐƯỢC VAY",
+        "threshold": thr,
+        "model_version": model.version,
+        "trees_evaluated": int(evaluated[0]),
+        "num_trees": model.engine.num_trees,
+    }
+    if not np.isnan(scores[0]):
+        result["score"] = float(scores[0])
+    result["note_vi"] = NOTE_VI
+    return result
 
-@app.post("/predict", response_model=PredictResponse)
-def predict(payload: CreditApplication):
+@app.post(
+    "/predict/decision",
+    response_model=DecisionResponse,
+    response_model_exclude_none=True,
+    openapi_extra=_json_body_schema(CreditApplication),
+)
+async def predict_decision(request: Request):
+    """
+    Chỉ trả approved (score < threshold), không SHAP, không qua cache/micro-batch: duyệt cây theo thứ tự
+    và dừng khi tổng lá lớn nhất / nhỏ nhất của các cây còn lại không thể vượt logit(threshold).
+    """
+    timing = metrics.start_request_timing()
+    raw = await read_body(request, "/predict/decision")
+    payload = validate_body(CreditApplication, raw, "/predict/decision")
+    model = registry.current
     try:
-        # 1) Chuẩn hoá input theo đúng thứ tự cột của model
-        x = np.array([[getattr(payload, f) for f in FEATURE_ORDER]], dtype=float)
-
-        # 2) Dự đoán xác suất
-        score = float(booster.predict(x)[0])
-
-        # 3) Tính SHAP với TreeExplainer (giống như trong Python)
-        shap_values = explainer.shap_values(x)[0]  # Get first (and only) sample
-        expected_value = float(explainer.expected_value)
-        
-        # Create feature-SHAP dictionary
-        shap_map = {FEATURE_ORDER[i]: float(shap_values[i]) for i in range(len(FEATURE_ORDER))}
-        shap_bias = expected_value
-        shap_sum_check = float(np.sum(shap_values) + expected_value)
-
-        # 4) Quyết định
-        thr = get_threshold()
-        # FIXED: Model predicts default probability, so low score = low risk = approve
-        approved = score < thr   # score thấp = rủi ro thấp -> duyệt
-        decision_en = "APPROVED" if approved else "REJECTED"
-        decision_vi = "ĐƯỢC VAY" if approved else "KHÔNG ĐƯỢC VAY"
-
-        # 5) Trả kết quả (kèm SHAP)
-        return PredictResponse(
-            score=score,
-            approved=approved,
-            decision_en=decision_en,
-            decision_vi=decision_vi,
-            threshold=thr,
-            shap=shap_map,
-            shap_bias=shap_bias,
-            shap_sum_check=shap_sum_check,
+        result = await scoring_executor.run(decide_one, model, payload)
+    except Exception as e:
+        ERRORS.inc("/predict/decision", "inference")
+        raise HTTPException(status_code=400, detail=f"Lỗi suy luận: {e}")
+    TREES_EVALUATED.observe(result["trees_evaluated"])
+    response = encoded_response(request, result, timing)
+    REQUEST_SECONDS.observe(timing.elapsed(), "/predict/decision")
+    slow_requests.maybe_record("/predict/decision", timing, raw, {}, model.version)
+    return response
+
+def _whatif_variants(payload: WhatIfRequest, base_x: np.ndarray):
+    """
+    changes + sweep -> (ma trận biến thể, phần thay đổi đã chuẩn hoá theo dòng, mask dòng lỗi, lỗi theo dòng).
+    Feature lạ trả 422; giá trị sai chỉ làm hỏng dòng đó.
+    """
+    variants = list(payload.changes)
+    if payload.sweep is not None:
+        variants += [{payload.sweep.feature: v} for v in payload.sweep.values]
+    unknown = sorted({f for v in variants for f in v if f not in FEATURE_ORDER})
+    if unknown:
+        ERRORS.inc("/predict/whatif", "validation")
+        raise RequestValidationError([{
+            "type": "value_error",
+            "loc": ("body", "changes"),
+            "msg": f"Value error, feature không tồn tại: {', '.join(unknown)} (cần một trong {', '.join(FEATURE_ORDER)})",
+            "input": unknown,
+            "ctx": {"error": {}},
+        }])
+    with STAGE_SECONDS.time("validate"):
+        x = np.repeat(base_x, len(variants), axis=0)
+        normalized: List[Dict[str, Any]] = [{} for _ in variants]
+        bad = np.zeros(len(variants), dtype=bool)
+        errors: Dict[int, str] = {}
+        for j, f in enumerate(FEATURE_ORDER):
+            rows = [i for i, v in enumerate(variants) if f in v]
+            if not rows:
+                continue
+            col = normalize_column(f, [variants[i][f] for i in rows])
+            x[rows, j] = col.values
+            for k, i in enumerate(rows):
+                if col.error_mask[k]:
+                    bad[i] = True
+                    errors[i] = f"{errors[i]}; {col.errors[k]}" if i in errors else col.errors[k]
+                else:
+                    normalized[i][f] = float(col.values[k])
+    return x, normalized, bad, errors
+
+def whatif_job(
+    model: LoadedModel, base_x: np.ndarray, x: np.ndarray, normalized: List[Dict[str, Any]], bad: np.ndarray, errors: Dict[int, str]
+) -> Dict[str, Any]:
+    """Phần tính toán của /predict/whatif: chấm lại các biến thể chỉ trên các cây bị ảnh hưởng."""
+    thr = get_threshold()
+    ok = np.flatnonzero(~bad)
+    with STAGE_SECONDS.time("predict"):
+        base_score, scores, evaluated, cached = model.rescore(base_x, x[ok])
+    results: List[Dict[str, Any]] = []
+    for i, changes in enumerate(normalized):
+        item: Dict[str, Any] = {"index": i, "changes": changes}
+        if i in errors:
+            item["error"] = f"Dữ liệu không hợp lệ: {errors[i]}"
+        results.append(item)
+    for row, i in enumerate(ok.tolist()):
+        score = float(scores[row])
+        results[i].update({
+            "score": score,
+            "approved": score < thr,
+            "decision_en": "APPROVED" if score < thr else "REJECTED",
+            "trees_evaluated": int(evaluated[row]),
+        })
+    return {
+        "model_version": model.version,
+        "threshold": thr,
+        "num_trees": model.engine.num_trees,
+        "base": {
+            "score": base_score,
+            "approved": base_score < thr,
+            "decision_en": "APPROVED" if base_score < thr else "REJECTED",
+            "cached": cached,
+        },
+        "count": len(results),
+        "failed": len(errors),
+        "results": results,
+    }
+
+@app.post(
+    "/predict/whatif",
+    response_model=WhatIfResponse,
+    response_model_exclude_none=True,
+    openapi_extra=_json_body_schema(WhatIfRequest),
+)
+async def predict_whatif(request: Request):
+    """
+    Chấm các biến thể của một hồ sơ (kéo thanh trượt, quét độ nhạy một feature). Lá từng cây của
+    hồ sơ gốc được giữ lại (WHATIF_CACHE_SIZE); mỗi biến thể chỉ duyệt lại các cây có tách theo
+    feature đã đổi mà giá trị mới rơi ra ngoài lá cũ, score trùng từng bit với /predict.
+    """
+    timing = metrics.start_request_timing()
+    raw = await read_body(request, "/predict/whatif")
+    payload = validate_body(WhatIfRequest, raw, "/predict/whatif")
+    base_x = to_matrix([payload.application])
+    x, normalized, bad, errors = _whatif_variants(payload, base_x)
+    max_size = get_batch_max_size()
+    if len(x) > max_size:
+        raise HTTPException(status_code=413, detail=f"Tối đa {max_size} biến thể, nhận được {len(x)}")
+    model = registry.current
+    BATCH_SIZE.observe(len(x), "whatif")
+    try:
+        result = await scoring_executor.run(whatif_job, model, base_x, x, normalized, bad, errors)
+    except Exception as e:
+        ERRORS.inc("/predict/whatif", "inference")
+        raise HTTPException(status_code=400, detail=f"Lỗi suy luận: {e}")
+    if errors:
+        ERRORS.inc("/predict/whatif", "row", amount=len(errors))
+    response = encoded_response(request, result, timing, compress=True)
+    REQUEST_SECONDS.observe(timing.elapsed(), "/predict/whatif")
+    slow_requests.maybe_record("/predict/whatif", timing, raw, {}, model.version)
+    return response
+
+def counterfactual_job(model: LoadedModel, payload: CounterfactualRequest, features: List[str]) -> Dict[str, Any]:
+    """Phần tính toán của /counterfactual."""
+    thr = get_threshold()
+    x = to_matrix([payload.application])[0]
+    with STAGE_SECONDS.time("predict"):
+        score, found = model.counterfactual(
+            x, thr, features=features, max_features=payload.max_features, monotone=payload.monotone
         )
+    current = dict(zip(FEATURE_ORDER, x.tolist()))
+    changes = [counterfactual.change_record(f, current[f], v) for f, v in found["changes"].items()]
+    result: Dict[str, Any] = {
+        "model_version": model.version,
+        "threshold": thr,
+        "score": score,
+        "approved": score < thr,
+        "found": found["found"],
+        "changes": changes,
+        "single_feature": {
+            f: None if opt is None else {"change": counterfactual.change_record(f, current[f], opt["value"]), "score": opt["score"]}
+            for f, opt in found.get("single_feature", {}).items()
+        },
+        "candidates_evaluated": found["candidates_evaluated"],
+        "exhaustive": found.get("exhaustive", True),
+        # Chế độ hai hướng (monotone=false) chỉ để chẩn đoán model, không thành lời khuyên
+        "advice_vi": counterfactual.advice_vi(changes) if payload.monotone else [],
+    }
+    if found["found"]:
+        result["new_score"] = found["score"]
+        result["cost"] = found["cost"]
+    return result
+
+@app.post(
+    "/counterfactual",
+    response_model=CounterfactualResponse,
+    response_model_exclude_none=True,
+    openapi_extra=_json_body_schema(CounterfactualRequest),
+)
+async def counterfactual_endpoint(request: Request):
+    """
+    Hồ sơ bị từ chối: thay đổi nhỏ nhất (tổng % thay đổi) trên các feature cho phép để được duyệt.
+    Chỉ thử một giá trị cho mỗi bin giữa các ngưỡng tách của model (trong một bin score không đổi),
+    chấm theo lô bằng TreeEnsemble.rescore; score mới trùng từng bit với /predict.
+    Mặc định chỉ đi theo hướng hành động được; monotone=false là chế độ chẩn đoán, advice_vi luôn rỗng.
+    """
+    timing = metrics.start_request_timing()
+    raw = await read_body(request, "/counterfactual")
+    payload = validate_body(CounterfactualRequest, raw, "/counterfactual")
+    features = list(dict.fromkeys(payload.features))
+    # Chỉ các feature người vay thay đổi được (không tuổi, không feature phân loại), kể cả khi monotone=false
+    unknown = [f for f in features if f not in counterfactual.ACTIONABLE_FEATURES]
+    if unknown or not features:
+        ERRORS.inc("/counterfactual", "validation")
+        raise RequestValidationError([{
+            "type": "value_error",
+            "loc": ("body", "features"),
+            "msg": f"Value error, cần một hoặc nhiều feature trong {', '.join(counterfactual.ACTIONABLE_FEATURES)}",
+            "input": payload.features,
+            "ctx": {"error": {}},
+        }])
+    model = registry.current
+    try:
+        result = await scoring_executor.run(counterfactual_job, model, payload, features)
     except Exception as e:
+        ERRORS.inc("/counterfactual", "inference")
         raise HTTPException(status_code=400, detail=f"Lỗi suy luận: {e}")
+    response = encoded_response(request, result, timing)
+    REQUEST_SECONDS.observe(timing.elapsed(), "/counterfactual")
+    slow_requests.maybe_record("/counterfactual", timing, raw, {}, model.version)
+    return response
+
+def _vector_row(raw: List[Any]) -> List[float]:
+    """Một vector đã mã hoá sẵn (8 số theo FEATURE_ORDER), như LoanForecastRequest.features."""
+    if len(raw) != len(FEATURE_ORDER):
+        raise ValueError(f"Vector cần {len(FEATURE_ORDER)} giá trị theo FEATURE_ORDER, nhận được {len(raw)}")
+    return [float(v) for v in raw]
+
+def _fill_results(
+    model: LoadedModel,
+    items: List[Dict[str, Any]],
+    x: np.ndarray,
+    valid_pos: List[int],
+    explain: ExplainLevel,
+    top_k: int,
+) -> None:
+    """Một lần predict + một lần tính SHAP cho cả ma trận các dòng hợp lệ."""
+    with_shap = explain != ExplainLevel.none
+    scores, shap_values, expected_value = score_matrix(model, x, with_shap=with_shap)
+
+    thr = get_threshold()
+    for row, pos in enumerate(valid_pos):
+        shap_row = shap_values[row] if shap_values is not None else None
+        items[pos]["result"] = build_response(model, float(scores[row]), shap_row, expected_value, thr, explain, top_k)
+
+def score_records(
+    model: LoadedModel,
+    records: List[Any],
+    start_index: int = 0,
+    explain: ExplainLevel = ExplainLevel.full,
+    top_k: int = DEFAULT_TOP_K,
+) -> List[Dict[str, Any]]:
+    """
+    Chấm điểm một nhóm hồ sơ thô (dict, hoặc list = vector đã mã hoá). Hồ sơ lỗi
+    được báo tại dòng đó; các hồ sơ hợp lệ dùng chung một lần predict + một lần tính SHAP.
+    """
+    # 1) Chuẩn hoá từng hồ sơ; hồ sơ lỗi được báo ngay tại dòng đó, không làm hỏng cả batch
+    items: List[Dict[str, Any]] = []
+    valid_pos: List[int] = []
+    rows: List[List[float]] = []
+    for pos, raw in enumerate(records):
+        if isinstance(raw, ValueError):
+            # Dòng NDJSON không parse được (xem /predict/stream)
+            items.append({"index": start_index + pos, "error": f"JSON không hợp lệ: {raw}"})
+            continue
+        try:
+            with STAGE_SECONDS.time("validate"):
+                if isinstance(raw, list):
+                    rows.append(_vector_row(raw))
+                else:
+                    app_ = CreditApplication.model_validate(raw)
+                    rows.append([getattr(app_, f) for f in FEATURE_ORDER])
+            valid_pos.append(pos)
+            items.append({"index": start_index + pos})
+        except ValidationError as e:
+            items.append({"index": start_index + pos, "error": f"Dữ liệu không hợp lệ: {e.errors(include_url=False)}"})
+        except (TypeError, ValueError) as e:
+            items.append({"index": start_index + pos, "error": f"Dữ liệu không hợp lệ: {e}"})
+
+    if rows:
+        # 2) Một lần predict + một lần tính SHAP cho cả ma trận
+        _fill_results(model, items, np.array(rows, dtype=float), valid_pos, explain, top_k)
+    return items
+
+def score_normalized(
+    model: LoadedModel,
+    x: np.ndarray,
+    bad: np.ndarray,
+    errors: Dict[int, str],
+    explain: ExplainLevel = ExplainLevel.full,
+    top_k: int = DEFAULT_TOP_K,
+) -> List[Dict[str, Any]]:
+    """Ma trận đã chuẩn hoá + mask dòng lỗi: dòng lỗi báo tại chỗ, các dòng còn lại chấm một lần."""
+    items: List[Dict[str, Any]] = [{"index": i} for i in range(len(x))]
+    for i, message in errors.items():
+        items[i]["error"] = f"Dữ liệu không hợp lệ: {message}"
+    valid_pos = np.flatnonzero(~bad)
+    if len(valid_pos):
+        _fill_results(model, items, x[valid_pos] if bad.any() else x, valid_pos.tolist(), explain, top_k)
+    return items
+
+def _normalize_columns(columns: Dict[str, List[Any]]):
+    """Dạng cột -> (ma trận, mask dòng lỗi, thông báo lỗi theo dòng), không validate từng hồ sơ."""
+    with STAGE_SECONDS.time("validate"):
+        normalized = [normalize_column(f, columns[f]) for f in FEATURE_ORDER]
+        x = np.column_stack([col.values for col in normalized])
+        bad = np.logical_or.reduce([col.error_mask for col in normalized])
+        errors = {
+            i: "; ".join(col.errors[i] for col in normalized if i in col.errors)
+            for i in np.flatnonzero(bad).tolist()
+        }
+    return x, bad, errors
+
+def score_columns(
+    model: LoadedModel,
+    columns: Dict[str, List[Any]],
+    explain: ExplainLevel = ExplainLevel.full,
+    top_k: int = DEFAULT_TOP_K,
+) -> List[Dict[str, Any]]:
+    """Dạng cột: chuẩn hoá từng cột rồi chấm cả ma trận."""
+    return score_normalized(model, *_normalize_columns(columns), explain, top_k)
+
+def score_features(
+    model: LoadedModel,
+    x: np.ndarray,
+    explain: ExplainLevel = ExplainLevel.full,
+    top_k: int = DEFAULT_TOP_K,
+) -> List[Dict[str, Any]]:
+    """Ma trận đã mã hoá sẵn: đi thẳng vào model."""
+    return score_normalized(model, x, np.zeros(len(x), dtype=bool), {}, explain, top_k)
+
+def score_arrow(
+    model: LoadedModel,
+    x: np.ndarray,
+    bad: np.ndarray,
+    errors: Dict[int, str],
+    explain: ExplainLevel = ExplainLevel.full,
+    top_k: int = DEFAULT_TOP_K,
+) -> bytes:
+    """Như score_normalized nhưng trả thẳng Arrow IPC theo cột, không dựng đối tượng kết quả từng dòng."""
+    n = len(x)
+    scores = np.full(n, np.nan)
+    shap_full, expected_value, explain_status = None, None, None
+    valid_pos = np.flatnonzero(~bad)
+    if len(valid_pos):
+        with_shap = explain != ExplainLevel.none
+        valid_scores, shap_values, expected_value = score_matrix(model, x[valid_pos] if bad.any() else x, with_shap)
+        scores[valid_pos] = valid_scores
+        if shap_values is not None:
+            shap_full = np.full((n, len(FEATURE_ORDER)), np.nan)
+            shap_full[valid_pos] = shap_values
+            if explain == ExplainLevel.topk:
+                # Chỉ giữ top_k ô |SHAP| lớn nhất mỗi dòng, các ô khác ghi null
+                drop = np.argsort(-np.abs(shap_full), axis=1, kind="stable")[:, top_k:]
+                np.put_along_axis(shap_full, drop, np.nan, axis=1)
+        elif with_shap:
+            explain_status = model.explainer_loader.status
+    row_errors: List[Optional[str]] = [None] * n
+    for i, message in errors.items():
+        row_errors[i] = f"Dữ liệu không hợp lệ: {message}"
+    with STAGE_SECONDS.time("serialize"):
+        return arrow_io.write_results(
+            scores, row_errors, get_threshold(), model.version, FEATURE_ORDER,
+            shap_full, expected_value, explain_status,
+        )
+
+def _columns_body(raw: dict, endpoint: str) -> Dict[str, List[Any]]:
+    """Kiểm tra cấu trúc body dạng cột (đủ feature, cùng độ dài); lỗi trả 422."""
+    columns = validate_body(ColumnarBatchRequest, raw, endpoint).columns
+    errors = [
+        {"type": "missing", "loc": ("body", "columns", f), "msg": "Field required", "input": None}
+        for f in FEATURE_ORDER
+        if f not in columns
+    ]
+    if not errors:
+        lengths = {len(columns[f]) for f in FEATURE_ORDER}
+        if len(lengths) > 1:
+            errors.append({
+                "type": "value_error",
+                "loc": ("body", "columns"),
+                "msg": f"Value error, các cột phải cùng độ dài (nhận được {sorted(lengths)})",
+                "input": {f: len(columns[f]) for f in FEATURE_ORDER},
+                "ctx": {"error": {}},
+            })
+    if errors:
+        ERRORS.inc(endpoint, "validation")
+        raise RequestValidationError(errors)
+    return columns
+
+def _features_body(raw: dict, endpoint: str) -> np.ndarray:
+    """Ma trận n x 8 float64 trực tiếp từ JSON (không qua pydantic); lỗi trả 422."""
+    with STAGE_SECONDS.time("validate"):
+        try:
+            x = np.array(raw["features"], dtype=np.float64)
+            if x.size == 0:
+                x = x.reshape(0, len(FEATURE_ORDER))
+            if x.ndim != 2 or x.shape[1] != len(FEATURE_ORDER):
+                raise ValueError(f"cần ma trận n x {len(FEATURE_ORDER)} theo FEATURE_ORDER, nhận được shape {x.shape}")
+        except (TypeError, ValueError) as e:
+            ERRORS.inc(endpoint, "validation")
+            raise RequestValidationError([{
+                "type": "value_error",
+                "loc": ("body", "features"),
+                "msg": f"Value error, {e}",
+                "input": None,
+                "ctx": {"error": {}},
+            }])
+    return x
+
+def _json_batch_job(raw: Any, model: LoadedModel, explain: ExplainLevel, top_k: int):
+    """Body JSON của /predict/batch -> (số hồ sơ, (hàm chấm, *tham số)) theo dạng body."""
+    if isinstance(raw, dict) and "columns" in raw:
+        columns = _columns_body(raw, "/predict/batch")
+        return len(columns[FEATURE_ORDER[0]]), (score_columns, model, columns, explain, top_k)
+    if isinstance(raw, dict) and "features" in raw:
+        x = _features_body(raw, "/predict/batch")
+        return len(x), (score_features, model, x, explain, top_k)
+    payload = validate_body(BatchPredictRequest, raw, "/predict/batch")
+    return len(payload.applications), (score_records, model, payload.applications, 0, explain, top_k)
+
+@app.post(
+    "/predict/batch",
+    response_model=BatchPredictResponse,
+    response_model_exclude_none=True,
+    openapi_extra=_json_body_schema(
+        BatchPredictRequest, ColumnarBatchRequest, MatrixBatchRequest, binary_types=(arrow_io.ARROW_STREAM,)
+    ),
+)
+async def predict_batch(
+    request: Request,
+    explain: ExplainLevel = Query(ExplainLevel.full, description=EXPLAIN_DESCRIPTION),
+    top_k: int = Query(DEFAULT_TOP_K, ge=1, le=len(FEATURE_ORDER)),
+):
+    """
+    Body một trong bốn dạng:
+    - {"applications": [CreditApplication, ...]}: validate từng hồ sơ;
+    - {"columns": {feature: [...], ...}}: mỗi feature trong FEATURE_ORDER một mảng, chuẩn hoá theo cột;
+    - {"features": [[8 số], ...]}: vector đã mã hoá sẵn theo FEATURE_ORDER, không chuẩn hoá;
+    - Arrow IPC stream (Content-Type: application/vnd.apache.arrow.stream, cần pyarrow): kết quả
+      cũng là Arrow IPC, trừ khi Accept: application/json.
+    """
+    timing = metrics.start_request_timing()
+    model = registry.current
+    arrow_out = False
+    if arrow_io.is_arrow(request.headers.get("content-type")):
+        x, bad, errors = await read_arrow_body(request, "/predict/batch")
+        n = len(x)
+        arrow_out = "application/json" not in request.headers.get("accept", "")
+        job = (score_arrow if arrow_out else score_normalized, model, x, bad, errors, explain, top_k)
+    else:
+        n, job = _json_batch_job(await read_body(request, "/predict/batch"), model, explain, top_k)
+    max_size = get_batch_max_size()
+    if n > max_size:
+        raise HTTPException(status_code=413, detail=f"Batch tối đa {max_size} hồ sơ, nhận được {n}")
+    BATCH_SIZE.observe(n, "batch")
+    try:
+        items = await scoring_executor.run(*job)
+    except Exception as e:
+        ERRORS.inc("/predict/batch", "inference")
+        raise HTTPException(status_code=400, detail=f"Lỗi suy luận: {e}")
+    if arrow_out:
+        if errors:
+            ERRORS.inc("/predict/batch", "row", amount=len(errors))
+        headers = {"Server-Timing": timing.server_timing()} if is_server_timing_enabled() else None
+        REQUEST_SECONDS.observe(timing.elapsed(), "/predict/batch")
+        return Response(items, media_type=arrow_io.ARROW_STREAM, headers=headers)
+    failed = sum(1 for it in items if "error" in it)
+    if failed:
+        ERRORS.inc("/predict/batch", "row", amount=failed)
+    response = encoded_response(
+        request,
+        {"count": len(items), "succeeded": len(items) - failed, "failed": failed, "results": items},
+        timing,
+        compress=True,
+    )
+    REQUEST_SECONDS.observe(timing.elapsed(), "/predict/batch")
+    return response
+
+class NDJSONStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse không chạy listen_for_disconnect song song: body_iterator
+    tự đọc request.stream(), nên không được để task khác "ăn" mất các gói body.
+    Nhờ vậy kết quả được ghi ra trong khi input vẫn đang tới.
+    """
+    media_type = "application/x-ndjson"
+
+    async def __call__(self, scope, receive, send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+async def _iter_ndjson_lines(request: Request) -> AsyncIterator[bytes]:
+    """Tách body thành từng dòng mà không giữ cả body trong bộ nhớ."""
+    buf = b""
+    async for part in request.stream():
+        buf += part
+        *lines, buf = buf.split(b"\n")
+        for line in lines:
+            yield line
+        if len(buf) > STREAM_MAX_LINE_BYTES:
+            raise ValueError(f"Một dòng NDJSON vượt quá {STREAM_MAX_LINE_BYTES} byte")
+    if buf:
+        yield buf
+
+async def _score_chunk_lines(
+    model: LoadedModel, chunk: List[Any], start_index: int, explain: ExplainLevel, top_k: int
+) -> List[bytes]:
+    BATCH_SIZE.observe(len(chunk), "stream")
+    try:
+        items = await scoring_executor.run(score_records, model, chunk, start_index, explain, top_k)
+    except Exception as e:
+        ERRORS.inc("/predict/stream", "inference")
+        items = [{"index": start_index + pos, "error": f"Lỗi suy luận: {e}"} for pos in range(len(chunk))]
+    failed = sum(1 for it in items if "error" in it)
+    if failed:
+        ERRORS.inc("/predict/stream", "row", amount=failed)
+    with STAGE_SECONDS.time("serialize"):
+        return [codec.dumps_json(it) + b"\n" for it in items]
+
+@app.post("/predict/stream", response_class=NDJSONStreamingResponse)
+async def predict_stream(
+    request: Request,
+    explain: ExplainLevel = Query(ExplainLevel.full, description=EXPLAIN_DESCRIPTION),
+    top_k: int = Query(DEFAULT_TOP_K, ge=1, le=len(FEATURE_ORDER)),
+):
+    """
+    Body: NDJSON, mỗi dòng một CreditApplication (hoặc một mảng 8 số đã mã hoá
+    theo FEATURE_ORDER). Kết quả: NDJSON, mỗi dòng một
+    BatchPredictItem theo đúng thứ tự. Bộ nhớ chỉ phụ thuộc kích thước chunk.
+    """
+    chunk_size = get_stream_chunk_size()
+    # Cả stream dùng một phiên bản model
+    model = registry.current
+
+    async def results() -> AsyncIterator[bytes]:
+        started = time.perf_counter()
+        chunk: List[Any] = []
+        start_index = index = 0
+        try:
+            async for line in _iter_ndjson_lines(request):
+                if not line.strip():
+                    continue
+                try:
+                    with STAGE_SECONDS.time("parse"):
+                        chunk.append(codec.loads_json(line))
+                except ValueError as e:
+                    # Dòng không phải JSON: vẫn giữ chỗ để index khớp với input
+                    chunk.append(e)
+                index += 1
+                if len(chunk) >= chunk_size:
+                    for out in await _score_chunk_lines(model, chunk, start_index, explain, top_k):
+                        yield out
+                    chunk, start_index = [], index
+        except ValueError as e:
+            yield codec.dumps_json({"index": index, "error": f"Lỗi đọc stream: {e}"}) + b"\n"
+        if chunk:
+            for out in await _score_chunk_lines(model, chunk, start_index, explain, top_k):
+                yield out
+        REQUEST_SECONDS.observe(time.perf_counter() - started, "/predict/stream")
+
+    return NDJSONStreamingResponse(results())
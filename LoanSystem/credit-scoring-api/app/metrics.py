@@ -0,0 +1,208 @@
+# app/metrics.py
+"""
+Metrics dạng Prometheus text (exposition format 0.0.4), không phụ thuộc thư viện ngoài.
+
+Mỗi lần observe chỉ tốn một bisect + một lock ngắn nên có thể bật thường trực.
+Số liệu tính theo process (chế độ process executor / pre-fork: mỗi process một bộ).
+Thời gian các bước của STAGE_SECONDS đồng thời được cộng vào RequestTiming của request
+hiện tại (contextvar) để dựng header Server-Timing.
+"""
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Bucket thời gian (giây) cho các bước xử lý: 50 µs .. 5 s
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# Bucket kích thước batch (số hồ sơ)
+SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _fmt(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class RequestTiming:
+    """Thời gian từng bước (giây) của một request."""
+    __slots__ = ("started", "stages")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def merge(self, stages: Dict[str, float]) -> None:
+        for stage, seconds in stages.items():
+            self.add(stage, seconds)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def breakdown_ms(self) -> Dict[str, float]:
+        return {stage: seconds * 1e3 for stage, seconds in self.stages.items()}
+
+    def server_timing(self) -> str:
+        """Giá trị header Server-Timing: parse;dur=0.041, validate;dur=0.120, ..., total;dur=..."""
+        parts = [f"{stage};dur={seconds * 1e3:.3f}" for stage, seconds in self.stages.items()]
+        parts.append(f"total;dur={self.elapsed() * 1e3:.3f}")
+        return ", ".join(parts)
+
+_request_timing: "contextvars.ContextVar[Optional[RequestTiming]]" = contextvars.ContextVar("request_timing", default=None)
+
+def start_request_timing() -> RequestTiming:
+    """Bắt đầu đo cho request (hoặc đợt micro-batch) trong context hiện tại."""
+    timing = RequestTiming()
+    _request_timing.set(timing)
+    return timing
+
+def current_request_timing() -> Optional[RequestTiming]:
+    return _request_timing.get()
+
+class _Timer:
+    __slots__ = ("_hist", "_labels", "_start")
+
+    def __init__(self, hist: "Histogram", labels: Tuple[str, ...]):
+        self._hist = hist
+        self._labels = labels
+
+    def __enter__(self) -> "_Timer":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        elapsed = time.perf_counter() - self._start
+        self._hist.observe(elapsed, *self._labels)
+        if self._hist.per_request:
+            timing = _request_timing.get()
+            if timing is not None:
+                timing.add(self._labels[0], elapsed)
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+        per_request: bool = False,
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # True: time(label) cũng cộng vào RequestTiming hiện tại (nhãn đầu tiên là tên bước)
+        self.per_request = per_request
+        self._lock = threading.Lock()
+        # labels -> [đếm theo bucket (không cộng dồn, phần tử cuối là +Inf), tổng, số lần]
+        self._series: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, *labels: str) -> _Timer:
+        """with HIST.time("parse"): ... — đo thời gian khối lệnh."""
+        return _Timer(self, labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(k, list(v[0]), v[1], v[2]) for k, v in sorted(self._series.items())]
+        for labels, counts, total, count in snapshot:
+            cumulative = 0
+            for bound, c in zip(self.buckets + (float("inf"),), counts):
+                cumulative += c
+                le = 'le="' + _fmt(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_fmt(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return lines
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            snapshot = sorted(self._values.items())
+        for labels, value in snapshot:
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_fmt(value)}")
+        return lines
+
+def sample_lines(name: str, kind: str, help: str, samples: Iterable[Tuple[Dict[str, str], float]]) -> List[str]:
+    """Các dòng cho một metric đọc từ trạng thái có sẵn (counter/gauge của cache, executor...)."""
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        lines.append(f"{name}{_labels(tuple(labels), tuple(labels.values()))} {_fmt(value)}")
+    return lines
+
+STAGE_SECONDS = Histogram(
+    "credit_scoring_stage_seconds",
+    "Thời gian từng bước xử lý (parse, validate, predict, shap, serialize)",
+    ("stage",),
+    per_request=True,
+)
+REQUEST_SECONDS = Histogram(
+    "credit_scoring_request_seconds",
+    "Tổng thời gian xử lý request theo endpoint",
+    ("endpoint",),
+)
+BATCH_SIZE = Histogram(
+    "credit_scoring_batch_size",
+    "Số hồ sơ chấm điểm trong một lần gọi model (theo nguồn: predict, batch, stream, microbatch, whatif)",
+    ("source",),
+    buckets=SIZE_BUCKETS,
+)
+TREES_EVALUATED = Histogram(
+    "credit_scoring_trees_evaluated",
+    "Số cây phải duyệt trước khi quyết định chắc chắn (/predict/decision, dừng sớm)",
+    buckets=(1, 5, 10, 20, 30, 40, 50, 60, 70, 80, 90, 100, 200, 500, 1000),
+)
+ERRORS = Counter(
+    "credit_scoring_errors_total",
+    "Số lỗi theo endpoint và loại (parse, validation, inference, row)",
+    ("endpoint", "kind"),
+)
+
+_collectors: List[Callable[[], List[str]]] = []
+
+def register_collector(collect: Callable[[], List[str]]) -> None:
+    """Hàm trả về các dòng metric đọc từ trạng thái hiện tại, gọi mỗi lần /metrics được scrape."""
+    _collectors.append(collect)
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in (REQUEST_SECONDS, STAGE_SECONDS, BATCH_SIZE, TREES_EVALUATED, ERRORS):
+        lines.extend(metric.render())
+    for collect in _collectors:
+        lines.extend(collect())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,312 @@
+# app/registry.py
+"""
+Registry model có phiên bản, hỗ trợ hot reload không downtime.
+
+Mỗi LoadedModel gói mọi thứ của một phiên bản model (engine, Booster, explainer,
+cache kết quả). Request lấy registry.current một lần rồi dùng suốt, nên khi model
+mới được hoán đổi, request đang chạy vẫn hoàn tất trên phiên bản cũ. Model mới
+được nạp và warm-up (explainer sẵn sàng) ngoài luồng request rồi mới hoán đổi.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from lightgbm import Booster
+
+from . import counterfactual
+from .artifact import CompiledModel, load_compiled, load_existing
+from .files import file_sha256
+from .cache import LRUCache
+from .codegen import load_scorer
+from .engine import SpecializedEnsemble, TreeEnsemble
+from .utils import (
+    CATEGORICAL_VALUES,
+    get_artifact_dir,
+    get_cache_size,
+    get_codegen_max_rows,
+    get_scoring_engine,
+    get_shap_engine,
+    get_whatif_cache_size,
+)
+from .warmup import BackgroundLoader
+
+logger = logging.getLogger("app.registry")
+
+# Số phiên bản cũ giữ lại để giải mã LoadedModel gửi sang process executor
+RECENT_VERSIONS = 2
+
+def model_version(sha256: str) -> str:
+    """Phiên bản model = tiền tố checksum (vừa cột inference_runs.model_version VARCHAR(32))."""
+    return f"lgbm-{sha256[:12]}"
+
+class LoadedModel:
+    """Một phiên bản model đã nạp: engine numpy, Booster (khi cần), explainer, cache riêng."""
+
+    def __init__(self, path: str, sha256: str, engine: TreeEnsemble, booster: Optional[Booster], compiled: Optional[CompiledModel]):
+        self.path = path
+        self.sha256 = sha256
+        self.version = model_version(sha256)
+        self.engine = engine
+        self.booster = booster
+        self.compiled = compiled
+        # SCORING_ENGINE=specialized: cắt tỉa sẵn theo các tổ hợp feature phân loại (SHAP vẫn trên ensemble đầy đủ)
+        self.specialized = (
+            SpecializedEnsemble.from_feature_values(engine, CATEGORICAL_VALUES)
+            if get_scoring_engine() == "specialized"
+            else None
+        )
+        # SCORING_ENGINE=codegen: module Python sinh sẵn (cache trên đĩa theo checksum) cho batch nhỏ
+        self.scorer = (
+            load_scorer(path, sha256, engine, get_artifact_dir()) if get_scoring_engine() == "codegen" else None
+        )
+        self.loaded_at = time.time()
+        # Cache theo bin ngưỡng gắn với phiên bản: model đổi thì cache cũ bị bỏ cùng model
+        self.cache = LRUCache(get_cache_size())
+        # Hồ sơ đã chuẩn hoá -> lá từng cây, để các lần chỉnh sửa sau chỉ duyệt lại cây bị ảnh hưởng
+        self.leaf_cache = LRUCache(get_whatif_cache_size())
+        # SHAP sẵn sàng ngay nếu artifact đã có; nếu không thì dựng trên thread nền
+        if compiled is not None and get_shap_engine() == "numpy":
+            self.explainer_loader = BackgroundLoader.completed("explainer", compiled.explainer)
+        else:
+            self.explainer_loader = BackgroundLoader("explainer", self._build_explainer)
+
+    @classmethod
+    def load(cls, path: str, expected_sha256: Optional[str] = None) -> "LoadedModel":
+        """
+        Nạp model từ path. expected_sha256: phiên bản bắt buộc (vd. process con giải mã LoadedModel);
+        file đã đổi nội dung thì ném lỗi thay vì chấm bằng model khác phiên bản được báo.
+        """
+        try:
+            # Engine numpy + bảng TreeSHAP được memory-map từ artifact nhị phân nếu đã biên dịch cho model này
+            compiled = load_existing(path, get_artifact_dir())
+            # Booster chỉ cần khi chấm điểm bằng LightGBM hoặc SHAP bằng shap.TreeExplainer;
+            # chế độ pre-fork (MODEL_SHARED=1) không bao giờ nạp
+            needs_booster = get_scoring_engine() == "lightgbm" or get_shap_engine() == "shap"
+            # Đọc file một lần: checksum, engine và Booster luôn cùng một nội dung
+            text = None
+            if compiled is None or needs_booster:
+                data = Path(path).read_bytes()
+                text_sha256 = hashlib.sha256(data).hexdigest()
+                text = data.decode("utf-8")
+            if compiled is not None:
+                engine, sha256 = compiled.engine, compiled.source_sha256
+                if text is not None and text_sha256 != sha256:
+                    raise RuntimeError("file model đổi trong lúc nạp")
+            else:
+                engine, sha256 = TreeEnsemble.from_model_string(text), text_sha256
+            booster = Booster(model_str=text) if needs_booster else None
+        except Exception as e:
+            raise RuntimeError(f"Không thể nạp model từ {path}: {e}")
+        if expected_sha256 is not None and sha256 != expected_sha256:
+            raise RuntimeError(
+                f"{path} hiện là {model_version(sha256)}, không phải {model_version(expected_sha256)} được yêu cầu"
+            )
+        return cls(path, sha256, engine, booster, compiled)
+
+    def _build_explainer(self):
+        """Chạy trên thread nền: import shap / biên dịch artifact (kèm bảng TreeSHAP) khi cần."""
+        if get_shap_engine() == "shap":
+            import shap
+            return shap.TreeExplainer(self.booster)
+        if self.compiled is None:
+            self.compiled = load_compiled(self.path, get_artifact_dir())
+        return self.compiled.explainer
+
+    def predict_proba(self, x: np.ndarray) -> np.ndarray:
+        """Xác suất vỡ nợ cho ma trận x theo engine đang cấu hình."""
+        if self.scorer is not None:
+            if len(x) <= get_codegen_max_rows():
+                rows = np.asarray(x, dtype=np.float64).tolist()
+                return np.array(self.scorer.predict_proba_rows(rows), dtype=np.float64)
+            return self.engine.predict_proba(x)
+        if self.specialized is not None:
+            return self.specialized.predict_proba(x)
+        if self.booster is None or get_scoring_engine() == "numpy":
+            return self.engine.predict_proba(x)
+        return self.booster.predict(x)
+
+    def predict_decision(self, x: np.ndarray, threshold: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Chỉ quyết định (dừng sớm theo cận các cây còn lại), luôn trên engine numpy: (approved, số cây đã duyệt, score | NaN).
+        """
+        return (self.specialized or self.engine).predict_decision(x, threshold)
+
+    def _base_state(self, base_x: np.ndarray) -> Tuple[np.ndarray, np.ndarray, float, bool]:
+        """Hồ sơ gốc -> (hàng đã prepare, lá từng cây, score, có sẵn trong leaf_cache)."""
+        base_x = self.engine.prepare(np.reshape(base_x, (1, -1)))
+        key = base_x.tobytes()
+        cached = self.leaf_cache.get(key)
+        hit = cached is not None
+        if not hit:
+            leaves = self.engine.predict_leaves(base_x)[0]
+            # Chấm gốc từ chính các lá vừa duyệt (không cây nào thay đổi)
+            cached = (leaves, float(self.engine.rescore(base_x, base_x[0], leaves)[0][0]))
+            self.leaf_cache.put(key, cached)
+        return base_x[0], cached[0], cached[1], hit
+
+    def rescore(self, base_x: np.ndarray, x: np.ndarray) -> Tuple[float, np.ndarray, np.ndarray, bool]:
+        """
+        Chấm hồ sơ gốc base_x và các biến thể x của nó trên engine numpy, chỉ duyệt lại các cây
+        mà phần thay đổi chạm tới. Trả về (score gốc, score biến thể, số cây duyệt lại, gốc có sẵn trong cache).
+        Score trùng từng bit với /predict.
+        """
+        base_x, leaves, base_score, hit = self._base_state(base_x)
+        scores, _, evaluated = self.engine.rescore(x, base_x, leaves)
+        return base_score, scores, evaluated, hit
+
+    def counterfactual(self, base_x: np.ndarray, threshold: float, **options: Any) -> Tuple[float, Dict[str, Any]]:
+        """(score gốc, kết quả counterfactual.search) trên engine numpy, dùng chung leaf_cache với rescore."""
+        base_x, leaves, base_score, _ = self._base_state(base_x)
+        if base_score < threshold:
+            return base_score, {"found": False, "changes": {}, "candidates_evaluated": 0}
+        return base_score, counterfactual.search(self.engine, base_x, leaves, threshold, **options)
+
+    def scorer_stats(self) -> Dict[str, Any]:
+        if self.scorer is None:
+            return {"enabled": False}
+        # __file__ không có khi scorer được biên dịch trong bộ nhớ (không ghi được file)
+        return {"enabled": True, "module_path": getattr(self.scorer, "__file__", None), "max_rows": get_codegen_max_rows()}
+
+    @property
+    def artifact_path(self) -> Optional[str]:
+        return self.compiled.artifact_path if self.compiled is not None else None
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "model_version": self.version,
+            "model_path": self.path,
+            "model_sha256": self.sha256,
+            "artifact_path": self.artifact_path,
+            "loaded_at": self.loaded_at,
+        }
+
+    def __reduce__(self):
+        # Gửi sang process executor chỉ bằng (path, sha256); process con tự tìm/nạp đúng phiên bản
+        return (_resolve_loaded, (self.path, self.sha256))
+
+def _resolve_loaded(path: str, sha256: str) -> LoadedModel:
+    registry = ModelRegistry.instance
+    if registry is None:
+        return LoadedModel.load(path, sha256)
+    return registry.ensure(path, sha256)
+
+class ModelRegistry:
+    """
+    Giữ phiên bản model hiện tại và hoán đổi nguyên tử khi file model đổi
+    (theo dõi bằng thread nền) hoặc khi được gọi reload().
+    """
+
+    # Registry của process hiện tại (dùng khi giải mã LoadedModel trong process con)
+    instance: Optional["ModelRegistry"] = None
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._current = LoadedModel.load(path)
+        self._recent: "OrderedDict[str, LoadedModel]" = OrderedDict()
+        self._signature = self._file_signature()
+        self._watch_stop = threading.Event()
+        self._watch_thread: Optional[threading.Thread] = None
+        self.watch_interval_s = 0.0
+        self.reloads = 0
+        self.last_error: Optional[str] = None
+        self.history: List[Dict[str, Any]] = [{"model_version": self._current.version, "loaded_at": self._current.loaded_at}]
+        ModelRegistry.instance = self
+
+    @property
+    def current(self) -> LoadedModel:
+        return self._current
+
+    def _file_signature(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def reload(self, force: bool = False) -> Tuple[bool, LoadedModel]:
+        """
+        Nạp lại file model nếu checksum đổi (hoặc force). Model mới được warm-up xong
+        mới hoán đổi; lỗi thì giữ nguyên phiên bản cũ và ném lỗi.
+        Trả về (đã hoán đổi?, model hiện tại).
+        """
+        with self._lock:
+            self._signature = self._file_signature()
+            try:
+                if not force and file_sha256(self.path) == self._current.sha256:
+                    return False, self._current
+                candidate = LoadedModel.load(self.path)
+                candidate.explainer_loader.get()
+                if candidate.explainer_loader.error is not None:
+                    raise RuntimeError(f"Không dựng được explainer: {candidate.explainer_loader.error}")
+            except Exception as e:
+                self.last_error = str(e)
+                raise
+            previous = self._current
+            self._remember(previous)
+            self._current = candidate
+            self.reloads += 1
+            self.last_error = None
+            self.history = (self.history + [{"model_version": candidate.version, "loaded_at": candidate.loaded_at}])[-10:]
+            logger.info("Đã hoán đổi model %s -> %s", previous.version, candidate.version)
+            return True, candidate
+
+    def _remember(self, model: LoadedModel) -> None:
+        self._recent[model.sha256] = model
+        while len(self._recent) > RECENT_VERSIONS:
+            self._recent.popitem(last=False)
+
+    def ensure(self, path: str, sha256: str) -> LoadedModel:
+        """
+        Phiên bản có checksum sha256: hiện tại, vừa thay, hoặc nạp từ path (không hoán đổi phiên bản hiện tại).
+        File đã đổi sang nội dung khác thì ném lỗi.
+        """
+        current = self._current
+        if current.sha256 == sha256:
+            return current
+        with self._lock:
+            model = self._recent.get(sha256)
+        if model is not None:
+            return model
+        model = LoadedModel.load(path, sha256)
+        with self._lock:
+            self._remember(model)
+        return model
+
+    def start_watching(self, interval_s: float) -> None:
+        """Thread nền kiểm tra mtime/size của file model mỗi interval_s giây (0 = tắt)."""
+        if interval_s <= 0 or self._watch_thread is not None:
+            return
+        self.watch_interval_s = interval_s
+        self._watch_stop.clear()
+        self._watch_thread = threading.Thread(target=self._watch, name="model-watch", daemon=True)
+        self._watch_thread.start()
+
+    def stop_watching(self) -> None:
+        self._watch_stop.set()
+        self._watch_thread = None
+
+    def _watch(self) -> None:
+        while not self._watch_stop.wait(self.watch_interval_s):
+            signature = self._file_signature()
+            if signature is None or signature == self._signature:
+                continue
+            try:
+                self.reload()
+            except Exception:
+                logger.exception("Không thể hot reload model %s", self.path)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "model_version": self._current.version,
+            "watch_interval_s": self.watch_interval_s if self._watch_thread is not None else 0.0,
+            "reloads": self.reloads,
+            "last_error": self.last_error,
+            "history": self.history,
+        }
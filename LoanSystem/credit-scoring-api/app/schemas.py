@@ -1,6 +1,9 @@
 # app/schemas.py
+from enum import Enum
 from pydantic import BaseModel, Field, field_validator
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional
+
+from .utils import map_default_on_file, map_home_ownership, map_loan_intent, parse_number_like
 
 class CreditApplication(BaseModel):
     # Nhập “thân thiện” (chuỗi có dấu phẩy, nhãn chữ / tiếng Việt)
@@ -17,40 +20,155 @@ class CreditApplication(BaseModel):
     @field_validator("person_age", "person_emp_length", "cb_person_cred_hist_length", mode="before")
     @classmethod
     def _num_plain(cls, v: Any):
-        from .utils import parse_number_like
         return parse_number_like(v)
 
     @field_validator("person_income", "loan_amnt", mode="before")
     @classmethod
     def _money_like(cls, v: Any):
-        from .utils import parse_number_like
         return parse_number_like(v)
 
     @field_validator("person_home_ownership", mode="before")
     @classmethod
     def _home_map(cls, v: Any):
-        from .utils import map_home_ownership
         return map_home_ownership(v)
 
     @field_validator("loan_intent", mode="before")
     @classmethod
     def _intent_map(cls, v: Any):
-        from .utils import map_loan_intent
         return map_loan_intent(v)
 
     @field_validator("cb_person_default_on_file", mode="before")
     @classmethod
     def _default_map(cls, v: Any):
-        from .utils import map_default_on_file
         return map_default_on_file(v)
 
+class ExplainLevel(str, Enum):
+    # Mức giải thích: none = bỏ qua SHAP, topk = chỉ top đóng góp lớn nhất, full = toàn bộ
+    none = "none"
+    topk = "topk"
+    full = "full"
+
 class PredictResponse(BaseModel):
     score: float                    # Xác suất vỡ nợ (default probability)
     approved: bool
     decision_en: str               # "APPROVED"/"REJECTED"
     decision_vi: str               # "ĐƯỢC VAY"/"KHÔNG ĐƯỢC VAY"
     threshold: float
+    model_version: Optional[str] = None   # Phiên bản model đã chấm (ghi vào inference_runs.model_version)
     note_vi: str = "Quy tắc: duyệt nếu score < threshold (score thấp = rủi ro thấp)."
-    shap: Dict[str, float]         # SHAP cho từng feature
-    shap_bias: float               # Bias (base value)
-    shap_sum_check: float          # Tổng tất cả shap + bias (để đối chiếu)
+    # Các trường SHAP bị bỏ khi explain=none; explain=topk chỉ giữ top_k feature trong shap
+    shap: Optional[Dict[str, float]] = None         # SHAP cho từng feature
+    shap_bias: Optional[float] = None               # Bias (base value)
+    shap_sum_check: Optional[float] = None          # Tổng tất cả shap + bias (để đối chiếu)
+    explain_status: Optional[str] = None            # "warming_up"/"failed" khi cần SHAP nhưng explainer chưa sẵn sàng
+
+class DecisionResponse(BaseModel):
+    approved: bool
+    decision_en: str
+    decision_vi: str
+    threshold: float
+    model_version: Optional[str] = None
+    trees_evaluated: int           # Số cây đã duyệt trước khi quyết định chắc chắn
+    num_trees: int                 # Tổng số cây của model
+    score: Optional[float] = None  # Chỉ có khi phải duyệt hết cây (không dừng sớm)
+    note_vi: str = "Quy tắc: duyệt nếu score < threshold (score thấp = rủi ro thấp)."
+
+class BatchPredictRequest(BaseModel):
+    # Mỗi phần tử có cùng dạng với body của /predict; được chuẩn hoá riêng từng dòng
+    applications: List[Dict[str, Any]] = Field(..., description="Danh sách hồ sơ (dạng CreditApplication)")
+
+class ColumnarBatchRequest(BaseModel):
+    # Dạng cột: mỗi feature (theo FEATURE_ORDER) một mảng cùng độ dài; chuẩn hoá theo cột, không validate từng hồ sơ
+    columns: Dict[str, List[Any]] = Field(..., description="feature -> mảng giá trị (số hoặc nhãn như CreditApplication)")
+
+class MatrixBatchRequest(BaseModel):
+    # Vector đã chuẩn hoá (như LoanForecastRequest.features): mỗi dòng 8 số theo FEATURE_ORDER
+    features: List[List[float]] = Field(..., description="Ma trận số n x 8 theo FEATURE_ORDER, đã mã hoá sẵn")
+
+class BatchPredictItem(BaseModel):
+    index: int                              # Vị trí trong danh sách gửi lên
+    result: Optional[PredictResponse] = None
+    error: Optional[str] = None             # Lỗi của riêng dòng này (nếu có)
+
+class BatchPredictResponse(BaseModel):
+    count: int
+    succeeded: int
+    failed: int
+    results: List[BatchPredictItem]
+
+class WhatIfSweep(BaseModel):
+    # Quét một feature qua nhiều giá trị (độ nhạy), các feature khác giữ như hồ sơ gốc
+    feature: str = Field(..., description="Tên feature theo FEATURE_ORDER, ví dụ 'loan_amnt'")
+    values: List[Any] = Field(..., description="Các giá trị thử (số hoặc nhãn như CreditApplication)")
+
+class WhatIfRequest(BaseModel):
+    application: CreditApplication
+    # Mỗi biến thể chỉ ghi các feature thay đổi so với hồ sơ gốc
+    changes: List[Dict[str, Any]] = Field(default_factory=list, description="Danh sách biến thể, ví dụ [{'loan_amnt': 5000}]")
+    sweep: Optional[WhatIfSweep] = None
+
+class WhatIfItem(BaseModel):
+    index: int                              # Vị trí biến thể (changes trước, rồi tới các giá trị của sweep)
+    changes: Dict[str, Any]                 # Feature thay đổi -> giá trị đã chuẩn hoá
+    score: Optional[float] = None
+    approved: Optional[bool] = None
+    decision_en: Optional[str] = None
+    trees_evaluated: Optional[int] = None   # Số cây phải duyệt lại so với hồ sơ gốc
+    error: Optional[str] = None
+
+class WhatIfBase(BaseModel):
+    score: float
+    approved: bool
+    decision_en: str
+    cached: bool                            # Lá từng cây của hồ sơ gốc đã có sẵn (không duyệt lại)
+
+class WhatIfResponse(BaseModel):
+    model_version: str
+    threshold: float
+    num_trees: int
+    base: WhatIfBase
+    count: int
+    failed: int
+    results: List[WhatIfItem]
+
+class CounterfactualRequest(BaseModel):
+    application: CreditApplication
+    features: List[str] = Field(
+        default_factory=lambda: ["loan_amnt", "person_income", "person_emp_length"],
+        description="Các feature được phép thay đổi (chỉ loan_amnt, person_income, person_emp_length)",
+    )
+    max_features: int = Field(2, ge=1, le=3, description="Số feature tối đa thay đổi cùng lúc")
+    # True: chỉ giảm khoản vay, tăng thu nhập, tăng số năm làm việc (lời khuyên hành động được);
+    # False: cả hai hướng theo đúng model, chỉ để chẩn đoán (advice_vi rỗng)
+    monotone: bool = True
+
+class CounterfactualChange(BaseModel):
+    feature: str
+    current: float
+    proposed: float
+    change: float                   # proposed - current
+    change_pct: Optional[float] = None  # % so với giá trị hiện tại (None khi hiện tại = 0)
+
+class CounterfactualOption(BaseModel):
+    # Nghiệm chỉ đổi một feature
+    change: CounterfactualChange
+    score: float
+
+class CounterfactualResponse(BaseModel):
+    model_version: str
+    threshold: float
+    score: float                    # Score của hồ sơ gốc
+    approved: bool
+    found: bool                     # Có thay đổi (trong giới hạn tìm kiếm) làm hồ sơ được duyệt
+    changes: List[CounterfactualChange] = []
+    new_score: Optional[float] = None   # Score sau thay đổi (chấm chính xác, trùng /predict)
+    cost: Optional[float] = None        # Tổng mức thay đổi tương đối Σ |Δ| / max(|hiện tại|, 1)
+    single_feature: Dict[str, Optional[CounterfactualOption]] = {}
+    candidates_evaluated: int
+    exhaustive: bool = True         # False nếu phải cắt bớt tổ hợp (nghiệm có thể chưa nhỏ nhất)
+    advice_vi: List[str] = []       # Chỉ có khi monotone=true
+
+class ReloadResponse(BaseModel):
+    reloaded: bool                  # False nếu checksum model không đổi
+    model_version: str              # Phiên bản đang phục vụ sau khi gọi
+    previous_version: str
@@ -0,0 +1,117 @@
+# app/serve.py
+"""
+Chế độ pre-fork nhiều worker, dùng chung bộ nhớ model.
+
+Process master nạp và parse model một lần (TreeEnsemble + bảng TreeSHAP, không
+Booster/shap), mở socket rồi fork các worker. Worker chấm điểm trực tiếp trên các
+mảng numpy kế thừa từ master (copy-on-write, chỉ đọc) nên RSS riêng của mỗi
+worker gần bằng interpreter rỗng. Worker chết sẽ được fork lại.
+
+    python -m app.serve --workers 4 --host 0.0.0.0 --port 8000
+"""
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import time
+from typing import Dict, Optional, Sequence
+
+logger = logging.getLogger("app.serve")
+
+# Chờ trước khi fork lại worker vừa chết (tránh vòng lặp crash quá nhanh)
+RESPAWN_DELAY_S = 0.5
+
+def bind_socket(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+def run_worker(sock: socket.socket, log_level: str) -> None:
+    import uvicorn
+
+    from .main import app
+
+    config = uvicorn.Config(app, log_level=log_level, lifespan="on")
+    uvicorn.Server(config).run(sockets=[sock])
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Chạy credit-scoring-api ở chế độ pre-fork")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("SERVE_WORKERS", str(os.cpu_count() or 1))))
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(name)s %(message)s")
+
+    # Worker chỉ dùng engine numpy; executor process sẽ nhân bản model nên ép về thread
+    os.environ["MODEL_SHARED"] = "1"
+    os.environ["SCORING_EXECUTOR"] = "thread"
+
+    started = time.perf_counter()
+    from . import main as service  # nạp + parse model một lần ở master
+
+    # Dựng explainer ngay ở master (không để mỗi worker tự warm-up riêng) rồi mới fork
+    service.registry.current.explainer_loader.get()
+
+    # Đưa mọi object hiện có ra khỏi GC để worker không chạm (và copy) các trang của chúng
+    gc.collect()
+    gc.freeze()
+    logger.info("Đã nạp model %s trong %.2fs", service.MODEL_PATH, time.perf_counter() - started)
+
+    sock = bind_socket(args.host, args.port)
+    children: Dict[int, int] = {}
+    stopping = False
+
+    def spawn(slot: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            code = 0
+            try:
+                run_worker(sock, args.log_level)
+            except BaseException:
+                logger.exception("Worker %d lỗi", os.getpid())
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = slot
+        logger.info("Worker %d (slot %d) đã khởi động", pid, slot)
+
+    def stop(signum, _frame) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for slot in range(max(1, args.workers)):
+        spawn(slot)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        slot = children.pop(pid, None)
+        if slot is None or stopping:
+            continue
+        logger.warning("Worker %d thoát (status %d), fork lại", pid, status)
+        time.sleep(RESPAWN_DELAY_S)
+        if not stopping:
+            spawn(slot)
+    sock.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+# app/shadow.py
+"""
+Chấm điểm song song champion/challenger (shadow scoring).
+
+Ma trận feature đã chuẩn hoá của champion được đẩy vào một hàng đợi có giới hạn;
+một thread nền chấm lại bằng model challenger và ghi score, SHAP, thời gian ra
+kênh phụ (file NDJSON hoặc log) để so sánh offline. Response chỉ dùng kết quả
+champion; khi hàng đợi đầy hoặc hệ thống đang quá tải thì việc shadow bị bỏ.
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+
+from .registry import LoadedModel
+
+logger = logging.getLogger("app.shadow")
+
+class ShadowScorer:
+    def __init__(
+        self,
+        challenger: LoadedModel,
+        queue_size: int = 1000,
+        log_path: Optional[str] = None,
+        overloaded: Callable[[], bool] = lambda: False,
+        threshold: Callable[[], float] = lambda: 0.5,
+    ):
+        self.challenger = challenger
+        self.log_path = log_path
+        self._overloaded = overloaded
+        self._threshold = threshold
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=max(1, int(queue_size)))
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.submitted = 0
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+
+    def start(self) -> None:
+        self.challenger.explainer_loader.start()
+        with self._lock:
+            # is_alive() cũng bắt trường hợp process con sau fork (thread của master không đi theo)
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="shadow-scoring", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass
+
+    def submit(self, champion: LoadedModel, x: np.ndarray, champion_scores: np.ndarray, with_shap: bool) -> bool:
+        """Không bao giờ chặn: trả False (và đếm dropped) nếu quá tải hoặc hàng đợi đầy."""
+        self.start()
+        if self._overloaded():
+            self._count("dropped")
+            return False
+        job = {
+            "enqueued": time.perf_counter(),
+            "champion_version": champion.version,
+            "x": x,
+            "champion_scores": champion_scores,
+            "with_shap": with_shap,
+        }
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            self._count("dropped")
+            return False
+        self._count("submitted")
+        return True
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _run(self) -> None:
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            try:
+                self._emit(self._score(job))
+                self.processed += 1
+            except Exception as e:
+                self.errors += 1
+                self.last_error = f"{type(e).__name__}: {e}"
+
+    def _score(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        x = job["x"]
+        scores = self.challenger.predict_proba(x)
+        predict_ms = (time.perf_counter() - started) * 1e3
+
+        shap_values, expected_value, shap_ms = None, None, None
+        # Không chờ explainer của challenger warm-up: chưa có thì chỉ so sánh score
+        explainer = self.challenger.explainer_loader.get(0) if job["with_shap"] else None
+        if explainer is not None:
+            t = time.perf_counter()
+            values = explainer.shap_values(x)
+            if isinstance(values, list):
+                values = values[-1]
+            shap_values = np.asarray(values, dtype=float)
+            expected_value = float(np.ravel(explainer.expected_value)[-1])
+            shap_ms = (time.perf_counter() - t) * 1e3
+
+        thr = self._threshold()
+        champion_scores = np.asarray(job["champion_scores"], dtype=float)
+        return {
+            "ts": time.time(),
+            "champion_version": job["champion_version"],
+            "challenger_version": self.challenger.version,
+            "rows": int(len(x)),
+            "features": x.tolist(),
+            "champion_scores": champion_scores.tolist(),
+            "challenger_scores": np.asarray(scores, dtype=float).tolist(),
+            "decision_mismatches": int(np.sum((champion_scores < thr) != (scores < thr))),
+            "challenger_shap": None if shap_values is None else shap_values.tolist(),
+            "challenger_shap_bias": expected_value,
+            "timing_ms": {
+                "queue_wait": (started - job["enqueued"]) * 1e3,
+                "predict": predict_ms,
+                "shap": shap_ms,
+            },
+        }
+
+    def _emit(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, ensure_ascii=False)
+        if self.log_path:
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        else:
+            logger.info(line)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": True,
+            "pid": os.getpid(),
+            "challenger_version": self.challenger.version,
+            "challenger_path": self.challenger.path,
+            "queued": self._queue.qsize(),
+            "submitted": self.submitted,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "last_error": self.last_error,
+        }
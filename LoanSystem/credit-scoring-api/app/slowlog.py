@@ -0,0 +1,77 @@
+# app/slowlog.py
+"""
+Vòng đệm các request chậm: request vượt ngưỡng được giữ lại cùng thời gian từng bước để
+tái hiện outlier độ trễ mà không cần bật log toàn bộ request. Input gốc chứa dữ liệu tài chính
+của người vay nên chỉ được giữ khi bật capture_inputs (SLOW_REQUEST_CAPTURE_INPUTS=1).
+"""
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from .metrics import RequestTiming
+
+class SlowRequestLog:
+    def __init__(self, threshold_ms: float = 250.0, size: int = 100, capture_inputs: bool = False):
+        self.threshold_ms = float(threshold_ms)
+        self.capture_inputs = bool(capture_inputs)
+        self.size = max(1, int(size))
+        self._entries: Deque[Dict[str, Any]] = deque(maxlen=self.size)
+        self._lock = threading.Lock()
+        self.captured = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold_ms > 0
+
+    def maybe_record(
+        self,
+        endpoint: str,
+        timing: RequestTiming,
+        inputs: Any,
+        params: Optional[Dict[str, Any]] = None,
+        model_version: Optional[str] = None,
+    ) -> bool:
+        """
+        Ghi lại request nếu tổng thời gian vượt ngưỡng; trả True khi đã ghi.
+        Khi không capture_inputs, inputs là None và chỉ giữ input_bytes (kích thước body).
+        """
+        total_ms = timing.elapsed() * 1e3
+        if not self.enabled or total_ms < self.threshold_ms:
+            return False
+        entry = {
+            "ts": time.time(),
+            "pid": os.getpid(),
+            "endpoint": endpoint,
+            "model_version": model_version,
+            "total_ms": total_ms,
+            "stages_ms": timing.breakdown_ms(),
+            "params": params or {},
+            "inputs": inputs if self.capture_inputs else None,
+            "input_bytes": len(inputs) if isinstance(inputs, (bytes, bytearray, str)) else None,
+        }
+        with self._lock:
+            self._entries.append(entry)
+            self.captured += 1
+        return True
+
+    def entries(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Các request chậm, mới nhất trước."""
+        with self._lock:
+            items = list(self._entries)
+        items.reverse()
+        return items[:limit] if limit else items
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "threshold_ms": self.threshold_ms,
+            "size": self.size,
+            "capture_inputs": self.capture_inputs,
+            "held": len(self._entries),
+            "captured": self.captured,
+        }
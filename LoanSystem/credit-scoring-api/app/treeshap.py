@@ -0,0 +1,257 @@
+# app/treeshap.py
+"""
+TreeSHAP (path-dependent) dạng vector, tính trực tiếp từ các mảng của TreeEnsemble.
+
+Với mỗi lá, đóng góp SHAP chỉ phụ thuộc vào việc dòng dữ liệu có thoả toàn bộ
+điều kiện của từng feature trên đường đi tới lá hay không (mẫu bit 2^D, D = số
+feature khác nhau trên đường đi). Giống FastTreeSHAP v2, bảng
+[(lá, feature), mẫu bit] -> SHAP được tính sẵn một lần khi nạp model; lúc chạy
+chỉ còn tính mẫu bit cho cả batch rồi tra bảng và cộng theo feature.
+
+Kết quả trùng với shap.TreeExplainer / LightGBM pred_contrib (cover = leaf_count,
+internal_count như LightGBM) trong sai số làm tròn.
+"""
+from math import factorial
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from .engine import TreeEnsemble
+
+# Số dòng mỗi lượt (mảng trung gian ~ rows * số bước trên mọi đường đi)
+SHAP_CHUNK_ROWS = 128
+
+# Các mảng tra bảng dùng lúc chạy (lưu trong artifact nhị phân để khỏi dựng lại bảng)
+LOOKUP_ARRAYS = (
+    "leaf_width",
+    "table",
+    "group_feature",
+    "group_lo",
+    "group_hi",
+    "group_step_node",
+    "group_step_left",
+    "sorted_group_leaf",
+    "sorted_group_offset",
+    "sorted_group_width",
+    "feature_bounds",
+)
+
+
+def _shapley_weights(depth: int) -> np.ndarray:
+    """w(s) = s! (D-1-s)! / D! cho s = 0..D-1."""
+    return np.array(
+        [factorial(s) * factorial(depth - 1 - s) / factorial(depth) for s in range(depth)],
+        dtype=np.float64,
+    )
+
+
+def _leaf_table(zero_fraction: np.ndarray, value: float) -> np.ndarray:
+    """
+    Bảng SHAP của một lá, shape (2^D, D).
+
+    Dòng p ứng với mẫu bit p (bit k = 1 nếu dòng dữ liệu thoả mọi điều kiện của
+    feature thứ k trên đường đi). Với feature j và tập P các feature "thoả":
+        phi_j = v * (o_j - z_j) * prod_{k∉P, k≠j} z_k * sum_s w(s) e_{m-s}(z_{P\\{j}})
+    trong đó e_r là đa thức đối xứng sơ cấp, m = |P \\ {j}|.
+    """
+    depth = len(zero_fraction)
+    patterns = np.arange(1 << depth)
+    bits = (patterns[:, None] >> np.arange(depth)) & 1
+    on = bits.astype(bool)
+    weights = _shapley_weights(depth)
+
+    table = np.empty((len(patterns), depth), dtype=np.float64)
+    for j in range(depth):
+        # poly[:, s] = hệ số t^s của prod_{k∈P\{j}} (z_k + t)
+        poly = np.zeros((len(patterns), depth), dtype=np.float64)
+        poly[:, 0] = 1.0
+        off = np.ones(len(patterns), dtype=np.float64)
+        for k in range(depth):
+            if k == j:
+                continue
+            z = zero_fraction[k]
+            shifted = np.zeros_like(poly)
+            shifted[:, 1:] = poly[:, :-1]
+            poly = np.where(on[:, k, None], poly * z + shifted, poly)
+            off = np.where(on[:, k], off, off * z)
+        table[:, j] = value * (bits[:, j] - zero_fraction[j]) * off * (poly @ weights)
+    return table
+
+
+class TreeShapExplainer:
+    """
+    Thay thế shap.TreeExplainer(booster) cho model LightGBM binary:
+    expected_value và shap_values(X) ở không gian log-odds của lớp dương.
+    """
+
+    def __init__(self, ensemble: TreeEnsemble):
+        self.ensemble = ensemble
+        num_features = ensemble.num_features
+        expected_value = 0.0
+        # Mỗi lá có đường đi: (feature trên đường đi, bước của từng feature, bảng SHAP 2^D x D)
+        leaves: List[Tuple[List[int], Dict[int, List[Tuple[int, bool]]], np.ndarray]] = []
+
+        lc, rc = ensemble.left_child, ensemble.right_child
+        for root in ensemble.tree_root:
+            if root < 0:
+                # Cây một lá: chỉ cộng vào giá trị kỳ vọng
+                expected_value += float(ensemble.leaf_value[~root])
+                continue
+            root_count = ensemble.internal_count[root]
+            # DFS: (node, các bước [(node, rẽ trái?, feature, tỉ lệ cover)])
+            stack = [(int(root), [])]
+            while stack:
+                node, path = stack.pop()
+                count = ensemble.internal_count[node]
+                feature = int(ensemble.split_feature[node])
+                for child, go_left in ((int(lc[node]), True), (int(rc[node]), False)):
+                    child_count = ensemble.internal_count[child] if child >= 0 else ensemble.leaf_count[~child]
+                    child_path = path + [(node, go_left, feature, child_count / count)]
+                    if child >= 0:
+                        stack.append((child, child_path))
+                        continue
+                    value = float(ensemble.leaf_value[~child])
+                    expected_value += ensemble.leaf_count[~child] / root_count * value
+
+                    # Gộp các bước cùng feature: z = tích tỉ lệ cover, o = thoả tất cả
+                    features: List[int] = []
+                    steps: Dict[int, List[Tuple[int, bool]]] = {}
+                    zero_fraction: Dict[int, float] = {}
+                    for n_, left_, f_, frac in child_path:
+                        if f_ not in steps:
+                            features.append(f_)
+                            steps[f_] = []
+                            zero_fraction[f_] = 1.0
+                        steps[f_].append((n_, left_))
+                        zero_fraction[f_] *= frac
+                    table = _leaf_table(np.array([zero_fraction[f_] for f_ in features]), value)
+                    leaves.append((features, steps, table))
+
+        self.expected_value = float(expected_value)
+        self._build_lookup(leaves)
+
+    def _build_lookup(self, leaves) -> None:
+        """
+        Sắp xếp lại dữ liệu để lúc chạy chỉ còn các phép toán trên lát cắt liên tục.
+
+        "Nhóm" là một cặp (lá, feature thứ k trên đường đi). Lá được xếp theo D giảm
+        dần và nhóm theo (k, lá), nên các nhóm mang bit k là một khối liên tục ứng
+        với leaf_blocks[k] lá đầu tiên.
+        """
+        ens = self.ensemble
+        leaves = sorted(leaves, key=lambda item: -len(item[0]))
+        max_depth = len(leaves[0][0]) if leaves else 0
+
+        group_leaf, group_feature, group_offset = [], [], []
+        group_steps: List[List[Tuple[int, bool]]] = []
+        offsets, tables, n_values = [], [], 0
+        for _, _, table in leaves:
+            offsets.append(n_values)
+            tables.append(table)
+            n_values += table.size
+        self.leaf_blocks = []
+        for k in range(max_depth):
+            n_leaves_k = sum(1 for features, _, _ in leaves if len(features) > k)
+            self.leaf_blocks.append(n_leaves_k)
+            for i in range(n_leaves_k):
+                features, steps, table = leaves[i]
+                group_leaf.append(i)
+                group_feature.append(features[k])
+                group_steps.append(steps[features[k]])
+                # bảng của lá lưu theo hàng (2^D, D): phần tử [p, k] ở offset + p * D + k
+                group_offset.append(offsets[i] + k)
+
+        self.num_leaves = len(leaves)
+        self.leaf_width = np.array([len(features) for features, _, _ in leaves], dtype=np.int64)
+        self.table = np.concatenate([t.ravel() for t in tables]) if tables else np.zeros(0)
+        self.group_feature = np.array(group_feature, dtype=np.int64)
+
+        # Điều kiện của một nhóm là lo < x <= hi (khi model không có luật missing)
+        lo = np.full(len(group_steps), -np.inf)
+        hi = np.full(len(group_steps), np.inf)
+        for g, steps in enumerate(group_steps):
+            for node, go_left in steps:
+                if go_left:
+                    hi[g] = min(hi[g], ens.threshold[node])
+                else:
+                    lo[g] = max(lo[g], ens.threshold[node])
+        self.group_lo, self.group_hi = lo[:, None], hi[:, None]
+
+        # Dạng tổng quát: danh sách bước (đệm bằng một bước luôn thoả ở cuối)
+        width = max((len(steps) for steps in group_steps), default=0)
+        n_nodes = len(ens.split_feature)
+        self.group_step_node = np.full((len(group_steps), width), n_nodes, dtype=np.int64)
+        self.group_step_left = np.ones((len(group_steps), width), dtype=bool)
+        for g, steps in enumerate(group_steps):
+            for i, (node, go_left) in enumerate(steps):
+                self.group_step_node[g, i] = node
+                self.group_step_left[g, i] = go_left
+
+        # Khi tra bảng, xếp nhóm theo feature để cộng dồn bằng các lát cắt liên tục
+        order = np.argsort(self.group_feature, kind="stable")
+        self.sorted_group_leaf = np.array(group_leaf, dtype=np.int64)[order]
+        self.sorted_group_offset = np.array(group_offset, dtype=np.int64)[order][:, None]
+        self.sorted_group_width = self.leaf_width[self.sorted_group_leaf][:, None]
+        self.feature_bounds = np.searchsorted(self.group_feature[order], np.arange(ens.num_features + 1))
+
+    def state(self) -> Tuple[Dict[str, Any], Dict[str, np.ndarray]]:
+        """(metadata JSON được, các mảng tra bảng) — from_state dựng lại explainer không cần duyệt cây."""
+        meta = {
+            "expected_value": self.expected_value,
+            "num_leaves": self.num_leaves,
+            "leaf_blocks": [int(n) for n in self.leaf_blocks],
+        }
+        return meta, {name: getattr(self, name) for name in LOOKUP_ARRAYS}
+
+    @classmethod
+    def from_state(cls, ensemble: TreeEnsemble, meta: Dict[str, Any], arrays: Dict[str, np.ndarray]) -> "TreeShapExplainer":
+        self = cls.__new__(cls)
+        self.ensemble = ensemble
+        self.expected_value = float(meta["expected_value"])
+        self.num_leaves = int(meta["num_leaves"])
+        self.leaf_blocks = list(meta["leaf_blocks"])
+        for name in LOOKUP_ARRAYS:
+            setattr(self, name, arrays[name])
+        return self
+
+    def shap_values(self, X: np.ndarray) -> np.ndarray:
+        """SHAP cho cả batch, shape (n_rows, num_features)."""
+        X = self.ensemble.prepare(X)
+        out = np.zeros((X.shape[0], self.ensemble.num_features), dtype=np.float64)
+        if not self.num_leaves:
+            return out
+        for start in range(0, X.shape[0], SHAP_CHUNK_ROWS):
+            stop = start + SHAP_CHUNK_ROWS
+            out[start:stop] = self._shap_chunk(X[start:stop]).T
+        return out
+
+    def _group_satisfied(self, X: np.ndarray) -> np.ndarray:
+        """o(nhóm, dòng): dòng thoả mọi điều kiện của feature đó trên đường đi tới lá."""
+        if not self.ensemble.has_missing_rules:
+            values = X.T[self.group_feature]
+            return (values > self.group_lo) & (values <= self.group_hi)
+        go_left = self.ensemble.node_decisions(X).T
+        # Thêm một "node" luôn thoả cho phần đệm
+        go_left = np.vstack([go_left, np.ones((1, X.shape[0]), dtype=bool)])
+        satisfied = np.ones((len(self.group_feature), X.shape[0]), dtype=bool)
+        for i in range(self.group_step_node.shape[1]):
+            satisfied &= go_left[self.group_step_node[:, i]] == self.group_step_left[:, i, None]
+        return satisfied
+
+    def _shap_chunk(self, X: np.ndarray) -> np.ndarray:
+        """SHAP của một nhóm dòng, shape (num_features, n_rows)."""
+        satisfied = self._group_satisfied(X)
+        # 1) Mẫu bit của từng lá: khối nhóm thứ k góp bit k cho leaf_blocks[k] lá đầu tiên
+        pattern = np.zeros((self.num_leaves, X.shape[0]), dtype=np.int64)
+        start = 0
+        for k, n_leaves_k in enumerate(self.leaf_blocks):
+            pattern[:n_leaves_k] += satisfied[start:start + n_leaves_k].astype(np.int64) << k
+            start += n_leaves_k
+        # 2) Tra bảng cho mọi (lá, feature) rồi cộng theo feature
+        values = self.table[self.sorted_group_offset + pattern[self.sorted_group_leaf] * self.sorted_group_width]
+        out = np.zeros((self.ensemble.num_features, X.shape[0]), dtype=np.float64)
+        for f in range(self.ensemble.num_features):
+            lo, hi = self.feature_bounds[f], self.feature_bounds[f + 1]
+            if hi > lo:
+                out[f] = values[lo:hi].sum(axis=0)
+        return out
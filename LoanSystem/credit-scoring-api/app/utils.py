@@ -1,6 +1,10 @@
 import json
 import os
-from typing import Dict, Any
+import unicodedata
+from pathlib import Path
+from typing import Callable, Dict, Any, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
 
 def _load_mapping(env_name: str, default_obj: Dict[str, int]) -> Dict[str, int]:
     raw = os.getenv(env_name, "").strip()
@@ -52,6 +56,22 @@ DEFAULT_ON_FILE_MAP = _load_mapping(
     },
 )
 
+def fold_label(s: str) -> str:
+    """Khoá so khớp nhãn không phân biệt dấu/hoa thường/khoảng trắng: 'Giáo dục', 'GIÁO_DỤC' -> 'GIAODUC'."""
+    s = unicodedata.normalize("NFD", s.replace("đ", "d").replace("Đ", "D"))
+    return "".join(ch for ch in s if ch.isalnum()).upper()
+
+def _folded(mapping: Dict[str, int]) -> Dict[str, int]:
+    # Bảng tra dựng sẵn theo khoá không dấu; trùng khoá thì giữ nhãn khai báo trước
+    table: Dict[str, int] = {}
+    for key, code in mapping.items():
+        table.setdefault(fold_label(key), code)
+    return table
+
+_HOME_OWNERSHIP_FOLDED = _folded(HOME_OWNERSHIP_MAP)
+_LOAN_INTENT_FOLDED = _folded(LOAN_INTENT_MAP)
+_DEFAULT_ON_FILE_FOLDED = _folded(DEFAULT_ON_FILE_MAP)
+
 def parse_number_like(s: Any) -> float:
     """
     Chấp nhận số, chuỗi có dấu phẩy/thanh phân tách.
@@ -79,7 +99,10 @@ def map_home_ownership(v: Any) -> int:
             return 2  # mặc định RENT=2
         v = v[0]
     key = str(v).upper().replace(" ", "_")
-    return HOME_OWNERSHIP_MAP.get(key, HOME_OWNERSHIP_MAP.get(key.replace("_", ""), 2))  # mặc định RENT=2
+    code = HOME_OWNERSHIP_MAP.get(key, HOME_OWNERSHIP_MAP.get(key.replace("_", "")))
+    if code is None:
+        code = _HOME_OWNERSHIP_FOLDED.get(fold_label(key), 2)  # mặc định RENT=2
+    return code
 
 def map_loan_intent(v: Any) -> int:
     if isinstance(v, (int, float)):
@@ -90,7 +113,10 @@ def map_loan_intent(v: Any) -> int:
         v = v[0]
     key = str(v).upper().replace(" ", "")
     key_us = key.replace("_", "")
-    return LOAN_INTENT_MAP.get(key, LOAN_INTENT_MAP.get(key_us, 2))  # mặc định PERSONAL=2
+    code = LOAN_INTENT_MAP.get(key, LOAN_INTENT_MAP.get(key_us))
+    if code is None:
+        code = _LOAN_INTENT_FOLDED.get(fold_label(key), 2)  # mặc định PERSONAL=2
+    return code
 
 def map_default_on_file(v: Any) -> int:
     if isinstance(v, (int, float)):
@@ -100,10 +126,354 @@ def map_default_on_file(v: Any) -> int:
             return 0  # mặc định N=0
         v = v[0]
     key = str(v).upper().strip()
-    return DEFAULT_ON_FILE_MAP.get(key, 0)  # mặc định N=0
+    code = DEFAULT_ON_FILE_MAP.get(key)
+    if code is None:
+        code = _DEFAULT_ON_FILE_FOLDED.get(fold_label(key), 0)  # mặc định N=0
+    return code
+
+# Hàm chuẩn hoá theo feature (giống các validator của CreditApplication)
+FEATURE_NORMALIZERS: Dict[str, Callable[[Any], float]] = {
+    "person_age": parse_number_like,
+    "person_income": parse_number_like,
+    "person_home_ownership": map_home_ownership,
+    "person_emp_length": parse_number_like,
+    "loan_intent": map_loan_intent,
+    "loan_amnt": parse_number_like,
+    "cb_person_default_on_file": map_default_on_file,
+    "cb_person_cred_hist_length": parse_number_like,
+}
+# Các feature mã hoá nhãn: giá trị số được cắt phần thập phân như int(v)
+CATEGORICAL_FEATURES = frozenset({"person_home_ownership", "loan_intent", "cb_person_default_on_file"})
+# Miền giá trị (mã) của từng feature phân loại, theo các bảng *_MAP
+CATEGORICAL_VALUES = {
+    "person_home_ownership": sorted(set(HOME_OWNERSHIP_MAP.values())),
+    "loan_intent": sorted(set(LOAN_INTENT_MAP.values())),
+    "cb_person_default_on_file": sorted(set(DEFAULT_ON_FILE_MAP.values())),
+}
+
+class NormalizedColumn(NamedTuple):
+    values: np.ndarray          # float64, NaN ở dòng lỗi
+    error_mask: np.ndarray      # bool, True = dòng lỗi
+    errors: Dict[int, str]      # thông báo lỗi, chỉ cho các dòng lỗi
+
+def _normalize_unique(values: Sequence[Any], normalize: Callable[[Any], float]) -> NormalizedColumn:
+    """Gọi normalize đúng một lần cho mỗi giá trị khác nhau rồi trải kết quả về từng dòng."""
+    slots: Dict[Any, int] = {}
+    uniques: List[Any] = []
+
+    def slot_of(v: Any) -> int:
+        try:
+            slot = slots.get(v)
+            if slot is None:
+                slot = slots[v] = len(uniques)
+                uniques.append(v)
+        except TypeError:
+            # Giá trị không hash được (list): một slot riêng
+            slot = len(uniques)
+            uniques.append(v)
+        return slot
+
+    codes = np.fromiter(map(slot_of, values), dtype=np.intp, count=len(values))
+    table = np.empty(len(uniques), dtype=np.float64)
+    bad = np.zeros(len(uniques), dtype=bool)
+    messages: Dict[int, str] = {}
+    for j, v in enumerate(uniques):
+        try:
+            table[j] = normalize(v)
+        except Exception as e:
+            table[j] = np.nan
+            bad[j] = True
+            messages[j] = str(e)
+    mask = bad[codes]
+    errors = {int(i): messages[codes[i]] for i in np.flatnonzero(mask)} if messages else {}
+    return NormalizedColumn(table[codes], mask, errors)
+
+_NUMBER_SEPARATOR = "\x1f"
+_NUMBER_BLOCK = 256
+_NUMBER_SAMPLE = 4096
+
+def _parse_number_strings(strings: Sequence[str]) -> Optional[np.ndarray]:
+    """
+    parse_number_like cho cả cột chuỗi: bỏ dấu phẩy/khoảng trắng trên một chuỗi nối rồi ép float64 theo khối;
+    chuỗi không đọc được là NaN (để parse_number_like báo lỗi). None nếu có "\x00"
+    (mảng str của numpy cắt "\x00" ở cuối chuỗi, kết quả sẽ khác float()).
+    """
+    n = len(strings)
+    # Cột lặp nhiều (ước lượng trên _NUMBER_SAMPLE dòng đầu): ép mỗi chuỗi khác nhau một lần rồi tra lại
+    # theo dòng (dict/map chạy trong C). Cột ít lặp thì bỏ qua: dựng dict tốn hơn chính việc ép kiểu.
+    repeated = n > _NUMBER_SAMPLE and 2 * len(set(strings[:_NUMBER_SAMPLE])) <= _NUMBER_SAMPLE
+    uniques = list(dict.fromkeys(strings)) if repeated else []
+    distinct = uniques if repeated else strings
+    text = _NUMBER_SEPARATOR.join(distinct)
+    if "\x00" in text:
+        return None
+    cleaned = text.replace(",", "").replace(" ", "").split(_NUMBER_SEPARATOR)
+    if len(cleaned) != len(distinct):
+        # Chính giá trị có ký tự phân cách: làm sạch từng chuỗi
+        cleaned = [s.replace(",", "").replace(" ", "") for s in distinct]
+    array = np.array(cleaned, dtype=str)
+    out = np.full(len(array), np.nan)
+    for start in range(0, len(array), _NUMBER_BLOCK):
+        try:
+            out[start:start + _NUMBER_BLOCK] = array[start:start + _NUMBER_BLOCK].astype(np.float64)
+        except ValueError:
+            # Ép kiểu của numpy là tất cả hoặc không: khối lỗi đọc lại từng chuỗi, chuỗi lỗi giữ NaN
+            for i in range(start, min(start + _NUMBER_BLOCK, len(cleaned))):
+                try:
+                    out[i] = float(cleaned[i])
+                except ValueError:
+                    pass
+    if repeated:
+        out = np.fromiter(map(dict(zip(uniques, out.tolist())).__getitem__, strings), dtype=np.float64, count=n)
+    return out
+
+def _normalize_array(values: Sequence[Any], normalize: Callable[[Any], float], categorical: bool) -> NormalizedColumn:
+    # Cột toàn số (int/float/bool) đi thẳng qua numpy; cột chuỗi số ("45,000") ép float64 cả lô;
+    # còn lại (nhãn, giá trị lẫn kiểu) qua bảng giá trị duy nhất
+    n = len(values)
+    if normalize is parse_number_like and n and set(map(type, values)) == {str}:
+        out = _parse_number_strings(values)
+        if out is None:
+            return _normalize_unique(values, normalize)
+    else:
+        try:
+            raw = np.asarray(values) if n else np.empty(0, dtype=np.float64)
+        except ValueError:
+            raw = None  # có phần tử là list lồng nhau
+        if raw is None or raw.dtype.kind not in "biuf" or raw.shape != (n,):
+            return _normalize_unique(values, normalize)
+        # copy=False: cột float64 (vd. bộ đệm Arrow) không bị sao chép thêm
+        out = raw.astype(np.float64, copy=False)
+        if categorical:
+            out = np.trunc(out)
+    mask = np.zeros(n, dtype=bool)
+    errors: Dict[int, str] = {}
+    pending = np.flatnonzero(~np.isfinite(out))
+    if len(pending):
+        if not out.flags.writeable:
+            out = out.copy()
+        # NaN/inf (và chuỗi ép không được): để hàm gốc quyết định (parse_number_like giữ NaN, map_* báo lỗi)
+        sub = _normalize_unique([values[i] for i in pending], normalize)
+        out[pending] = sub.values
+        mask[pending] = sub.error_mask
+        errors = {int(pending[i]): msg for i, msg in sub.errors.items()}
+    return NormalizedColumn(out, mask, errors)
+
+def parse_number_array(values: Sequence[Any]) -> NormalizedColumn:
+    """parse_number_like cho cả một cột ("45,000", 7000, "7.5"...)."""
+    return _normalize_array(values, parse_number_like, categorical=False)
+
+def map_home_ownership_array(values: Sequence[Any]) -> NormalizedColumn:
+    return _normalize_array(values, map_home_ownership, categorical=True)
+
+def map_loan_intent_array(values: Sequence[Any]) -> NormalizedColumn:
+    return _normalize_array(values, map_loan_intent, categorical=True)
+
+def map_default_on_file_array(values: Sequence[Any]) -> NormalizedColumn:
+    return _normalize_array(values, map_default_on_file, categorical=True)
+
+def normalize_column(feature: str, values: Sequence[Any]) -> NormalizedColumn:
+    """
+    Chuẩn hoá cả một cột giá trị của feature thành float64, kết quả giống hệt
+    validator của CreditApplication trên từng giá trị. Lỗi trả về dạng mask theo dòng.
+    """
+    column = _normalize_array(values, FEATURE_NORMALIZERS[feature], feature in CATEGORICAL_FEATURES)
+    if column.errors:
+        column = column._replace(errors={i: f"{feature}: {msg}" for i, msg in column.errors.items()})
+    return column
 
 def get_threshold() -> float:
     try:
         return float(os.getenv("DECISION_THRESHOLD", "0.5"))
     except Exception:
         return 0.5
+
+def get_batch_max_size() -> int:
+    """Số hồ sơ tối đa mỗi request /predict/batch."""
+    try:
+        return max(1, int(os.getenv("PREDICT_BATCH_MAX_SIZE", "10000")))
+    except Exception:
+        return 10000
+
+def get_cache_size() -> int:
+    """Số kết quả tối đa giữ trong cache theo bin của /predict (0 = tắt cache)."""
+    try:
+        return max(0, int(os.getenv("PREDICT_CACHE_SIZE", "10000")))
+    except Exception:
+        return 10000
+
+def get_whatif_cache_size() -> int:
+    """Số hồ sơ gốc giữ lá từng cây (cho /predict/whatif chấm lại theo phần thay đổi), 0 = tắt."""
+    try:
+        return max(0, int(os.getenv("WHATIF_CACHE_SIZE", "1000")))
+    except Exception:
+        return 1000
+
+def get_executor_config() -> Tuple[str, int]:
+    """
+    Executor cho phần tính toán: SCORING_EXECUTOR = "thread" (mặc định) | "process",
+    SCORING_WORKERS = số worker (mặc định = số CPU).
+    """
+    kind = os.getenv("SCORING_EXECUTOR", "thread").strip().lower()
+    if kind not in ("thread", "process"):
+        kind = "thread"
+    try:
+        workers = int(os.getenv("SCORING_WORKERS", "0"))
+    except Exception:
+        workers = 0
+    return kind, workers if workers > 0 else (os.cpu_count() or 1)
+
+def get_microbatch_config() -> Tuple[bool, int, float]:
+    """
+    Gom các /predict đồng thời: MICROBATCH_ENABLED (mặc định 1), MICROBATCH_MAX_SIZE
+    (số dòng tối đa mỗi đợt, mặc định 32), MICROBATCH_MAX_WAIT_MS (cửa sổ chờ tối đa, mặc định 2).
+    """
+    enabled = os.getenv("MICROBATCH_ENABLED", "1").strip().lower() not in ("0", "false", "no", "off")
+    try:
+        max_size = max(1, int(os.getenv("MICROBATCH_MAX_SIZE", "32")))
+    except Exception:
+        max_size = 32
+    try:
+        max_wait_ms = max(0.0, float(os.getenv("MICROBATCH_MAX_WAIT_MS", "2")))
+    except Exception:
+        max_wait_ms = 2.0
+    return enabled, max_size, max_wait_ms
+
+def get_stream_chunk_size() -> int:
+    """Số hồ sơ chấm điểm mỗi lượt trong /predict/stream (giới hạn bộ nhớ)."""
+    try:
+        return max(1, int(os.getenv("PREDICT_STREAM_CHUNK_SIZE", "500")))
+    except Exception:
+        return 500
+
+def get_explainer_wait() -> float:
+    """
+    Thời gian tối đa (giây) một request cần SHAP chờ explainer warm-up (EXPLAINER_WAIT_MS, mặc định 2000).
+    Hết thời gian thì trả quyết định không kèm SHAP (explain_status="warming_up").
+    """
+    try:
+        return max(0.0, float(os.getenv("EXPLAINER_WAIT_MS", "2000"))) / 1e3
+    except Exception:
+        return 2.0
+
+def get_model_watch_interval() -> float:
+    """Chu kỳ (giây) kiểm tra file model để hot reload (MODEL_WATCH_INTERVAL_S, mặc định 5, 0 = tắt)."""
+    try:
+        return max(0.0, float(os.getenv("MODEL_WATCH_INTERVAL_S", "5")))
+    except Exception:
+        return 5.0
+
+def get_admin_token() -> Optional[str]:
+    """
+    ADMIN_TOKEN: các endpoint /admin/* và /debug/* yêu cầu header X-Admin-Token trùng khớp;
+    không đặt thì các endpoint đó bị tắt (404).
+    """
+    return os.getenv("ADMIN_TOKEN", "").strip() or None
+
+def get_shadow_config() -> Tuple[Optional[str], int, Optional[str]]:
+    """
+    Shadow scoring: CHALLENGER_MODEL_PATH (trống = tắt), SHADOW_QUEUE_SIZE (số lượt chờ tối đa,
+    mặc định 1000), SHADOW_LOG_PATH (file NDJSON; trống = ghi qua logger "app.shadow").
+    """
+    path = os.getenv("CHALLENGER_MODEL_PATH", "").strip() or None
+    try:
+        queue_size = max(1, int(os.getenv("SHADOW_QUEUE_SIZE", "1000")))
+    except Exception:
+        queue_size = 1000
+    log_path = os.getenv("SHADOW_LOG_PATH", "").strip() or None
+    return path, queue_size, log_path
+
+def resolve_model_path() -> str:
+    """MODEL_PATH nếu có, không thì models/lightgbm_model.txt cạnh app/ hoặc trong thư mục hiện tại."""
+    env_path = os.getenv("MODEL_PATH", "").strip()
+    candidates = []
+    if env_path:
+        candidates.append(Path(env_path))
+    candidates.append(Path(__file__).resolve().parent.parent / "models" / "lightgbm_model.txt")
+    candidates.append(Path.cwd() / "models" / "lightgbm_model.txt")
+    for p in candidates:
+        if p.is_file():
+            return str(p)
+    raise FileNotFoundError("Không tìm thấy lightgbm_model.txt. Hãy đặt vào models/ hoặc set MODEL_PATH.")
+
+def get_artifact_dir() -> Optional[str]:
+    """Thư mục chứa artifact nhị phân đã biên dịch (MODEL_ARTIFACT_DIR); mặc định cạnh file model."""
+    return os.getenv("MODEL_ARTIFACT_DIR", "").strip() or None
+
+def is_model_shared() -> bool:
+    """
+    MODEL_SHARED=1 (do app/serve.py đặt): model chỉ được nạp dưới dạng mảng numpy
+    (engine + TreeSHAP) để các worker fork dùng chung; không nạp Booster/shap.
+    """
+    return os.getenv("MODEL_SHARED", "0").strip().lower() in ("1", "true", "yes", "on")
+
+SCORING_ENGINES = ("lightgbm", "numpy", "specialized", "codegen")
+
+def get_scoring_engine() -> str:
+    """
+    Engine tính score: "numpy" (app/engine.py, mặc định, duyệt cây dạng vector, kết quả trùng từng bit
+    với Booster.predict), "lightgbm" (Booster.predict, phải parse model bằng LightGBM mỗi lần nạp) hoặc "specialized"
+    (engine numpy, mỗi tổ hợp feature phân loại một ensemble đã cắt tỉa, cũng trùng từng bit) hoặc
+    "codegen" (scorer Python sinh sẵn cho batch nhỏ, xem app/codegen.py; batch lớn dùng engine numpy).
+    """
+    if is_model_shared():
+        return "numpy"
+    name = os.getenv("SCORING_ENGINE", "numpy").strip().lower()
+    return name if name in SCORING_ENGINES else "numpy"
+
+def get_codegen_max_rows() -> int:
+    """
+    CODEGEN_MAX_ROWS: với SCORING_ENGINE=codegen, batch tới số dòng này đi qua scorer sinh sẵn,
+    lớn hơn thì dùng engine numpy (mặc định 64, điểm hoà vốn đo bằng benchmarks/bench_codegen.py).
+    """
+    try:
+        return max(0, int(os.getenv("CODEGEN_MAX_ROWS", "64")))
+    except Exception:
+        return 64
+
+SHAP_ENGINES = ("numpy", "shap")
+
+def get_shap_engine() -> str:
+    """
+    Engine tính SHAP: "numpy" (app/treeshap.py, mặc định, không cần import shap)
+    hoặc "shap" (shap.TreeExplainer). Đọc một lần khi nạp model.
+    """
+    if is_model_shared():
+        return "numpy"
+    name = os.getenv("SHAP_ENGINE", "numpy").strip().lower()
+    return name if name in SHAP_ENGINES else "numpy"
+
+def is_server_timing_enabled() -> bool:
+    """
+    SERVER_TIMING=1: trả header Server-Timing với thời gian từng bước. Mặc định tắt, vì header lộ
+    thời gian nội bộ (vd. có tính SHAP hay trúng cache) cho mọi client.
+    """
+    return os.getenv("SERVER_TIMING", "0").strip().lower() in ("1", "true", "yes", "on")
+
+def get_slow_request_config() -> Tuple[float, int, bool]:
+    """
+    SLOW_REQUEST_MS: request lâu hơn ngưỡng này (ms) được giữ lại (mặc định 250, 0 = tắt);
+    SLOW_REQUEST_RING: số request chậm giữ tối đa (mặc định 100);
+    SLOW_REQUEST_CAPTURE_INPUTS=1: giữ cả body gốc (thu nhập, khoản vay...) để tái hiện; mặc định tắt,
+    chỉ giữ kích thước body.
+    """
+    try:
+        threshold_ms = max(0.0, float(os.getenv("SLOW_REQUEST_MS", "250")))
+    except Exception:
+        threshold_ms = 250.0
+    try:
+        size = max(1, int(os.getenv("SLOW_REQUEST_RING", "100")))
+    except Exception:
+        size = 100
+    capture_inputs = os.getenv("SLOW_REQUEST_CAPTURE_INPUTS", "0").strip().lower() in ("1", "true", "yes", "on")
+    return threshold_ms, size, capture_inputs
+
+def get_compression_min_bytes() -> int:
+    """
+    RESPONSE_COMPRESS_MIN_BYTES: response batch từ kích thước này (byte) trở lên được nén gzip/zstd
+    theo Accept-Encoding (mặc định 4096, 0 = tắt nén).
+    """
+    try:
+        return max(0, int(os.getenv("RESPONSE_COMPRESS_MIN_BYTES", "4096")))
+    except Exception:
+        return 4096
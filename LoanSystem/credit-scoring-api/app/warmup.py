@@ -0,0 +1,77 @@
+# app/warmup.py
+import threading
+import time
+from typing import Any, Callable, Dict, Generic, Optional, TypeVar
+
+T = TypeVar("T")
+
+class BackgroundLoader(Generic[T]):
+    """
+    Dựng một đối tượng nặng (vd. explainer SHAP) trên thread nền.
+
+    Service trả lời được ngay (liveness), còn phần phụ thuộc đối tượng này chờ
+    tối đa một khoảng thời gian rồi tự xử lý khi chưa sẵn sàng (readiness riêng).
+    start() gọi nhiều lần không sao; get() tự start nếu chưa ai gọi.
+    """
+
+    def __init__(self, name: str, build: Callable[[], T]):
+        self.name = name
+        self._build = build
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.value: Optional[T] = None
+        self.error: Optional[str] = None
+        self.started_at: Optional[float] = None
+        self.elapsed_s: Optional[float] = None
+
+    @classmethod
+    def completed(cls, name: str, value: T) -> "BackgroundLoader[T]":
+        """Loader đã có sẵn giá trị (không cần thread nền)."""
+        loader = cls(name, lambda: value)
+        loader.value, loader.elapsed_s = value, 0.0
+        loader._done.set()
+        return loader
+
+    def start(self) -> None:
+        with self._lock:
+            # is_alive(): process con sau fork (process executor, pre-fork) nhận _thread của cha nhưng thread
+            # không đi theo; đang warm-up dở thì phải dựng lại trong process này
+            if self._done.is_set() or (self._thread is not None and self._thread.is_alive()):
+                return
+            self.started_at = time.perf_counter()
+            self._thread = threading.Thread(target=self._run, name=f"warmup-{self.name}", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        try:
+            self.value = self._build()
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+        finally:
+            self.elapsed_s = time.perf_counter() - self.started_at
+            self._done.set()
+
+    @property
+    def ready(self) -> bool:
+        return self._done.is_set() and self.error is None
+
+    @property
+    def status(self) -> str:
+        """"ready" | "warming_up" | "failed"."""
+        if not self._done.is_set():
+            return "warming_up"
+        return "failed" if self.error is not None else "ready"
+
+    def get(self, timeout: Optional[float] = None) -> Optional[T]:
+        """Chờ tối đa timeout giây (None = chờ đến khi xong); None nếu chưa sẵn sàng hoặc lỗi."""
+        self.start()
+        self._done.wait(timeout)
+        return self.value if self.ready else None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "status": self.status,
+            "elapsed_ms": None if self.elapsed_s is None else self.elapsed_s * 1e3,
+            "error": self.error,
+        }
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+So sánh scorer sinh sẵn (app/codegen.py) với Booster.predict và engine numpy (app/engine.py)
+trên một hồ sơ và các batch nhỏ.
+
+Chạy từ thư mục credit-scoring-api:
+    python benchmarks/bench_codegen.py --sizes 1,2,4,8,16,32,64,128,1024
+"""
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from app.files import file_sha256  # noqa: E402
+from app.codegen import load_scorer  # noqa: E402
+from app.engine import TreeEnsemble  # noqa: E402
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from bench_treeshap import synthetic_matrix  # noqa: E402
+
+
+def per_call(fn, min_seconds: float = 0.2) -> float:
+    """Thời gian tốt nhất cho một lần gọi (giây), lặp đủ lâu để bỏ nhiễu của timer."""
+    calls = 1
+    while True:
+        t = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        elapsed = time.perf_counter() - t
+        if elapsed >= min_seconds:
+            break
+        calls *= 2
+    best = elapsed / calls
+    for _ in range(2):
+        t = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        best = min(best, (time.perf_counter() - t) / calls)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=str(ROOT / "models" / "lightgbm_model.txt"))
+    parser.add_argument("--sizes", default="1,2,4,8,16,32,64,128,1024")
+    args = parser.parse_args()
+
+    from lightgbm import Booster
+
+    booster = Booster(model_file=args.model)
+    ensemble = TreeEnsemble.from_model_file(args.model)
+    sha256 = file_sha256(args.model)
+    with tempfile.TemporaryDirectory() as out_dir:
+        t = time.perf_counter()
+        scorer = load_scorer(args.model, sha256, ensemble, out_dir)
+        print(f"Sinh + import scorer: {(time.perf_counter() - t) * 1e3:.1f} ms")
+
+    print(f"{'batch':>6} {'booster (µs)':>13} {'numpy (µs)':>11} {'codegen (µs)':>13} {'vs booster':>11} {'vs numpy':>9} {'khớp':>5}")
+    for n in (int(s) for s in args.sizes.split(",")):
+        X = synthetic_matrix(ensemble, n)
+        rows = X.tolist()
+        ref = booster.predict(X)
+        ours = np.array(scorer.predict_proba_rows(rows))
+        t_booster = per_call(lambda: booster.predict(X))
+        t_numpy = per_call(lambda: ensemble.predict_proba(X))
+        # Gồm cả chuyển ma trận sang list như đường /predict
+        t_codegen = per_call(lambda: scorer.predict_proba_rows(X.tolist()))
+        print(
+            f"{n:>6} {t_booster * 1e6:>13.1f} {t_numpy * 1e6:>11.1f} {t_codegen * 1e6:>13.1f} "
+            f"{t_booster / t_codegen:>10.1f}x {t_numpy / t_codegen:>8.1f}x {str(np.array_equal(ref, ours)):>5}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+So sánh TreeSHAP numpy (app/treeshap.py) với shap.TreeExplainer trên lightgbm_model.txt.
+
+Chạy từ thư mục credit-scoring-api:
+    python benchmarks/bench_treeshap.py --sizes 1,10,100,1000,10000,100000
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from app.engine import TreeEnsemble  # noqa: E402
+from app.treeshap import TreeShapExplainer  # noqa: E402
+
+
+def synthetic_matrix(ensemble: TreeEnsemble, n: int, seed: int = 0) -> np.ndarray:
+    """Sinh dữ liệu đều trong khoảng feature_infos ([min:max]) của model."""
+    rng = np.random.default_rng(seed)
+    cols = []
+    for info in ensemble.feature_infos:
+        lo, hi = (float(v) for v in info.strip("[]").split(":"))
+        cols.append(rng.uniform(lo, hi, n))
+    return np.column_stack(cols)
+
+
+def timed(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=str(ROOT / "models" / "lightgbm_model.txt"))
+    parser.add_argument("--sizes", default="1,10,100,1000,10000,100000")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    import shap
+    from lightgbm import Booster
+
+    t = time.perf_counter()
+    booster = Booster(model_file=args.model)
+    reference = shap.TreeExplainer(booster)
+    t_ref = time.perf_counter() - t
+    t = time.perf_counter()
+    ensemble = TreeEnsemble.from_model_file(args.model)
+    explainer = TreeShapExplainer(ensemble)
+    t_ours = time.perf_counter() - t
+    print(f"Nạp model: shap {t_ref * 1e3:.1f} ms | numpy {t_ours * 1e3:.1f} ms")
+    print(f"expected_value lệch: {abs(float(np.ravel(reference.expected_value)[-1]) - explainer.expected_value):.2e}")
+
+    print(f"{'batch':>8} {'shap (ms)':>12} {'numpy (ms)':>12} {'speedup':>8} {'max |diff|':>12}")
+    for n in (int(s) for s in args.sizes.split(",")):
+        X = synthetic_matrix(ensemble, n)
+        repeat = args.repeat if n <= 10000 else 1
+        ref = reference.shap_values(X)
+        ref = np.asarray(ref[-1] if isinstance(ref, list) else ref)
+        ours = explainer.shap_values(X)
+        t_ref = timed(lambda: reference.shap_values(X), repeat)
+        t_ours = timed(lambda: explainer.shap_values(X), repeat)
+        print(
+            f"{n:>8} {t_ref * 1e3:>12.2f} {t_ours * 1e3:>12.2f} {t_ref / t_ours:>7.1f}x "
+            f"{np.abs(ref - ours).max():>12.2e}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# tests/conftest.py
+"""
+Fixture dùng chung: model thật (models/lightgbm_model.txt), Booster tham chiếu và mẫu cố định.
+
+Chạy từ thư mục credit-scoring-api:
+    python -m pytest -q
+"""
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from app.engine import TreeEnsemble
+
+MODEL_PATH = Path(__file__).resolve().parent.parent / "models" / "lightgbm_model.txt"
+
+def sample_matrix(ensemble: TreeEnsemble, n: int = 2000, seed: int = 0) -> np.ndarray:
+    """
+    Mẫu cố định: giá trị đều trong feature_infos, một phần đặt đúng bằng ngưỡng tách
+    (kiểm tra x <= ngưỡng) và một phần là NaN.
+    """
+    rng = np.random.default_rng(seed)
+    cols = []
+    for j, info in enumerate(ensemble.feature_infos):
+        lo, hi = (float(v) for v in info.strip("[]").split(":"))
+        col = rng.uniform(lo, hi, n)
+        on_threshold = rng.random(n) < 0.2
+        thresholds = ensemble.feature_thresholds[j]
+        if len(thresholds):
+            col[on_threshold] = rng.choice(thresholds, int(on_threshold.sum()))
+        col[rng.random(n) < 0.05] = np.nan
+        cols.append(col)
+    return np.column_stack(cols)
+
+@pytest.fixture(scope="session")
+def ensemble() -> TreeEnsemble:
+    return TreeEnsemble.from_model_file(MODEL_PATH)
+
+@pytest.fixture(scope="session")
+def booster():
+    lightgbm = pytest.importorskip("lightgbm")
+    return lightgbm.Booster(model_file=str(MODEL_PATH))
+
+@pytest.fixture(scope="session")
+def sample(ensemble) -> np.ndarray:
+    return sample_matrix(ensemble)
+
+@pytest.fixture(scope="session")
+def client():
+    """
+    Một TestClient cho cả phiên: khi lifespan kết thúc, executor chấm điểm của app.main bị tắt
+    và không khởi động lại được trong cùng process.
+    """
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    with TestClient(app) as c:
+        yield c
@@ -0,0 +1,33 @@
+# tests/test_admin.py
+"""Endpoint quản trị đóng khi chưa đặt ADMIN_TOKEN; vòng đệm request chậm không giữ input nếu không bật."""
+import pytest
+
+from app.metrics import RequestTiming
+from app.slowlog import SlowRequestLog
+
+def test_debug_endpoint_disabled_without_admin_token(client, monkeypatch):
+    monkeypatch.delenv("ADMIN_TOKEN", raising=False)
+    assert client.get("/debug/slow-requests").status_code == 404
+
+def test_debug_endpoint_requires_matching_token(client, monkeypatch):
+    monkeypatch.setenv("ADMIN_TOKEN", "secret")
+    assert client.get("/debug/slow-requests").status_code == 403
+    assert client.get("/debug/slow-requests", headers={"X-Admin-Token": "wrong"}).status_code == 403
+    assert client.get("/debug/slow-requests", headers={"X-Admin-Token": "secret"}).status_code == 200
+
+def test_reload_disabled_without_admin_token(client, monkeypatch):
+    monkeypatch.delenv("ADMIN_TOKEN", raising=False)
+    assert client.post("/admin/reload").status_code == 404
+    monkeypatch.setenv("ADMIN_TOKEN", "secret")
+    assert client.post("/admin/reload").status_code == 403
+    response = client.post("/admin/reload", headers={"X-Admin-Token": "secret"})
+    assert response.status_code == 200 and response.json()["reloaded"] is False
+
+@pytest.mark.parametrize("capture_inputs", [False, True])
+def test_slow_log_keeps_inputs_only_on_opt_in(capture_inputs):
+    log = SlowRequestLog(threshold_ms=1e-9, capture_inputs=capture_inputs)
+    raw = b'{"person_income": 45000, "loan_amnt": 12000}'
+    assert log.maybe_record("/predict", RequestTiming(), raw)
+    entry = log.entries()[0]
+    assert entry["input_bytes"] == len(raw)
+    assert entry["inputs"] == (raw if capture_inputs else None)
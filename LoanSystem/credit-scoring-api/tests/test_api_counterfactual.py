@@ -0,0 +1,25 @@
+# tests/test_api_counterfactual.py
+"""/counterfactual chỉ tìm trên các feature người vay thay đổi được."""
+import pytest
+
+APPLICATION = {
+    "person_age": 30,
+    "person_income": 45000,
+    "person_home_ownership": "RENT",
+    "person_emp_length": 2,
+    "loan_intent": "PERSONAL",
+    "loan_amnt": 12000,
+    "cb_person_default_on_file": "N",
+    "cb_person_cred_hist_length": 4,
+}
+
+@pytest.mark.parametrize("feature", ["person_age", "person_home_ownership"])
+@pytest.mark.parametrize("monotone", [True, False])
+def test_rejects_non_actionable_features(client, feature, monotone):
+    body = {"application": APPLICATION, "features": ["loan_amnt", feature], "monotone": monotone}
+    assert client.post("/counterfactual", json=body).status_code == 422
+
+def test_accepts_actionable_features(client):
+    response = client.post("/counterfactual", json={"application": APPLICATION})
+    assert response.status_code == 200, response.text
+    assert {c["feature"] for c in response.json()["changes"]} <= {"loan_amnt", "person_income", "person_emp_length"}
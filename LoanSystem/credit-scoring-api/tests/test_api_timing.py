@@ -0,0 +1,15 @@
+# tests/test_api_timing.py
+"""Header Server-Timing chỉ có khi bật SERVER_TIMING."""
+from tests.test_api_counterfactual import APPLICATION
+
+def test_server_timing_off_by_default(client, monkeypatch):
+    monkeypatch.delenv("SERVER_TIMING", raising=False)
+    response = client.post("/predict", json=APPLICATION)
+    assert response.status_code == 200, response.text
+    assert "server-timing" not in response.headers
+
+def test_server_timing_on_request(client, monkeypatch):
+    monkeypatch.setenv("SERVER_TIMING", "1")
+    response = client.post("/predict", json=APPLICATION)
+    assert response.status_code == 200, response.text
+    assert "total;dur=" in response.headers["server-timing"]
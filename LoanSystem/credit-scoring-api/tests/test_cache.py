@@ -0,0 +1,22 @@
+# tests/test_cache.py
+"""LRUCache chỉ đếm hit khi phần tử dùng được cho request."""
+from app.cache import LRUCache
+
+def test_unusable_entry_counts_as_miss():
+    cache = LRUCache(4)
+    cache.put("row", (0.3, None, None))  # Từ request explain=none: không có SHAP
+    needs_shap = lambda cached: cached[1] is not None
+    assert cache.get("row", needs_shap) is None
+    assert (cache.hits, cache.misses) == (0, 1)
+    assert cache.get("row") == (0.3, None, None)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_eviction_and_disabled_cache():
+    cache = LRUCache(1)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") is None and cache.get("b") == 2
+    assert cache.evictions == 1
+    disabled = LRUCache(0)
+    disabled.put("a", 1)
+    assert disabled.get("a") is None
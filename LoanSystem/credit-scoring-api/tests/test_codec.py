@@ -0,0 +1,35 @@
+# tests/test_codec.py
+"""Codec dùng chung với credit-nlg-service: hai bản phải giống hệt, hành vi negotiate / encode / decode."""
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from app import codec
+
+NLG_CODEC = Path(__file__).resolve().parents[2] / "credit-nlg-service" / "app" / "codec.py"
+
+def test_nlg_copy_is_identical():
+    if not NLG_CODEC.is_file():
+        pytest.skip("không có credit-nlg-service trong cây thư mục")
+    assert NLG_CODEC.read_bytes() == Path(codec.__file__).read_bytes()
+
+def test_json_roundtrip_with_numpy():
+    body = codec.encode({"score": np.float64(0.25), "shap": np.array([1.0, -2.0])}, codec.JSON)
+    assert codec.decode(body, "application/json") == {"score": 0.25, "shap": [1.0, -2.0]}
+
+def test_negotiate_prefers_json_unless_msgpack_ranks_higher():
+    assert codec.negotiate(None) == codec.JSON
+    assert codec.negotiate("application/json, application/x-msgpack;q=0.5") == codec.JSON
+    if codec._import_msgpack() is not None:
+        assert codec.negotiate("application/x-msgpack") == codec.MSGPACK
+
+def test_invalid_body_raises_value_error():
+    with pytest.raises(ValueError):
+        codec.decode(b"{not json", "application/json")
+
+def test_compress_only_above_min_bytes():
+    body = b"x" * 100
+    assert codec.compress(body, "gzip", 1000) == (body, None)
+    compressed, encoding = codec.compress(body, "gzip", 10)
+    assert encoding == "gzip" and len(compressed) < len(body)
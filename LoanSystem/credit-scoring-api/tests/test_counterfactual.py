@@ -0,0 +1,64 @@
+# tests/test_counterfactual.py
+"""counterfactual.search phải cho nghiệm rẻ nhất, so với vét cạn trên candidate_values (một và hai feature)."""
+import itertools
+
+import numpy as np
+import pytest
+
+from app import counterfactual
+
+THRESHOLD = 0.5
+
+def brute_force(ensemble, booster, x, monotone):
+    """Chi phí nhỏ nhất trên mọi thay đổi một hoặc hai feature, chấm bằng Booster.predict."""
+    cols = [ensemble.feature_names.index(f) for f in counterfactual.ACTIONABLE_FEATURES]
+    options = []
+    for f, j in zip(counterfactual.ACTIONABLE_FEATURES, cols):
+        direction = counterfactual.MONOTONE_DIRECTIONS[f] if monotone else 0
+        v = counterfactual.candidate_values(ensemble.feature_thresholds[j], x[j], direction)
+        options.append((j, v, counterfactual.relative_cost(v - x[j], x[j])))
+    best = np.inf
+    for size in (1, 2):
+        for subset in itertools.combinations(options, size):
+            grids = np.meshgrid(*[v for _, v, _ in subset], indexing="ij")
+            X = np.repeat(x[None, :], grids[0].size, axis=0)
+            for (j, _, _), g in zip(subset, grids):
+                X[:, j] = g.ravel()
+            cost = np.sum(np.meshgrid(*[c for _, _, c in subset], indexing="ij"), axis=0).ravel()
+            accepted = booster.predict(X) < THRESHOLD
+            if accepted.any():
+                best = min(best, float(cost[accepted].min()))
+    return best
+
+def rejected_rows(ensemble, sample, monotone, sizes=(1, 2)):
+    """
+    Hồ sơ bị từ chối đầu tiên trong mẫu cố định có nghiệm đổi đúng k feature, với mỗi k trong sizes
+    (nghiệm hai feature kiểm tra bước tổ hợp, không chỉ bước một feature).
+    """
+    X = np.nan_to_num(sample)
+    rows = {}
+    for x in X[ensemble.predict_proba(X) >= THRESHOLD]:
+        leaves = ensemble.predict_leaves(x[None, :])[0]
+        result = counterfactual.search(ensemble, x, leaves, THRESHOLD, monotone=monotone)
+        if result["found"] and len(result["changes"]) in sizes:
+            rows.setdefault(len(result["changes"]), (x, result))
+        if len(rows) == len(sizes):
+            break
+    assert len(rows) == len(sizes)
+    return list(rows.values())
+
+@pytest.mark.parametrize("monotone", [True, False])
+def test_search_matches_brute_force(ensemble, booster, sample, monotone):
+    for x, result in rejected_rows(ensemble, sample, monotone):
+        assert result["exhaustive"]
+        assert result["cost"] == pytest.approx(brute_force(ensemble, booster, x, monotone), abs=1e-12)
+        changed = x.copy()
+        for f, v in result["changes"].items():
+            changed[ensemble.feature_names.index(f)] = v
+        assert result["score"] == booster.predict(changed[None, :])[0]
+        assert result["score"] < THRESHOLD
+
+def test_monotone_search_moves_only_in_actionable_directions(ensemble, sample):
+    for x, result in rejected_rows(ensemble, sample, monotone=True):
+        for f, v in result["changes"].items():
+            assert (v - x[ensemble.feature_names.index(f)]) * counterfactual.MONOTONE_DIRECTIONS[f] > 0
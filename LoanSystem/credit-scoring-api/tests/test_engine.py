@@ -0,0 +1,45 @@
+# tests/test_engine.py
+"""TreeEnsemble phải trùng từng bit với Booster.predict (kể cả NaN và giá trị đúng bằng ngưỡng)."""
+import numpy as np
+
+def test_predict_proba_matches_booster(ensemble, booster, sample):
+    assert np.array_equal(ensemble.predict_proba(sample), booster.predict(sample))
+
+def test_predict_margin_matches_booster_raw_score(ensemble, booster, sample):
+    assert np.array_equal(ensemble.predict_margin(sample), booster.predict(sample, raw_score=True))
+
+def test_predict_leaves_matches_booster(ensemble, booster, sample):
+    leaves = ensemble.predict_leaves(sample) - ensemble.tree_leaf_start
+    assert np.array_equal(leaves, booster.predict(sample, pred_leaf=True))
+
+def test_predict_decision_matches_full_score(ensemble, booster, sample):
+    reference = booster.predict(sample)
+    for threshold in (0.1, 0.5, 0.9):
+        approved, evaluated, proba = ensemble.predict_decision(sample, threshold)
+        assert np.array_equal(approved, reference < threshold)
+        assert np.all((evaluated >= 1) & (evaluated <= ensemble.num_trees))
+        # Dòng duyệt hết cây có score đầy đủ, trùng từng bit; dòng dừng sớm là NaN
+        full = evaluated == ensemble.num_trees
+        assert np.array_equal(proba[full], reference[full])
+        assert np.isnan(proba[~full]).all()
+
+def test_rescore_matches_booster(ensemble, booster, sample):
+    base = sample[0]
+    base_leaves = ensemble.predict_leaves(base[None, :])[0]
+    # Biến thể: đổi một, hai feature, hoặc thay cả hàng bằng hồ sơ khác (mọi feature đổi)
+    variants = np.repeat(base[None, :], 300, axis=0)
+    variants[:100, 5] = sample[1:101, 5]
+    variants[100:200, [1, 3]] = sample[101:201][:, [1, 3]]
+    variants[200:] = sample[201:301]
+    proba, leaves, evaluated = ensemble.rescore(variants, base, base_leaves)
+    assert np.array_equal(proba, booster.predict(variants))
+    assert np.array_equal(leaves, ensemble.predict_leaves(variants))
+    # Đổi loan_amnt chỉ có thể chạm các cây có tách theo loan_amnt
+    assert np.all(evaluated[:100] <= len(ensemble.feature_trees[5]))
+
+def test_rescore_unchanged_row_evaluates_no_tree(ensemble, sample):
+    base = sample[3]
+    base_leaves = ensemble.predict_leaves(base[None, :])[0]
+    proba, _, evaluated = ensemble.rescore(base[None, :], base, base_leaves)
+    assert evaluated[0] == 0
+    assert proba[0] == ensemble.predict_proba(base[None, :])[0]
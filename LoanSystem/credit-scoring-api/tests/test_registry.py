@@ -0,0 +1,42 @@
+# tests/test_registry.py
+"""ModelRegistry.ensure chỉ trả đúng phiên bản được yêu cầu và không hoán đổi phiên bản hiện tại."""
+import shutil
+
+import pytest
+
+from app.registry import LoadedModel, ModelRegistry
+from tests.conftest import MODEL_PATH
+
+@pytest.fixture
+def registry(monkeypatch, tmp_path):
+    monkeypatch.setenv("SCORING_ENGINE", "numpy")
+    monkeypatch.setenv("MODEL_ARTIFACT_DIR", str(tmp_path / "artifacts"))
+    path = tmp_path / "model.txt"
+    shutil.copyfile(MODEL_PATH, path)
+    previous = ModelRegistry.instance
+    yield ModelRegistry(str(path))
+    ModelRegistry.instance = previous
+
+def test_ensure_returns_current_version(registry):
+    current = registry.current
+    assert registry.ensure(registry.path, current.sha256) is current
+
+def test_ensure_rejects_changed_file(registry):
+    current = registry.current
+    with open(registry.path, "a", encoding="utf-8") as f:
+        f.write("\n")
+    with pytest.raises(RuntimeError, match="không phải"):
+        registry.ensure(registry.path, "0" * 64)
+    # Không reload: phiên bản hiện tại giữ nguyên dù file đã đổi
+    assert registry.current is current
+    assert registry.reloads == 0
+
+def test_ensure_loads_requested_version_without_swapping(registry):
+    current = registry.current
+    with open(registry.path, "a", encoding="utf-8") as f:
+        f.write("\n")
+    changed = LoadedModel.load(registry.path)
+    assert changed.sha256 != current.sha256
+    model = registry.ensure(registry.path, changed.sha256)
+    assert model.sha256 == changed.sha256
+    assert registry.current is current
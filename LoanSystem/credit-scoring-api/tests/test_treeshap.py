@@ -0,0 +1,24 @@
+# tests/test_treeshap.py
+"""TreeShapExplainer phải khớp pred_contrib=True của LightGBM (TreeSHAP path-dependent)."""
+import numpy as np
+import pytest
+
+from app.treeshap import TreeShapExplainer
+
+# Sai số tích luỹ do thứ tự cộng khác C++ (thực đo ~2.5e-14)
+ATOL = 1e-10
+
+@pytest.fixture(scope="module")
+def explainer(ensemble):
+    return TreeShapExplainer(ensemble)
+
+def test_shap_values_match_pred_contrib(explainer, booster, sample):
+    rows = sample[:500]
+    contrib = booster.predict(rows, pred_contrib=True)
+    np.testing.assert_allclose(explainer.shap_values(rows), contrib[:, :-1], rtol=0, atol=ATOL)
+    np.testing.assert_allclose(explainer.expected_value, contrib[:, -1], rtol=0, atol=ATOL)
+
+def test_shap_sums_to_margin(explainer, ensemble, sample):
+    rows = sample[:500]
+    total = explainer.shap_values(rows).sum(axis=1) + explainer.expected_value
+    np.testing.assert_allclose(total, ensemble.predict_margin(rows), rtol=0, atol=ATOL)
@@ -0,0 +1,36 @@
+# tests/test_utils.py
+"""parse_number_array phải cho đúng kết quả và thông báo lỗi của parse_number_like trên từng giá trị."""
+import numpy as np
+import pytest
+
+from app.utils import parse_number_array, parse_number_like
+
+def scalar(values):
+    out, errors = [], {}
+    for i, v in enumerate(values):
+        try:
+            out.append(parse_number_like(v))
+        except Exception as e:
+            out.append(np.nan)
+            errors[i] = str(e)
+    return np.array(out), errors
+
+ODD = ["abc", "", "nan", "-0", "1_000", "1e400", " 12.5 ", "12..3", "٤٥", "a\x1fb"]
+
+@pytest.mark.parametrize(
+    "values",
+    [
+        [f"{v:,}" for v in range(0, 3_000_000, 997)],             # toàn chuỗi khác nhau
+        [f"{v * 1000:,}" for v in range(50)] * 40,                # lặp nhiều
+        [f"{v:,}" for v in range(600)] + ODD * 3,                 # lẫn chuỗi lỗi, khối lỗi đọc lại từng chuỗi
+        ["5\x00", "45,000"],                                      # "\x00": đường từng giá trị
+        ["45,000", 7000, 2.5, True, ["5"], []],                   # lẫn kiểu
+    ],
+)
+def test_parse_number_array_matches_scalar(values):
+    column = parse_number_array(values)
+    expected, errors = scalar(values)
+    np.testing.assert_array_equal(column.values, expected)
+    assert np.array_equal(np.signbit(column.values), np.signbit(expected))
+    assert column.errors == errors
+    assert set(np.flatnonzero(column.error_mask)) == set(errors)
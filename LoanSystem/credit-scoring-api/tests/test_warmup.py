@@ -0,0 +1,23 @@
+# tests/test_warmup.py
+"""BackgroundLoader phải dựng lại khi thread warm-up không còn chạy (vd. process con sau fork)."""
+import threading
+
+from app.warmup import BackgroundLoader
+
+def test_start_restarts_when_warmup_thread_is_gone():
+    loader = BackgroundLoader("test", lambda: 42)
+    # Như sau fork giữa lúc warm-up: còn tham chiếu _thread nhưng thread đã chết, _done chưa đặt
+    dead = threading.Thread(target=lambda: None)
+    dead.start()
+    dead.join()
+    loader._thread = dead
+    assert loader.status == "warming_up"
+    assert loader.get(timeout=5) == 42
+    assert loader.status == "ready"
+
+def test_start_does_not_rebuild_finished_loader():
+    calls = []
+    loader = BackgroundLoader("test", lambda: calls.append(1) or len(calls))
+    assert loader.get(timeout=5) == 1
+    loader.start()
+    assert loader.get(timeout=5) == 1 and len(calls) == 1
@@ -3,29 +3,56 @@ Model Loader Module
 Tải và quản lý LORA Adapter và LightGBM models
 """
 
+import importlib.util
 import json
 import os
+import threading
 import lightgbm as lgb
 import numpy as np
 import pandas as pd
-from typing import Dict, Any, Optional, Tuple
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
 import warnings
 warnings.filterwarnings('ignore')
 
-try:
-    import shap
-    SHAP_AVAILABLE = True
-except ImportError:
-    SHAP_AVAILABLE = False
-    print("Warning: SHAP not available. Install with: pip install shap")
+# Features a borrower can act on, searched by find_counterfactual
+ACTIONABLE_FEATURES = ('loan_amnt', 'person_income', 'person_emp_length')
+# Counterfactual search shared with the scoring API (numpy only, loaded by path: app_python/app.py shadows the `app` package)
+COUNTERFACTUAL_MODULE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'LoanSystem', 'credit-scoring-api', 'app', 'counterfactual.py'
+)
+_counterfactual_module = None
+
+def _import_shap():
+    """Import shap only when an explainer is actually needed (it pulls in a large dependency tree)"""
+    try:
+        import shap
+        return shap
+    except ImportError:
+        print("Warning: SHAP not available. Install with: pip install shap")
+        return None
+
+def _load_counterfactual_module():
+    """Load the API's counterfactual.py once; None if the file is missing"""
+    global _counterfactual_module
+    if _counterfactual_module is None and os.path.exists(COUNTERFACTUAL_MODULE):
+        spec = importlib.util.spec_from_file_location('credit_counterfactual', COUNTERFACTUAL_MODULE)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _counterfactual_module = module
+    elif _counterfactual_module is None:
+        print(f"Warning: counterfactual search not found at {COUNTERFACTUAL_MODULE}")
+    return _counterfactual_module
 
 class ModelLoader:
     def __init__(self, model_dir: str = "."):
         self.model_dir = model_dir
         self.adapter_config = None
         self.lightgbm_model = None
-        self.shap_explainer = None
+        self._shap_explainer = None
+        self._shap_thread = None
+        self._shap_ready = threading.Event()
         self.adapter_info = {}
+        self._split_thresholds = None
         self.lgb_info = {}
         self.feature_names = ['person_age', 'person_income', 'person_home_ownership', 'person_emp_length', 
                              'loan_intent', 'loan_amnt', 'cb_person_default_on_file', 'cb_person_cred_hist_length']
@@ -72,23 +99,54 @@ class ModelLoader:
                 "Number of Classes": self.lightgbm_model.num_model_per_iteration(),
             }
             
-            # Create SHAP explainer if available
-            if SHAP_AVAILABLE:
-                try:
-                    self.shap_explainer = shap.TreeExplainer(self.lightgbm_model)
-                    print("✅ SHAP TreeExplainer created successfully")
-                except Exception as e:
-                    print(f"⚠️ Warning: Could not create SHAP explainer: {e}")
-                    self.shap_explainer = None
-            else:
-                print("⚠️ SHAP not available. Install with: pip install shap")
-                self.shap_explainer = None
+            # Build the SHAP explainer in the background so predictions are available immediately
+            self.start_shap_warmup()
             
             return self.lightgbm_model
         except Exception as e:
             print(f"Error loading LightGBM model: {e}")
             return None
     
+    def start_shap_warmup(self) -> None:
+        """Import shap and create the TreeExplainer on a background thread"""
+        if self._shap_thread is not None:
+            return
+        self._shap_ready.clear()
+        self._shap_thread = threading.Thread(target=self._build_shap_explainer, name="shap-warmup", daemon=True)
+        self._shap_thread.start()
+
+    def _build_shap_explainer(self) -> None:
+        try:
+            shap = _import_shap()
+            if shap is None:
+                self._shap_explainer = None
+                return
+            try:
+                self._shap_explainer = shap.TreeExplainer(self.lightgbm_model)
+                print("✅ SHAP TreeExplainer created successfully")
+            except Exception as e:
+                print(f"⚠️ Warning: Could not create SHAP explainer: {e}")
+                self._shap_explainer = None
+        finally:
+            self._shap_ready.set()
+
+    def shap_ready(self) -> bool:
+        """True once the background warm-up has finished (explainer may still be None if SHAP is unavailable)"""
+        return self._shap_ready.is_set()
+
+    @property
+    def shap_explainer(self):
+        """SHAP TreeExplainer; waits for the background warm-up started by load_lightgbm_model"""
+        if self._shap_thread is None:
+            return None
+        self._shap_ready.wait()
+        return self._shap_explainer
+
+    @shap_explainer.setter
+    def shap_explainer(self, value) -> None:
+        self._shap_explainer = value
+        self._shap_ready.set()
+
     def get_adapter_summary(self) -> Dict[str, Any]:
         """Get LORA adapter summary information"""
         if not self.adapter_config:
@@ -110,6 +168,51 @@ class ModelLoader:
         
         return self.lightgbm_model.predict(data)
     
+    def get_split_thresholds(self) -> Dict[str, np.ndarray]:
+        """Sorted distinct split thresholds per feature (the model only sees a feature through these)"""
+        if not self.lightgbm_model:
+            raise ValueError("LightGBM model not loaded")
+        if self._split_thresholds is None:
+            nodes = self.lightgbm_model.trees_to_dataframe()
+            nodes = nodes[nodes['split_feature'].notna()]
+            self._split_thresholds = {
+                f: np.unique(nodes.loc[nodes['split_feature'] == f, 'threshold'].to_numpy(dtype=float))
+                for f in self.feature_names
+            }
+        return self._split_thresholds
+
+    def find_counterfactual(
+        self,
+        sample_data: np.ndarray,
+        is_accepted: Callable[[np.ndarray], np.ndarray],
+        features: Sequence[str] = ACTIONABLE_FEATURES,
+        max_features: int = 2,
+        max_candidates: int = 50000,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Smallest change (sum of relative changes) to `features` after which is_accepted(prediction) holds,
+        moving only in actionable directions (lower loan, higher income, longer employment).
+        Uses the same search as the scoring API (credit-scoring-api/app/counterfactual.py `find`), scored
+        with Booster.predict; returns None when that file is not available next to this demo.
+        """
+        if not self.lightgbm_model:
+            raise ValueError("LightGBM model not loaded")
+        search = _load_counterfactual_module()
+        if search is None:
+            return None
+        thresholds = self.get_split_thresholds()
+        return search.find(
+            self.predict_lightgbm,
+            is_accepted,
+            sample_data,
+            self.feature_names,
+            [thresholds[f] for f in self.feature_names],
+            features=features,
+            max_features=max_features,
+            monotone=True,
+            max_candidates=max_candidates,
+        )
+
     def calculate_shap_for_sample(self, sample_data: np.ndarray) -> Dict[str, Any]:
         """
         Calculate SHAP values for a single sample using TreeExplainer
@@ -126,22 +126,50 @@ def get_feature_explanation(feature_name, impact, age, income, home_ownership, e
     explanation_type = 'positive' if impact > 0 else 'negative'
     return explanations.get(feature_name, {}).get(explanation_type, "Không có thông tin chi tiết.")
 
-def generate_advice(income, loan_amount, age, emp_length, credit_hist_length, home_ownership, default_history, default_probability):
-    """Generate personalized advice"""
+# Nhãn tiếng Việt cho các feature có thể thay đổi (lời khuyên từ find_counterfactual)
+ADVICE_LABELS = {
+    'loan_amnt': ('số tiền vay', '$'),
+    'person_income': ('thu nhập', '$'),
+    'person_emp_length': ('số năm làm việc', ''),
+}
+
+def format_counterfactual(counterfactual, current_values):
+    """Các dòng lời khuyên từ kết quả loader.find_counterfactual (giá trị chính xác theo mô hình)"""
+    lines = []
+    for feature, proposed in counterfactual['changes'].items():
+        label, unit = ADVICE_LABELS.get(feature, (feature, ''))
+        current = current_values[feature]
+        verb, word = ("Tăng", "lên") if proposed > current else ("Giảm", "xuống")
+        pct = f" ({(proposed - current) / current * 100:+.1f}%)" if current else ""
+        lines.append(f"• {verb} {label} từ {unit}{current:,.0f} {word} {unit}{proposed:,.0f}{pct}")
+    return lines
+
+def generate_advice(income, loan_amount, age, emp_length, credit_hist_length, home_ownership, default_history, default_probability,
+                    counterfactual=None):
+    """
+    Generate personalized advice.
+    counterfactual: kết quả loader.find_counterfactual cho hồ sơ chưa được chấp thuận (thay đổi nhỏ nhất theo
+    hướng làm được); khi có nghiệm, nó thay cho các con số ước đoán về khoản vay / thu nhập.
+    """
     
     advice_parts = []
+    current_values = {'loan_amnt': loan_amount, 'person_income': income, 'person_emp_length': emp_length}
+    found = bool(counterfactual and counterfactual['found'])
     
     if default_probability > 0.6:  # High risk
         advice_parts.append("Để cải thiện hồ sơ vay, anh/chị nên xem xét:")
         
-        debt_to_income = loan_amount / income
-        if debt_to_income > 0.3:
-            reduction_percent = ((debt_to_income - 0.25) / debt_to_income) * 100
-            advice_parts.append(f"• Giảm số tiền vay xuống khoảng {reduction_percent:.0f}% so với hiện tại (còn khoảng ${loan_amount * (1 - reduction_percent/100):,.0f})")
-        
-        if income < 50000:
-            target_income = income * 1.3
-            advice_parts.append(f"• Tăng thu nhập lên ít nhất ${target_income:,.0f} (tăng {((target_income - income)/income)*100:.0f}%)")
+        if found:
+            advice_parts.append("Thay đổi nhỏ nhất để mô hình chấp thuận (tính chính xác trên mô hình):")
+            advice_parts.extend(format_counterfactual(counterfactual, current_values))
+            advice_parts.append(f"• Tỷ lệ được duyệt sau thay đổi: {counterfactual['score']:.1%}")
+        else:
+            if loan_amount / income > 0.3:
+                advice_parts.append("• Giảm số tiền vay để hạ tỷ lệ khoản vay/thu nhập")
+            if income < 50000:
+                advice_parts.append("• Tăng thu nhập hoặc có thêm nguồn thu nhập phụ")
+            if counterfactual is not None:
+                advice_parts.append("• Riêng việc giảm số tiền vay, tăng thu nhập hoặc số năm làm việc chưa đủ để mô hình chấp thuận")
         
         if emp_length < 3:
             advice_parts.append("• Tích lũy thêm kinh nghiệm làm việc (ít nhất 3 năm)")
@@ -152,11 +180,15 @@ def generate_advice(income, loan_amount, age, emp_length, credit_hist_length, ho
     elif default_probability > 0.3:  # Medium risk
         advice_parts.append("Hồ sơ của anh/chị có tiềm năng, cần cải thiện một vài điểm:")
         
-        if loan_amount / income > 0.25:
-            advice_parts.append(f"• Giảm nhẹ số tiền vay xuống khoảng ${loan_amount * 0.8:,.0f}")
-        
-        if income < 60000:
-            advice_parts.append("• Tăng thu nhập hoặc có thêm nguồn thu nhập phụ")
+        if found:
+            advice_parts.append("Thay đổi nhỏ nhất để mô hình chấp thuận (tính chính xác trên mô hình):")
+            advice_parts.extend(format_counterfactual(counterfactual, current_values))
+            advice_parts.append(f"• Tỷ lệ được duyệt sau thay đổi: {counterfactual['score']:.1%}")
+        else:
+            if loan_amount / income > 0.25:
+                advice_parts.append("• Giảm nhẹ số tiền vay")
+            if income < 60000:
+                advice_parts.append("• Tăng thu nhập hoặc có thêm nguồn thu nhập phụ")
             
         advice_parts.append("• Tiếp tục duy trì lịch sử tín dụng tốt")
         
@@ -622,8 +654,13 @@ def render_prediction_page(loader):
                 # Advice section
                 st.markdown("---")
                 st.markdown("### 💡 LỜI KHUYÊN CẢI THIỆN HỒ SƠ")
+                counterfactual = None
+                if default_probability > 0.4:
+                    # Thay đổi nhỏ nhất để "CHẤP THUẬN" (xác suất vỡ nợ <= 40%), chỉ thử các ngưỡng tách của mô hình
+                    counterfactual = loader.find_counterfactual(input_data[0], lambda p: 1 - p <= 0.4)
                 advice = generate_advice(person_income, loan_amount, person_age, emp_length, 
-                                       credit_hist_length, home_ownership, default_on_file, default_probability)
+                                       credit_hist_length, home_ownership, default_on_file, default_probability,
+                                       counterfactual)
                 
                 # Display advice with proper line breaks
                 st.markdown(f"""